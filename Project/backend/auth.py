@@ -1,15 +1,23 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional, Tuple
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import func, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+import hashlib
 import os
+import secrets
+import uuid
 from dotenv import load_dotenv
 
 from database import get_db
-from models import Customer, Business
+from hashing import HasherBusy, needs_rehash, password_hasher, pwd_context
+from principals import principal_cache
+from revocation import revocation_list
+from models import Customer, Business, RefreshToken
 from schemas import TokenData
 
 load_dotenv()
@@ -17,24 +25,39 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-this-in-production")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
-# Configure bcrypt with truncate_error=False to handle the bcrypt 72-byte limit
-pwd_context = CryptContext(
-    schemes=["bcrypt"],
-    deprecated="auto",
-    bcrypt__default_rounds=12,
-    bcrypt__truncate_error=False
-)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+def _busy(exc: HasherBusy) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-ins in progress, please retry shortly",
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+async def verify_password(plain_password, hashed_password):
+    try:
+        return await password_hasher.verify_async(plain_password, hashed_password)
+    except HasherBusy as exc:
+        raise _busy(exc)
 
-def get_password_hash(password):
-    # Truncate password to 72 bytes if needed (bcrypt limitation)
-    if len(password.encode('utf-8')) > 72:
-        password = password[:72]
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    try:
+        return await password_hasher.hash_async(password)
+    except HasherBusy as exc:
+        raise _busy(exc)
+
+async def rehash_if_needed(db: AsyncSession, user, password: str):
+    """Re-hash a just-verified password whose hash uses outdated cost settings"""
+    if not needs_rehash(user.hashed_password):
+        return
+    try:
+        user.hashed_password = await password_hasher.hash_async(password)
+    except HasherBusy:
+        # The old hash still works; upgrade it on a later login
+        return
+    await db.commit()
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -46,23 +69,137 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def authenticate_customer(db: Session, email: str, password: str):
-    customer = db.query(Customer).filter(Customer.email == email).first()
+def hash_refresh_token(token: str) -> str:
+    # Refresh tokens are 256 random bits, so a fast hash is enough at rest
+    return hashlib.sha256(token.encode()).hexdigest()
+
+async def create_refresh_token(
+    db: AsyncSession,
+    user_type: str,
+    user_id: int,
+    email: str,
+    family: Optional[str] = None
+) -> Tuple[str, str]:
+    """
+    Store a new refresh token and return (token, family).
+
+    A login starts a new family; each rotation adds a token to the same one.
+    The family id doubles as the session id (`sid`) of its access tokens.
+    The token is bound to the user's email as well as their id, since a
+    deleted user's id can be given to the next account.
+    """
+    token = secrets.token_urlsafe(32)
+    family = family or uuid.uuid4().hex
+    db.add(RefreshToken(
+        token_hash=hash_refresh_token(token),
+        family=family,
+        user_type=user_type,
+        user_id=user_id,
+        email=email,
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    ))
+    await db.commit()
+    return token, family
+
+async def rotate_refresh_token(db: AsyncSession, token: str) -> Optional[RefreshToken]:
+    """
+    Spend a refresh token and return its row, or None if it cannot be used.
+
+    Each token works once. Presenting a token that was already spent means it
+    was copied, so the whole session is revoked.
+    """
+    now = datetime.utcnow()
+    row = await db.scalar(select(RefreshToken).where(RefreshToken.token_hash == hash_refresh_token(token)))
+    if row is None or row.revoked_at is not None or row.expires_at <= now:
+        return None
+    # Conditional update so two concurrent refreshes cannot both spend it
+    spent = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == row.id, RefreshToken.used_at.is_(None))
+        .values(used_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    if not spent.rowcount:
+        await revoke_session(db, row.family)
+        return None
+    await db.refresh(row)
+    return row
+
+async def revoke_session(db: AsyncSession, family: str):
+    """Revoke a session's refresh tokens and reject its unexpired access tokens"""
+    now = datetime.utcnow()
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.family == family, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    reject_sessions([family], now)
+
+async def revoke_user_sessions(db: AsyncSession, user_type: str, user_id: int) -> List[str]:
+    """
+    Revoke every session of a user without committing, so it happens in the
+    caller's transaction (deleting the account). Returns the families; pass
+    them to `reject_sessions` once committed.
+    """
+    families = (await db.scalars(
+        select(RefreshToken.family).where(
+            RefreshToken.user_type == user_type,
+            RefreshToken.user_id == user_id,
+            RefreshToken.revoked_at.is_(None)
+        ).distinct()
+    )).all()
+    if families:
+        await db.execute(
+            update(RefreshToken)
+            .where(RefreshToken.family.in_(families), RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+    return list(families)
+
+def reject_sessions(families: List[str], revoked_at: Optional[datetime] = None):
+    """Reject the unexpired access tokens of revoked sessions, in every worker"""
+    until = (revoked_at or datetime.utcnow()) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    for family in families:
+        revocation_list.revoke(family, until)
+
+def load_revocations(engine: Engine):
+    """Reload sessions whose access tokens may still be live, and purge expired refresh tokens"""
+    now = datetime.utcnow()
+    db = Session(bind=engine)
+    try:
+        recent = db.query(RefreshToken.family, func.max(RefreshToken.revoked_at)).filter(
+            RefreshToken.revoked_at > now - timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        ).group_by(RefreshToken.family)
+        for family, revoked_at in recent:
+            revocation_list.add(family, revoked_at + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+        db.query(RefreshToken).filter(RefreshToken.expires_at <= now).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+async def authenticate_customer(db: AsyncSession, email: str, password: str):
+    customer = await db.scalar(select(Customer).where(Customer.email == email))
     if not customer:
         return False
-    if not verify_password(password, customer.hashed_password):
+    if not await verify_password(password, customer.hashed_password):
         return False
+    await rehash_if_needed(db, customer, password)
     return customer
 
-def authenticate_business(db: Session, email: str, password: str):
-    business = db.query(Business).filter(Business.email == email).first()
+async def authenticate_business(db: AsyncSession, email: str, password: str):
+    business = await db.scalar(select(Business).where(Business.email == email))
     if not business:
         return False
-    if not verify_password(password, business.hashed_password):
+    if not await verify_password(password, business.hashed_password):
         return False
+    await rehash_if_needed(db, business, password)
     return business
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -74,21 +211,36 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         user_type: str = payload.get("type")
         if email is None or user_type is None:
             raise credentials_exception
+        session_id = payload.get("sid")
+        if session_id is not None and revocation_list.is_revoked(session_id):
+            raise credentials_exception
         token_data = TokenData(email=email, user_type=user_type)
     except JWTError:
         raise credentials_exception
     
     if token_data.user_type == "customer":
-        user = db.query(Customer).filter(Customer.email == token_data.email).first()
+        model = Customer
     elif token_data.user_type == "business":
-        user = db.query(Business).filter(Business.email == token_data.email).first()
+        model = Business
     else:
         raise credentials_exception
     
-    if user is None:
-        raise credentials_exception
+    cached = principal_cache.get(token_data.user_type, token_data.email)
+    if cached is not None:
+        # Attach the cached row to this session without a query
+        user = await db.merge(cached, load=False)
+        # get_db answers 401 if the row turns out to be gone when flushed
+        db.info["cached_principal"] = (model, user.id, token_data.user_type, token_data.email)
+    else:
+        generation = principal_cache.generation
+        user = await db.scalar(select(model).where(model.email == token_data.email))
+        if user is None:
+            raise credentials_exception
+        principal_cache.put(token_data.user_type, token_data.email, user, generation)
     
     user.user_type = token_data.user_type
+    # Whose writes this session commits (read-your-writes in replicas.py)
+    db.info["principal"] = (token_data.user_type, token_data.email)
     return user
 
 async def get_current_customer(current_user = Depends(get_current_user)):
@@ -0,0 +1,356 @@
+import threading
+from bisect import bisect_right
+from collections import defaultdict, OrderedDict
+from datetime import date, time, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import models
+from cache import availability_tag, response_cache
+from invalidation import InvalidationBus, bus
+
+# Appointments in these states no longer hold their time on the calendar
+NON_BLOCKING_STATUSES = ('cancelled', 'rejected')
+
+# Upper bound on the number of days a single availability request may cover
+MAX_RANGE_DAYS = 92
+
+# Resolution of the per-day calendar bitmaps (288 ticks per day)
+TICK_MINUTES = 5
+TICKS_PER_DAY = 24 * 60 // TICK_MINUTES
+
+
+def to_minutes(value) -> int:
+    """Convert a time (or an 'HH:MM[:SS]' string) to minutes since midnight"""
+    if isinstance(value, str):
+        value = time.fromisoformat(value)
+    return value.hour * 60 + value.minute
+
+
+def from_minutes(minutes: int) -> time:
+    """Convert minutes since midnight back to a time"""
+    return time(minutes // 60, minutes % 60)
+
+
+def tick_floor(minutes: int) -> int:
+    return minutes // TICK_MINUTES * TICK_MINUTES
+
+
+def tick_ceil(minutes: int) -> int:
+    return -(-minutes // TICK_MINUTES) * TICK_MINUTES
+
+
+def merge_intervals(intervals: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Sort and merge overlapping (start, end) minute intervals"""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_starts(
+    windows: List[Tuple[int, int, int]],
+    busy: List[Tuple[int, int]],
+    duration_minutes: Optional[int] = None
+) -> List[int]:
+    """
+    Expand (start, end, step) windows into bookable start minutes.
+
+    A start is bookable when [start, start + length) fits inside its window and
+    does not overlap any interval in ``busy``, which must already be merged.
+    ``length`` is ``duration_minutes`` when given, otherwise the window's step.
+    """
+    busy_ends = [end for _, end in busy]
+    starts = set()
+    for window_start, window_end, step in windows:
+        step = step or 30
+        length = duration_minutes or step
+        candidate = window_start
+        while candidate + length <= window_end:
+            # First busy interval that ends after the candidate starts
+            i = bisect_right(busy_ends, candidate)
+            if i == len(busy) or busy[i][0] >= candidate + length:
+                starts.add(candidate)
+            candidate += step
+    return sorted(starts)
+
+
+def load_windows(db: Session, business_id: int) -> Dict[int, List[Tuple[int, int, int]]]:
+    """
+    Load active time slot windows as {day_of_week: [(start, end, step), ...]}.
+
+    Windows are shrunk to whole ticks and steps rounded up to whole ticks, so
+    every start time falls on a tick and is the same in the bitmaps.
+    """
+    time_slots = db.query(
+        models.TimeSlot.day_of_week,
+        models.TimeSlot.start_time,
+        models.TimeSlot.end_time,
+        models.TimeSlot.slot_duration_minutes
+    ).filter(
+        models.TimeSlot.business_id == business_id,
+        models.TimeSlot.is_active == True
+    ).all()
+
+    windows_by_weekday: Dict[int, List[Tuple[int, int, int]]] = defaultdict(list)
+    for day_of_week, start_time, end_time, step in time_slots:
+        windows_by_weekday[day_of_week].append(
+            (tick_ceil(to_minutes(start_time)), tick_floor(to_minutes(end_time)), step and tick_ceil(step))
+        )
+    return windows_by_weekday
+
+
+def load_busy(
+    db: Session,
+    business_id: int,
+    start_date: date,
+    end_date: date
+) -> Dict[date, List[Tuple[int, int]]]:
+    """
+    Load blocking appointment intervals as {date: [(start, end), ...]}.
+
+    Intervals are widened to whole ticks, like the slot claims that decide
+    whether a booking conflicts (see booking.py).
+    """
+    appointments = db.query(
+        models.Appointment.appointment_date,
+        models.Appointment.appointment_time,
+        models.Appointment.duration_minutes
+    ).filter(
+        models.Appointment.business_id == business_id,
+        models.Appointment.appointment_date >= start_date,
+        models.Appointment.appointment_date <= end_date,
+        models.Appointment.status.notin_(NON_BLOCKING_STATUSES)
+    ).all()
+
+    busy_by_date: Dict[date, List[Tuple[int, int]]] = defaultdict(list)
+    for appointment_date, appointment_time, length in appointments:
+        start = to_minutes(appointment_time)
+        busy_by_date[appointment_date].append((tick_floor(start), tick_ceil(start + (length or 30))))
+    return busy_by_date
+
+
+def compute_availability(
+    db: Session,
+    business_id: int,
+    start_date: date,
+    end_date: date,
+    duration_minutes: Optional[int] = None
+) -> Dict[date, List[time]]:
+    """
+    Return the bookable start times for each day in [start_date, end_date].
+
+    Loads the business's active time slots and its blocking appointments for the
+    whole range up front, so the number of queries does not grow with the range.
+    """
+    windows_by_weekday = load_windows(db, business_id)
+    busy_by_date = load_busy(db, business_id, start_date, end_date) if windows_by_weekday else {}
+
+    availability: Dict[date, List[time]] = {}
+    day = start_date
+    while day <= end_date:
+        windows = windows_by_weekday.get(day.weekday(), [])
+        busy = merge_intervals(busy_by_date.get(day, []))
+        availability[day] = [from_minutes(m) for m in free_starts(windows, busy, duration_minutes)]
+        day += timedelta(days=1)
+    return availability
+
+
+def tick_mask(start_minute: int, length: int) -> int:
+    """Bitmask of the ticks covered by [start_minute, start_minute + length)"""
+    first = start_minute // TICK_MINUTES
+    last = min(-(-(start_minute + length) // TICK_MINUTES), TICKS_PER_DAY)
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+class BusinessCalendar:
+    """Bitmap view of one business's weekly template and booked ticks per day"""
+
+    def __init__(self, windows_by_weekday: Dict[int, List[Tuple[int, int, int]]]):
+        self.windows_by_weekday = windows_by_weekday
+        # date -> bitmask of booked ticks; a missing date has not been loaded yet
+        self.busy: Dict[date, int] = {}
+        # Bumped on every incremental change so stale loads are not stored
+        self.generation = 0
+        self._candidates: Dict[Tuple[int, Optional[int]], Tuple[List[Tuple[int, int]], int]] = {}
+
+    def candidates(self, weekday: int, duration_minutes: Optional[int]) -> Tuple[List[Tuple[int, int]], int]:
+        """Return ([(start bit, required ticks), ...], all start bits) for a weekday"""
+        key = (weekday, duration_minutes)
+        if key not in self._candidates:
+            candidates = []
+            all_starts = 0
+            for window_start, window_end, step in self.windows_by_weekday.get(weekday, []):
+                step = step or 30
+                length = duration_minutes or step
+                candidate = window_start
+                while candidate + length <= window_end:
+                    start_bit = 1 << (candidate // TICK_MINUTES)
+                    candidates.append((start_bit, tick_mask(candidate, length)))
+                    all_starts |= start_bit
+                    candidate += step
+            if len(self._candidates) >= 7 * 8:
+                self._candidates.clear()
+            self._candidates[key] = (candidates, all_starts)
+        return self._candidates[key]
+
+    def free_mask(self, day: date, busy: int, duration_minutes: Optional[int] = None) -> int:
+        """Bitmask of bookable start ticks on a day given its booked ticks"""
+        candidates, all_starts = self.candidates(day.weekday(), duration_minutes)
+        if not busy:
+            return all_starts
+        mask = 0
+        for start_bit, required in candidates:
+            if not busy & required:
+                mask |= start_bit
+        return mask
+
+
+class CalendarStore:
+    """
+    Process-wide cache of BusinessCalendar bitmaps.
+
+    Templates are built from TimeSlot rows on first use and booked ticks are
+    loaded per day on demand. Bookings are applied to the bitmaps in place;
+    releases drop the affected day so it is rebuilt from the database on the
+    next read. Time slot changes invalidate the whole business.
+
+    With a ``bus``, other workers drop the same day (or business) when this
+    one changes it. ``on_change(business_id)`` is awaited after every local change.
+    """
+
+    def __init__(
+        self,
+        max_businesses: int = 1024,
+        bus: Optional[InvalidationBus] = None,
+        on_change: Optional[Callable[[int], Awaitable[None]]] = None
+    ):
+        self.max_businesses = max_businesses
+        self._calendars: "OrderedDict[int, BusinessCalendar]" = OrderedDict()
+        # Bumped when calendars are dropped, so templates loaded before that are not stored
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.bus = bus
+        self.on_change = on_change
+        if bus is not None:
+            bus.subscribe("calendar.release", lambda business_id, day: self._release(business_id, date.fromisoformat(day)))
+            bus.subscribe("calendar.invalidate", self._invalidate)
+
+    async def _changed(self, business_id: int, topic: str, *args):
+        if self.on_change is not None:
+            await self.on_change(business_id)
+        if self.bus is not None:
+            self.bus.publish(topic, business_id, *args)
+
+    def __contains__(self, business_id: int) -> bool:
+        with self._lock:
+            return business_id in self._calendars
+
+    def _get(self, db: Session, business_id: int) -> BusinessCalendar:
+        with self._lock:
+            calendar = self._calendars.get(business_id)
+            if calendar is not None:
+                self._calendars.move_to_end(business_id)
+                return calendar
+            generation = self._generation
+
+        calendar = BusinessCalendar(load_windows(db, business_id))
+        with self._lock:
+            if self._generation != generation:
+                # Time slots changed during the load; use it for this read only
+                return calendar
+            calendar = self._calendars.setdefault(business_id, calendar)
+            self._calendars.move_to_end(business_id)
+            while len(self._calendars) > self.max_businesses:
+                self._calendars.popitem(last=False)
+        return calendar
+
+    def free_masks(
+        self,
+        db: Session,
+        business_id: int,
+        start_date: date,
+        days: int,
+        duration_minutes: Optional[int] = None
+    ) -> List[int]:
+        """Return one bookable-start bitmask per day starting at start_date"""
+        calendar = self._get(db, business_id)
+        dates = [start_date + timedelta(days=i) for i in range(days)]
+
+        with self._lock:
+            missing = [
+                day for day in dates
+                if day not in calendar.busy and calendar.windows_by_weekday.get(day.weekday())
+            ]
+            generation = calendar.generation
+
+        loaded: Dict[date, int] = {}
+        if missing:
+            loaded = {day: 0 for day in missing}
+            for day, intervals in load_busy(db, business_id, missing[0], missing[-1]).items():
+                if day in loaded:
+                    for start, end in intervals:
+                        loaded[day] |= tick_mask(start, end - start)
+            with self._lock:
+                # Only keep the load if no booking or release landed meanwhile
+                if calendar.generation == generation:
+                    for day, mask in loaded.items():
+                        calendar.busy.setdefault(day, mask)
+
+        with self._lock:
+            return [
+                calendar.free_mask(day, calendar.busy.get(day, loaded.get(day, 0)), duration_minutes)
+                for day in dates
+            ]
+
+    async def book(self, business_id: int, day: date, start_time, duration_minutes: Optional[int]):
+        """Mark an appointment's ticks as booked"""
+        with self._lock:
+            calendar = self._calendars.get(business_id)
+            if calendar is not None:
+                calendar.generation += 1
+                if day in calendar.busy:
+                    calendar.busy[day] |= tick_mask(to_minutes(start_time), duration_minutes or 30)
+        # Other workers reload the day rather than replaying the booking
+        await self._changed(business_id, "calendar.release", day.isoformat())
+
+    def _release(self, business_id: int, day: date):
+        with self._lock:
+            calendar = self._calendars.get(business_id)
+            if calendar is None:
+                return
+            calendar.generation += 1
+            calendar.busy.pop(day, None)
+
+    async def release(self, business_id: int, day: date):
+        """Forget a day's booked ticks so they are reloaded on the next read"""
+        self._release(business_id, day)
+        await self._changed(business_id, "calendar.release", day.isoformat())
+
+    def _invalidate(self, business_id: int):
+        with self._lock:
+            self._generation += 1
+            self._calendars.pop(business_id, None)
+
+    async def invalidate(self, business_id: int):
+        """Drop a business's calendar entirely (e.g. after time slot changes)"""
+        self._invalidate(business_id)
+        await self._changed(business_id, "calendar.invalidate")
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._calendars.clear()
+
+
+calendar_store = CalendarStore(
+    bus=bus,
+    on_change=lambda business_id: response_cache.invalidate(availability_tag(business_id))
+)
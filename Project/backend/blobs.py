@@ -0,0 +1,287 @@
+"""
+Where upload bytes live.
+
+Two storage backends are available:
+
+- `LocalBackend` (default): a directory, UPLOAD_DIR (default: `uploads/`
+  next to this file). Every API worker must see the same directory.
+- `S3Backend`: a bucket on S3 or an S3-compatible server (MinIO, moto).
+  Set UPLOAD_STORAGE_URL=s3://bucket/optional/prefix, plus S3_ENDPOINT_URL
+  for a server other than AWS. Credentials and region come from the usual
+  AWS variables. Workers then share nothing but the bucket and the database.
+
+Both backends have the same synchronous interface. Request handlers go
+through `blob_store`, which runs it in threads. Uploads are streamed to a
+temporary file in `spool_dir` first and then handed to `put`. Files are
+served straight from disk (`local_path`) or by redirecting to a presigned
+URL (`download_url`), so S3 downloads do not pass through the workers
+either.
+
+`S3Backend.upload_url` presigns a PUT of an object under its
+content-addressed name. The URL is only valid for the declared type,
+length and SHA-256, so clients can upload large videos directly.
+"""
+import asyncio
+import base64
+import contextlib
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", str(Path(__file__).resolve().parent / "uploads")))
+UPLOAD_STORAGE_URL = os.getenv("UPLOAD_STORAGE_URL")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+PRESIGNED_URL_EXPIRES_SECONDS = int(os.getenv("PRESIGNED_URL_EXPIRES_SECONDS", "900"))
+
+# Stored names are content hashes, so a stored object never changes
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# Chunk size for hashing a stored object
+READ_BYTES = 1024 * 1024
+
+
+class BlobInfo(NamedTuple):
+    size: int
+    content_type: Optional[str]
+    sha256: Optional[str]  # hex; None when the backend does not report it
+
+
+class LocalBackend:
+    """Blobs as files in one directory"""
+
+    supports_direct_upload = False
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        directory.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def spool_dir(self) -> Path:
+        # Same filesystem as the blobs, so `put` is an atomic rename
+        return self.directory
+
+    def put(self, temp_path: Path, name: str, content_type: str):
+        """Move a finished temporary file to ``name``, replacing any copy"""
+        os.replace(temp_path, self.directory / name)
+
+    def stat(self, name: str) -> Optional[BlobInfo]:
+        try:
+            size = (self.directory / name).stat().st_size
+        except FileNotFoundError:
+            return None
+        return BlobInfo(size, None, None)
+
+    def read(self, name: str, length: int) -> bytes:
+        with open(self.directory / name, "rb") as handle:
+            return handle.read(length)
+
+    def sha256(self, name: str) -> str:
+        digest = hashlib.sha256()
+        with open(self.directory / name, "rb") as handle:
+            for chunk in iter(lambda: handle.read(READ_BYTES), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @contextlib.contextmanager
+    def local_copy(self, name: str) -> Iterator[Path]:
+        yield self.directory / name
+
+    def local_path(self, name: str) -> Optional[Path]:
+        return self.directory / name
+
+    def download_url(self, name: str) -> Optional[str]:
+        return None
+
+    def upload_url(self, name: str, content_type: str, size: int, sha256: str) -> Tuple[str, Dict[str, str]]:
+        raise NotImplementedError("Direct uploads need object storage")
+
+    def list(self) -> Iterator[Tuple[str, float]]:
+        """(name, modification time) of every stored file"""
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file():
+                        yield entry.name, entry.stat().st_mtime
+                except FileNotFoundError:
+                    pass
+
+    def delete(self, names: Sequence[str]):
+        for name in names:
+            (self.directory / name).unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "local", "directory": str(self.directory)}
+
+
+class S3Backend:
+    """Blobs as objects under a prefix of an S3 bucket"""
+
+    supports_direct_upload = True
+
+    def __init__(self, client, bucket: str, prefix: str = "", expires_seconds: int = PRESIGNED_URL_EXPIRES_SECONDS):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.expires_seconds = expires_seconds
+
+    @property
+    def spool_dir(self) -> Path:
+        return Path(tempfile.gettempdir())
+
+    def _key(self, name: str) -> str:
+        return self.prefix + name
+
+    def put(self, temp_path: Path, name: str, content_type: str):
+        """Upload a finished temporary file as ``name`` (multipart when large), then delete it"""
+        try:
+            self.client.upload_file(
+                str(temp_path), self.bucket, self._key(name),
+                ExtraArgs={"ContentType": content_type, "CacheControl": IMMUTABLE}
+            )
+        finally:
+            temp_path.unlink(missing_ok=True)
+
+    def stat(self, name: str) -> Optional[BlobInfo]:
+        from botocore.exceptions import ClientError
+
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(name), ChecksumMode="ENABLED")
+        except ClientError as error:
+            if error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        checksum = head.get("ChecksumSHA256")
+        # Multipart objects report a checksum of part checksums ("...-3"), not of the content
+        sha256 = base64.b64decode(checksum).hex() if checksum and "-" not in checksum else None
+        return BlobInfo(head["ContentLength"], head.get("ContentType"), sha256)
+
+    def read(self, name: str, length: int) -> bytes:
+        body = self.client.get_object(Bucket=self.bucket, Key=self._key(name), Range=f"bytes=0-{length - 1}")["Body"]
+        return body.read()
+
+    def sha256(self, name: str) -> str:
+        digest = hashlib.sha256()
+        body = self.client.get_object(Bucket=self.bucket, Key=self._key(name))["Body"]
+        for chunk in body.iter_chunks(READ_BYTES):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    @contextlib.contextmanager
+    def local_copy(self, name: str) -> Iterator[Path]:
+        directory = tempfile.mkdtemp(prefix="blob-")
+        try:
+            path = Path(directory) / name
+            self.client.download_file(self.bucket, self._key(name), str(path))
+            yield path
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def local_path(self, name: str) -> Optional[Path]:
+        return None
+
+    def download_url(self, name: str) -> str:
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._key(name)}, ExpiresIn=self.expires_seconds
+        )
+
+    def upload_url(self, name: str, content_type: str, size: int, sha256: str) -> Tuple[str, Dict[str, str]]:
+        """Presigned PUT of ``name``, and the headers the client must send with it"""
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+        url = self.client.generate_presigned_url("put_object", Params={
+            "Bucket": self.bucket,
+            "Key": self._key(name),
+            "ContentType": content_type,
+            "ContentLength": size,
+            "ChecksumSHA256": checksum,
+            "CacheControl": IMMUTABLE,
+        }, ExpiresIn=self.expires_seconds)
+        return url, {
+            "Content-Type": content_type,
+            "x-amz-checksum-sha256": checksum,
+            "Cache-Control": IMMUTABLE,
+        }
+
+    def list(self) -> Iterator[Tuple[str, float]]:
+        pages = self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self.prefix)
+        for page in pages:
+            for item in page.get("Contents", ()):
+                yield item["Key"][len(self.prefix):], item["LastModified"].timestamp()
+
+    def delete(self, names: Sequence[str]):
+        names = list(names)
+        # DeleteObjects takes at most 1000 keys
+        for start in range(0, len(names), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={
+                "Objects": [{"Key": self._key(name)} for name in names[start:start + 1000]],
+                "Quiet": True,
+            })
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "s3", "bucket": self.bucket, "prefix": self.prefix}
+
+
+class BlobStore:
+    """The configured backend, with its blocking calls moved off the event loop"""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    @property
+    def spool_dir(self) -> Path:
+        return self.backend.spool_dir
+
+    async def put(self, temp_path: Path, name: str, content_type: str):
+        await asyncio.to_thread(self.backend.put, temp_path, name, content_type)
+
+    async def stat(self, name: str) -> Optional[BlobInfo]:
+        return await asyncio.to_thread(self.backend.stat, name)
+
+    async def read(self, name: str, length: int) -> bytes:
+        return await asyncio.to_thread(self.backend.read, name, length)
+
+    async def sha256(self, name: str) -> str:
+        return await asyncio.to_thread(self.backend.sha256, name)
+
+    @contextlib.asynccontextmanager
+    async def local_copy(self, name: str):
+        """A local file with the content of ``name``, valid inside the block"""
+        manager = self.backend.local_copy(name)
+        path = await asyncio.to_thread(manager.__enter__)
+        try:
+            yield path
+        finally:
+            await asyncio.to_thread(manager.__exit__, None, None, None)
+
+    async def delete(self, names: List[str]):
+        await asyncio.to_thread(self.backend.delete, names)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.backend.stats()
+
+
+blob_store = BlobStore(LocalBackend(UPLOAD_DIR))
+
+
+def s3_backend(url: str, endpoint_url: Optional[str] = S3_ENDPOINT_URL) -> S3Backend:
+    """Backend for an s3://bucket/prefix URL"""
+    import boto3
+    from botocore.config import Config
+
+    parsed = urlparse(url)
+    prefix = parsed.path.strip("/")
+    # Signature v4 signs the type, length and checksum headers into presigned URLs
+    client = boto3.client("s3", endpoint_url=endpoint_url, config=Config(signature_version="s3v4"))
+    return S3Backend(client, parsed.netloc, f"{prefix}/" if prefix else "")
+
+
+def init_blobs(url: Optional[str] = UPLOAD_STORAGE_URL):
+    """Switch to object storage when UPLOAD_STORAGE_URL is set"""
+    if not url:
+        return
+    if urlparse(url).scheme != "s3":
+        raise ValueError(f"Unsupported UPLOAD_STORAGE_URL {url!r}; expected s3://bucket/prefix")
+    blob_store.backend = s3_backend(url)
@@ -0,0 +1,222 @@
+"""
+Double-booking prevention with slot claims.
+
+An appointment that holds time on the calendar owns one `SlotClaim` row for
+each TICK_MINUTES tick it covers. A unique constraint on (business, date,
+tick) means two overlapping appointments can never both be committed: the
+second insert fails and the request gets a 409, however the two requests
+interleave.
+
+No rows or tables are locked and no transaction has to be serialisable. On
+PostgreSQL, bookings of different slots never wait on each other, and a
+conflicting booking fails on the index instead of queueing behind a lock.
+SQLite has a single writer, so there booking writes from one process queue
+on an asyncio lock. Otherwise dozens of pooled connections would poll for
+the file lock and some of them would give up with "database is locked".
+
+Every change to an appointment's time or blocking status is committed with
+`commit_booking`, which replaces the appointment's claims in the same
+transaction. Batch endpoints check a whole batch with one `conflicts` query
+and write the claims with `claim_rows` and set-based statements. When another
+worker claims some of the time between the check and the commit, the batch
+is rolled back and checked again, so only the items that now clash fail.
+"""
+import asyncio
+import contextlib
+import logging
+import weakref
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import delete, exists, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+from availability import NON_BLOCKING_STATUSES, TICK_MINUTES, TICKS_PER_DAY, to_minutes
+
+logger = logging.getLogger(__name__)
+
+SLOT_TAKEN = "This time slot is already booked"
+
+# Inserts retried when a generated appointment ID is already taken (see ids.py)
+ID_ATTEMPTS = 5
+
+# Checks of a batch whose time was claimed by another worker before it could
+# commit; if the last one loses the race too, the whole batch gets a 409
+BATCH_ATTEMPTS = 3
+
+
+def blocks(status: str) -> bool:
+    """Whether an appointment in this status holds its time"""
+    return status not in NON_BLOCKING_STATUSES
+
+
+def ticks(start_time, duration_minutes) -> range:
+    """Calendar ticks covered by an appointment (same rounding as tick_mask)"""
+    start = to_minutes(start_time)
+    end = start + (duration_minutes or 30)
+    return range(start // TICK_MINUTES, min(-(-end // TICK_MINUTES), TICKS_PER_DAY))
+
+
+class Slot(NamedTuple):
+    """The time an appointment (``owner``, once it exists) wants to hold"""
+    business_id: int
+    day: date
+    start_time: object
+    duration_minutes: Optional[int]
+    owner: Optional[int] = None
+
+
+def claim_rows(slot: Slot, appointment_id: int) -> List[Dict[str, object]]:
+    """Slot claim rows for a set-based INSERT"""
+    return [
+        {"appointment_id": appointment_id, "business_id": slot.business_id, "claim_date": slot.day, "tick": tick}
+        for tick in ticks(slot.start_time, slot.duration_minutes)
+    ]
+
+
+def claims_for(appointment: models.Appointment) -> List[models.SlotClaim]:
+    if not blocks(appointment.status):
+        return []
+    return [
+        models.SlotClaim(
+            appointment=appointment,
+            business_id=appointment.business_id,
+            claim_date=appointment.appointment_date,
+            tick=tick
+        )
+        for tick in ticks(appointment.appointment_time, appointment.duration_minutes)
+    ]
+
+
+# One SQLite write queue per event loop (asyncio locks are bound to a loop)
+_sqlite_writers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+
+def writer(db: AsyncSession):
+    """Context for a booking write: the process-wide write queue on SQLite"""
+    if db.get_bind().dialect.name != "sqlite":
+        return contextlib.nullcontext()
+    return _sqlite_writers.setdefault(asyncio.get_running_loop(), asyncio.Lock())
+
+
+async def is_taken(db: AsyncSession, appointment: models.Appointment) -> bool:
+    """Whether another appointment already claims any of this one's ticks"""
+    if not blocks(appointment.status):
+        return False
+    span = ticks(appointment.appointment_time, appointment.duration_minutes)
+    statement = select(models.SlotClaim.id).where(
+        models.SlotClaim.business_id == appointment.business_id,
+        models.SlotClaim.claim_date == appointment.appointment_date,
+        models.SlotClaim.tick >= span.start,
+        models.SlotClaim.tick < span.stop
+    )
+    if appointment.id is not None:
+        statement = statement.where(models.SlotClaim.appointment_id != appointment.id)
+    return await db.scalar(statement.limit(1)) is not None
+
+
+async def conflicts(db: AsyncSession, slots: List[Slot]) -> Set[int]:
+    """
+    Indexes of the slots that overlap a claim already in the database or an
+    earlier slot in the list, found with a single query.
+    """
+    if not slots:
+        return set()
+    rows = await db.execute(select(
+        models.SlotClaim.business_id,
+        models.SlotClaim.claim_date,
+        models.SlotClaim.tick,
+        models.SlotClaim.appointment_id
+    ).where(
+        models.SlotClaim.business_id.in_({slot.business_id for slot in slots}),
+        models.SlotClaim.claim_date.in_({slot.day for slot in slots})
+    ))
+    taken: Dict[Tuple[int, date, int], Optional[int]] = {
+        (business_id, claim_date, tick): owner for business_id, claim_date, tick, owner in rows
+    }
+    clashing = set()
+    for index, slot in enumerate(slots):
+        keys = [(slot.business_id, slot.day, tick) for tick in ticks(slot.start_time, slot.duration_minutes)]
+        if any(key in taken and (slot.owner is None or taken[key] != slot.owner) for key in keys):
+            clashing.add(index)
+            continue
+        # Claimed by this batch; owner -1 matches no appointment
+        taken.update((key, -1) for key in keys)
+    return clashing
+
+
+async def claim(db: AsyncSession, appointment: models.Appointment):
+    """Replace an appointment's claims with ones for its current time and status"""
+    if appointment.id is not None:
+        await db.execute(delete(models.SlotClaim).where(models.SlotClaim.appointment_id == appointment.id))
+    db.add_all(claims_for(appointment))
+
+
+def is_conflict(error: IntegrityError) -> bool:
+    """Whether an insert failed on the slot claim constraint"""
+    # SQLite names the table, PostgreSQL and MySQL the constraint
+    return "slot_claims" in str(error.orig)
+
+
+async def commit_booking(db: AsyncSession, appointment: Optional[models.Appointment] = None):
+    """
+    Commit the session, first re-claiming ``appointment``'s time if given.
+
+    Raises a 409 if the appointment overlaps a live one. Other integrity
+    errors are re-raised after the rollback.
+    """
+    if appointment is not None and await is_taken(db, appointment):
+        # Cheap read that turns most conflicts away before they queue to write
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=SLOT_TAKEN)
+    async with writer(db):
+        if appointment is not None:
+            await claim(db, appointment)
+        try:
+            await db.commit()
+        except IntegrityError as error:
+            await db.rollback()
+            if is_conflict(error):
+                raise HTTPException(status_code=409, detail=SLOT_TAKEN)
+            raise
+
+
+def init_claims(engine: Engine) -> int:
+    """
+    Claim the time of upcoming appointments booked before slot claims existed.
+
+    Ticks that are already taken (a double booking from before) are left to
+    the earlier appointment and logged. Returns the number of claims added.
+    """
+    today = date.today()
+    with Session(engine) as db:
+        unclaimed = db.scalars(select(models.Appointment).where(
+            models.Appointment.appointment_date >= today,
+            models.Appointment.status.notin_(NON_BLOCKING_STATUSES),
+            ~exists().where(models.SlotClaim.appointment_id == models.Appointment.id)
+        ).order_by(models.Appointment.id)).all()
+        if not unclaimed:
+            return 0
+
+        taken = set(db.execute(select(
+            models.SlotClaim.business_id,
+            models.SlotClaim.claim_date,
+            models.SlotClaim.tick
+        ).where(models.SlotClaim.claim_date >= today)).all())
+        added = 0
+        for appointment in unclaimed:
+            for slot_claim in claims_for(appointment):
+                key = (slot_claim.business_id, slot_claim.claim_date, slot_claim.tick)
+                if key in taken:
+                    logger.warning("Appointment %s overlaps an earlier booking", appointment.appointment_id)
+                    break
+                taken.add(key)
+                db.add(slot_claim)
+                added += 1
+        db.commit()
+        return added
@@ -0,0 +1,388 @@
+"""
+Cache of serialised JSON responses for public read endpoints.
+
+Entries are the response bytes, so a hit skips the database and Pydantic
+validation entirely. Each entry carries tags (see the `*_tag` helpers below),
+and write paths call `invalidate` with the tags they change.
+
+Two storage backends are available:
+
+- `MemoryBackend` (default): per-process, bounded by a memory budget, with a
+  TTL and LRU eviction. Invalidations go out on the invalidation bus so other
+  workers drop their own copies.
+- `RedisBackend`: shared by every worker. Set CACHE_URL (e.g.
+  redis://localhost:6379/0) to use it. The memory budget is Redis's
+  `maxmemory`, which should be paired with an `allkeys-lru` policy.
+
+Backend methods are coroutines, so a Redis round trip never blocks the
+event loop. A lookup returns the body together with the generation counter
+that `set` checks after a miss, in one round trip.
+
+Configure with CACHE_URL, RESPONSE_CACHE_MAX_BYTES and RESPONSE_CACHE_TTL_SECONDS.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+import conditional
+from invalidation import InvalidationBus, bus
+
+CACHE_URL = os.getenv("CACHE_URL")
+# Worker count read by uvicorn and gunicorn
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+DEFAULT_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+DEFAULT_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "60"))
+
+# Tag shared by every search result page
+SEARCH_TAG = "search"
+
+
+def business_tag(business_id: int) -> str:
+    return f"business:{business_id}"
+
+
+def services_tag(business_id: int) -> str:
+    return f"services:{business_id}"
+
+
+def timeslots_tag(business_id: int) -> str:
+    return f"timeslots:{business_id}"
+
+
+def availability_tag(business_id: int) -> str:
+    return f"availability:{business_id}"
+
+
+def profile_tags(business_id: int) -> Tuple[str, ...]:
+    """Tags to invalidate when a business's own row changes"""
+    return (business_tag(business_id), SEARCH_TAG)
+
+
+def all_business_tags(business_id: int) -> Tuple[str, ...]:
+    """Tags to invalidate when a business is deleted"""
+    return profile_tags(business_id) + (
+        services_tag(business_id), timeslots_tag(business_id), availability_tag(business_id)
+    )
+
+
+@lru_cache(maxsize=None)
+def _adapter(response_type: Any) -> TypeAdapter:
+    return TypeAdapter(response_type)
+
+
+def render(response_type: Any, value: Any) -> bytes:
+    """Validate ``value`` (ORM objects allowed) against a response type and dump it to JSON"""
+    adapter = _adapter(response_type)
+    return adapter.dump_json(adapter.validate_python(value, from_attributes=True))
+
+
+def _pack(meta: Dict[str, Any], body: bytes) -> bytes:
+    # One JSON line of metadata (validators) in front of the body
+    return json.dumps(meta, separators=(",", ":")).encode() + b"\n" + body
+
+
+def _unpack(data: bytes) -> Tuple[Dict[str, Any], bytes]:
+    meta, _, body = data.partition(b"\n")
+    return json.loads(meta), body
+
+
+def cache_key(key: Hashable) -> str:
+    """Stable string form of a key so every worker and backend agrees on it"""
+    return key if isinstance(key, str) else json.dumps(key, default=str, separators=(",", ":"))
+
+
+class MemoryBackend:
+    """Thread-safe TTL + LRU store bounded by total body size"""
+
+    shared = False
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.clock = clock
+        # key -> (body, expires_at, tags)
+        self._entries: "OrderedDict[str, Tuple[bytes, float, Tuple[str, ...]]]" = OrderedDict()
+        self._keys_by_tag: Dict[str, Set[str]] = {}
+        self._bytes = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _remove_locked(self, key: str):
+        body, _, tags = self._entries.pop(key)
+        self._bytes -= len(body)
+        for tag in tags:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+    async def lookup(self, key: str) -> Tuple[Optional[bytes], int]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, self._generation
+            if entry[1] <= self.clock():
+                self._remove_locked(key)
+                self.expirations += 1
+                return None, self._generation
+            self._entries.move_to_end(key)
+            return entry[0], self._generation
+
+    async def set(self, key: str, body: bytes, tags: Tuple[str, ...], ttl_seconds: float, generation: Optional[int]):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            if len(body) > self.max_bytes:
+                return
+            if key in self._entries:
+                self._remove_locked(key)
+            self._entries[key] = (body, self.clock() + ttl_seconds, tags)
+            self._bytes += len(body)
+            for tag in tags:
+                self._keys_by_tag.setdefault(tag, set()).add(key)
+            while self._bytes > self.max_bytes:
+                self._remove_locked(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _invalidate(self, tags: Iterable[str]):
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._remove_locked(key)
+                    self.invalidations += 1
+
+    async def invalidate(self, tags: Iterable[str]):
+        self._invalidate(tags)
+
+    async def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+    async def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._keys_by_tag.clear()
+            self._bytes = 0
+
+
+class RedisBackend:
+    """
+    Store shared by all workers in Redis, through a `redis.asyncio` client.
+
+    Bodies are plain keys with a TTL. Each tag is a set of the keys that carry
+    it, and invalidation deletes the set's members. A generation counter
+    stops a worker from storing a response built before an invalidation.
+    """
+
+    shared = True
+
+    def __init__(self, client, prefix: str = "cache:"):
+        self.client = client
+        self.prefix = prefix
+        self.invalidations = 0
+
+    @property
+    def _generation_key(self) -> str:
+        return f"{self.prefix}generation"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.prefix}tag:{tag}"
+
+    async def lookup(self, key: str) -> Tuple[Optional[bytes], int]:
+        body, generation = await self.client.mget(self.prefix + key, self._generation_key)
+        return body, int(generation or 0)
+
+    async def set(self, key: str, body: bytes, tags: Tuple[str, ...], ttl_seconds: float, generation: Optional[int]):
+        ttl_ms = max(1, int(ttl_seconds * 1000))
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.set(self.prefix + key, body, px=ttl_ms)
+            for tag in tags:
+                pipe.sadd(self._tag_key(tag), key)
+                # A tag set never needs to outlive the newest entry it points to
+                pipe.pexpire(self._tag_key(tag), ttl_ms)
+            pipe.get(self._generation_key)
+            *_, current = await pipe.execute()
+        # An invalidation that ran before this write may have missed it, but
+        # it bumped the generation first, so the write removes itself
+        if generation is not None and generation != int(current or 0):
+            await self.client.delete(self.prefix + key)
+
+    async def invalidate(self, tags: Iterable[str]):
+        tag_keys = [self._tag_key(tag) for tag in tags]
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.incr(self._generation_key)
+            for tag_key in tag_keys:
+                pipe.smembers(tag_key)
+            _, *members_by_tag = await pipe.execute()
+        async with self.client.pipeline(transaction=False) as pipe:
+            for tag_key, members in zip(tag_keys, members_by_tag):
+                if members:
+                    pipe.delete(*[self.prefix + member.decode() for member in members])
+                    # Keys tagged since the snapshot stay in the set
+                    pipe.srem(tag_key, *members)
+                    self.invalidations += len(members)
+            await pipe.execute()
+
+    async def stats(self) -> Dict[str, Any]:
+        info = await self.client.info("stats")
+        return {
+            "backend": "redis",
+            "invalidations": self.invalidations,
+            "evictions": info.get("evicted_keys", 0),
+            "expirations": info.get("expired_keys", 0),
+        }
+
+    async def clear(self):
+        await self.client.incr(self._generation_key)
+        keys = [key async for key in self.client.scan_iter(match=f"{self.prefix}*")]
+        if keys:
+            await self.client.delete(*keys)
+
+
+class ResponseCache:
+    """
+    Response cache front end; counts hits and misses for this worker.
+
+    With a ``bus`` and an unshared backend, invalidations are replayed in
+    other workers.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        bus: Optional[InvalidationBus] = None
+    ):
+        self.backend = backend or MemoryBackend()
+        self.ttl_seconds = ttl_seconds
+        self.bus = bus
+        self.hits = 0
+        self.misses = 0
+        if bus is not None:
+            bus.subscribe("cache.invalidate", self._apply_remote)
+
+    def _apply_remote(self, *tags: str):
+        if not self.backend.shared:
+            self.backend._invalidate(tags)
+
+    async def lookup(self, key: Hashable) -> Tuple[Optional[bytes], int]:
+        """The cached body (or None) and the generation to pass to `set` on a miss"""
+        body, generation = await self.backend.lookup(cache_key(key))
+        if body is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return body, generation
+
+    async def get(self, key: Hashable) -> Optional[bytes]:
+        body, _ = await self.lookup(key)
+        return body
+
+    async def set(self, key: Hashable, body: bytes, tags: Iterable[str] = (), generation: Optional[int] = None):
+        """
+        Store a response body.
+
+        When ``generation`` is given and an invalidation happened since it was
+        read, the body may be stale and is dropped.
+        """
+        await self.backend.set(cache_key(key), body, tuple(tags), self.ttl_seconds, generation)
+
+    async def invalidate(self, *tags: str):
+        """Drop every entry carrying any of the tags, in every worker"""
+        await self.backend.invalidate(tags)
+        if self.bus is not None and not self.backend.shared:
+            self.bus.publish("cache.invalidate", *tags)
+
+    async def respond(
+        self,
+        key: Hashable,
+        response_type: Any,
+        produce: Callable[[], Awaitable[Any]],
+        tags: Iterable[str] = (),
+        request: Optional[Request] = None,
+        validate: Optional[Callable[[Any], Tuple[str, Optional[str]]]] = None
+    ) -> Response:
+        """
+        Return the cached JSON response for ``key``, building it on a miss.
+
+        ``produce`` is a coroutine function returning the value to serialise
+        as ``response_type``; an HTTPException it raises propagates and
+        nothing is cached.
+
+        ``validate`` maps that value to (ETag, Last-Modified) (see
+        `conditional.validators`). The validators are stored with the body,
+        and a client that already has the current version gets a 304 without
+        the body being serialised.
+        """
+        cached, generation = await self.lookup(key)
+        if cached is not None:
+            meta, body = _unpack(cached)
+            status = "HIT"
+        else:
+            status = "MISS"
+            value = await produce()
+            meta = {}
+            if validate is not None:
+                meta["etag"], meta["last_modified"] = validate(value)
+                if request is not None and conditional.is_not_modified(request, meta["etag"], meta["last_modified"]):
+                    return conditional.not_modified(meta["etag"], meta["last_modified"])
+            body = render(response_type, value)
+            await self.set(key, _pack(meta, body), tags, generation)
+
+        etag = meta.get("etag")
+        if etag and request is not None and conditional.is_not_modified(request, etag, meta.get("last_modified")):
+            return conditional.not_modified(etag, meta.get("last_modified"))
+        response = Response(content=body, media_type="application/json", headers={"X-Cache": status})
+        if etag:
+            conditional.set_validators(response, etag, meta.get("last_modified"))
+        return response
+
+    async def stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, **(await self.backend.stats())}
+
+    async def clear(self):
+        await self.backend.clear()
+
+
+response_cache = ResponseCache(bus=bus)
+
+
+def init_cache(url: Optional[str] = CACHE_URL, workers: int = WEB_CONCURRENCY):
+    """Switch to the shared Redis backend and cross-worker messages when a URL is set
+
+    Without a URL, invalidations (including logouts and account deletions in
+    principals.py and revocation.py) only reach this process, so running
+    several workers without one is refused.
+    """
+    if not url:
+        if workers > 1:
+            raise RuntimeError(
+                f"WEB_CONCURRENCY is {workers} but CACHE_URL is not set: other workers would keep "
+                "serving revoked sessions and deleted accounts. Set CACHE_URL to a Redis URL."
+            )
+        return
+    import redis.asyncio
+
+    client = redis.asyncio.Redis.from_url(url)
+    response_cache.backend = RedisBackend(client)
+    bus.connect(client)
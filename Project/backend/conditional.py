@@ -0,0 +1,100 @@
+"""
+HTTP conditional requests (ETag / Last-Modified / 304 Not Modified).
+
+Validators are computed from the `id` and `updated_at` of the rows behind a
+response, not from the serialised body. So an unchanged resource can be
+answered with 304 before it is ever serialised. ETags are strong: every
+column a response shows lives on a row whose `updated_at` changes with it.
+
+Responses carry `Cache-Control: no-cache`, so browsers keep the body but
+revalidate it on every use by sending If-None-Match / If-Modified-Since.
+Authenticated responses are also marked `private` so shared caches skip them.
+"""
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Iterable, Optional, Tuple
+
+from fastapi import Request, Response
+
+CACHE_CONTROL = "no-cache"
+PRIVATE_CACHE_CONTROL = "private, no-cache"
+
+
+def http_date(value: datetime) -> str:
+    """Format a naive UTC datetime as an HTTP date"""
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def validators(objects: Iterable[Any], *extra: Any) -> Tuple[str, Optional[str]]:
+    """
+    Return (strong ETag, Last-Modified) for a response built from ``objects``.
+
+    ``extra`` holds anything else in the response that is not a row, such as
+    a page's next_cursor.
+    """
+    objects = list(objects)
+    version = [(type(o).__name__, o.id, getattr(o, "updated_at", None)) for o in objects]
+    digest = hashlib.sha256(repr((version, extra)).encode()).hexdigest()[:32]
+    modified = [o.updated_at or getattr(o, "created_at", None) for o in objects if hasattr(o, "updated_at")]
+    modified = [m for m in modified if m is not None]
+    return f'"{digest}"', http_date(max(modified)) if modified else None
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison
+    candidates = [tag.strip() for tag in header.split(",")]
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates)
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[str]) -> bool:
+    """Evaluate If-None-Match, or If-Modified-Since when there is no If-None-Match"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def set_validators(response: Response, etag: str, last_modified: Optional[str], private: bool = False):
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = PRIVATE_CACHE_CONTROL if private else CACHE_CONTROL
+    if last_modified:
+        response.headers["Last-Modified"] = last_modified
+
+
+def not_modified(etag: str, last_modified: Optional[str], private: bool = False) -> Response:
+    response = Response(status_code=304)
+    set_validators(response, etag, last_modified, private)
+    return response
+
+
+def check(
+    request: Request,
+    response: Response,
+    objects: Iterable[Any],
+    *extra: Any,
+    private: bool = False
+) -> Optional[Response]:
+    """
+    Stamp validators on ``response`` and return a 304 if the client is current.
+
+    For endpoints that return their data directly:
+
+        unchanged = conditional.check(request, response, [business])
+        if unchanged:
+            return unchanged
+        return business
+    """
+    etag, last_modified = validators(objects, *extra)
+    if is_not_modified(request, etag, last_modified):
+        return not_modified(etag, last_modified, private)
+    set_validators(response, etag, last_modified, private)
+    return None
@@ -0,0 +1,165 @@
+"""
+Connection pool settings, SQLite pragmas and pool wait metrics.
+
+`database.py` builds both of its engines with `engine_options` and then
+calls `configure`.
+
+Pooled databases get a bounded pool. Its size, overflow and checkout
+timeout come from DB_POOL_SIZE, DB_MAX_OVERFLOW and DB_POOL_TIMEOUT. Server
+databases (PostgreSQL, MySQL) also recycle connections after
+DB_POOL_RECYCLE_SECONDS and ping them on checkout (DB_POOL_PRE_PING), so a
+connection dropped by the server or a proxy is replaced instead of failing
+a request.
+
+SQLite connections are set up on connect:
+
+- WAL journal, so readers never block on the single writer
+- synchronous=NORMAL, which is durable with WAL except on power loss
+- busy_timeout, so a writer waits for the lock instead of failing
+- mmap_size and cache_size for fewer read syscalls
+- foreign_keys, which SQLite leaves off by default
+
+Every checkout is timed. `PoolMetrics.stats` reports the p50 / p99 / max
+wait over recent checkouts and the pool's current occupancy, for
+`GET /metrics`. A growing p99 means requests are queueing for connections
+and the pool (or the database) is too small.
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+load_dotenv()
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Checkout waits kept for the percentiles in stats()
+WAIT_SAMPLES = 2048
+
+
+class PoolMetrics:
+    """Checkout wait times of one connection pool"""
+
+    def __init__(self, samples: int = WAIT_SAMPLES):
+        self.engine: Optional[Engine] = None
+        self.checkouts = 0
+        self.timeouts = 0
+        self.max_wait = 0.0
+        self._waits: Deque[float] = deque(maxlen=samples)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.max_wait = max(self.max_wait, seconds)
+            self._waits.append(seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+        percentile = lambda q: round(waits[min(len(waits) - 1, int(q * len(waits)))] * 1000, 3) if waits else 0.0
+        stats = {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_p50_ms": percentile(0.50),
+            "wait_p99_ms": percentile(0.99),
+            "wait_max_ms": round(self.max_wait * 1000, 3),
+        }
+        pool = self.engine.pool if self.engine is not None else None
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                overflow=max(pool.overflow(), 0),
+                max_overflow=pool._max_overflow,
+            )
+        return stats
+
+
+class _TimedPool:
+    """Pool mixin that times every checkout into the class's ``metrics``"""
+
+    metrics: PoolMetrics
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record(time.perf_counter() - started)
+        return connection
+
+
+def _timed(pool_class: type, metrics: PoolMetrics) -> type:
+    # A class per engine: Pool.recreate() (on dispose) keeps the metrics
+    return type(f"Timed{pool_class.__name__}", (_TimedPool, pool_class), {"metrics": metrics})
+
+
+def _is_sqlite(url) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _is_memory(url) -> bool:
+    return _is_sqlite(url) and make_url(url).database in (None, "", ":memory:")
+
+
+def engine_options(url: str, metrics: Optional[PoolMetrics] = None, asyncio: bool = False) -> Dict[str, Any]:
+    """Keyword arguments for create_engine / create_async_engine; checkouts are timed into ``metrics``"""
+    options: Dict[str, Any] = {}
+    if _is_sqlite(url) and not asyncio:
+        options["connect_args"] = {"check_same_thread": False}
+    if _is_memory(url):
+        # One shared connection per process; nothing to size
+        return options
+
+    pool_class = AsyncAdaptedQueuePool if asyncio else QueuePool
+    options.update(
+        poolclass=pool_class if metrics is None else _timed(pool_class, metrics),
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+    )
+    if not _is_sqlite(url):
+        options.update(pool_recycle=POOL_RECYCLE_SECONDS, pool_pre_ping=POOL_PRE_PING)
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size={-SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute("PRAGMA foreign_keys=ON")
+    finally:
+        cursor.close()
+
+
+def configure(engine: Engine, metrics: Optional[PoolMetrics] = None):
+    """Install connect hooks on a sync engine (or an AsyncEngine's sync_engine)"""
+    if metrics is not None:
+        metrics.engine = engine
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _set_sqlite_pragmas)
@@ -1,25 +1,90 @@
-from sqlalchemy import create_engine
+from fastapi import HTTPException, status
+from sqlalchemy import create_engine, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.orm.exc import StaleDataError
 import os
 from dotenv import load_dotenv
 
+from connections import PoolMetrics, configure, engine_options
+from principals import principal_cache
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./appointments.db")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+# Optional read replicas for the read-only endpoints (see replicas.py)
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+
+# asyncio driver for each database the app supports
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+def async_url(url: str) -> str:
+    """The same database URL with its asyncio driver (sqlite -> aiosqlite, postgresql -> asyncpg)"""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None or parsed.drivername == driver:
+        return url
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+# Sync engine for startup tasks (migrations, index builds) and scripts
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+configure(engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def create_request_engine(url: str, metrics: PoolMetrics):
+    """Async engine for request handlers; its checkout waits go to ``metrics``"""
+    request_engine = create_async_engine(async_url(url), **engine_options(url, metrics, asyncio=True))
+    configure(request_engine.sync_engine, metrics)
+    return request_engine
+
+# Async engine used by every request handler (the primary); pool waits are in /metrics
+pool_metrics = PoolMetrics()
+async_engine = create_request_engine(DATABASE_URL, pool_metrics)
+
+replica_pool_metrics = [PoolMetrics() for _ in DATABASE_REPLICA_URLS]
+replica_engines = [
+    create_request_engine(url, metrics) for url, metrics in zip(DATABASE_REPLICA_URLS, replica_pool_metrics)
+]
+
+class RequestSession(Session):
+    """Sync half of every request session; replicas.py watches the writes it commits"""
+
+# Objects stay loaded after commit: touching an expired attribute outside
+# the session's greenlet would need I/O that async code cannot do implicitly
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    sync_session_class=RequestSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except StaleDataError:
+            # The user was attached from the principal cache (see auth.py) and
+            # deleted by another request before this one wrote to it
+            cached = db.info.get("cached_principal")
+            if cached is None:
+                raise
+            await db.rollback()
+            model, user_id, user_type, email = cached
+            if await db.scalar(select(model.id).where(model.id == user_id)) is not None:
+                raise
+            principal_cache.invalidate(user_type, email)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
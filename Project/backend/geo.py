@@ -0,0 +1,391 @@
+"""
+Offline geocoding and an in-process spatial index for "near me" search.
+
+Business addresses are geocoded against a local gazetteer, so no network
+service is needed. The bundled `data/gazetteer.csv` holds city centroids.
+Set GAZETTEER_PATH to a larger file to replace it, for example one with a row
+per ZIP code (`name` = ZIP, blank `state`). When an address ends in a ZIP code
+that the gazetteer knows, the ZIP wins over the city.
+
+`GeoIndex` buckets coordinates into a fixed grid of cells and answers radius
+and nearest-first queries. It only looks at the cells near the query point.
+Call `init_geo(engine)` once at startup.
+"""
+import csv
+import heapq
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+import models
+from invalidation import InvalidationBus, bus
+from pagination import PageParams, decode_cursor, encode_cursor
+
+GAZETTEER_PATH = os.getenv(
+    "GAZETTEER_PATH", str(Path(__file__).parent / "data" / "gazetteer.csv")
+)
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# Default and maximum radius for a location search
+DEFAULT_RADIUS_KM = 25.0
+MAX_RADIUS_KM = 500.0
+
+_ZIP_RE = re.compile(r'\b(\d{5})(?:-\d{4})?\b')
+_CITY_STATE_RE = re.compile(r'^(.*?)\s*\b([a-z]{2})$')
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two points in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _normalize(value: str) -> str:
+    return " ".join(value.lower().replace(".", "").split())
+
+
+class Gazetteer:
+    """Place name and ZIP code lookup table"""
+
+    def __init__(self, places: Dict[str, Tuple[float, float]]):
+        self.places = places
+
+    @classmethod
+    def load(cls, path: str = GAZETTEER_PATH) -> "Gazetteer":
+        """Read a `name,state,latitude,longitude` CSV"""
+        places: Dict[str, Tuple[float, float]] = {}
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                point = (float(row["latitude"]), float(row["longitude"]))
+                name = _normalize(row["name"])
+                state = _normalize(row.get("state") or "")
+                if state:
+                    places.setdefault(f"{name}, {state}", point)
+                # Rows are ordered by importance, so a bare city name
+                # resolves to the first (largest) place with that name
+                places.setdefault(name, point)
+        return cls(places)
+
+    def geocode(self, text: Optional[str]) -> Optional[Tuple[float, float]]:
+        """
+        Resolve an address, "City, ST", "City" or ZIP code to (lat, lng).
+
+        Returns None when nothing in the text is in the gazetteer.
+        """
+        if not text:
+            return None
+        text = _normalize(text)
+
+        for zip_code in reversed(_ZIP_RE.findall(text)):
+            if zip_code in self.places:
+                return self.places[zip_code]
+
+        parts = [_ZIP_RE.sub("", part).strip() for part in text.split(",")]
+        parts = [part for part in parts if part]
+        if not parts:
+            return None
+
+        match = _CITY_STATE_RE.match(parts[-1])
+        if match:
+            city, state = match.groups()
+            if not city and len(parts) > 1:
+                city = parts[-2]
+            if city and f"{city}, {state}" in self.places:
+                return self.places[f"{city}, {state}"]
+
+        for part in reversed(parts):
+            if part in self.places:
+                return self.places[part]
+        return None
+
+
+_gazetteer: Optional[Gazetteer] = None
+
+
+def geocode(text: Optional[str]) -> Optional[Tuple[float, float]]:
+    """Geocode text against the configured gazetteer, loading it on first use"""
+    global _gazetteer
+    if _gazetteer is None:
+        _gazetteer = Gazetteer.load()
+    return _gazetteer.geocode(text)
+
+
+def assign_coordinates(
+    business: models.Business,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None
+):
+    """Set a business's coordinates, geocoding its address unless both are given"""
+    if latitude is not None and longitude is not None:
+        business.latitude, business.longitude = latitude, longitude
+    else:
+        business.latitude, business.longitude = geocode(business.address) or (None, None)
+
+
+class GeoIndex:
+    """
+    Grid-bucketed point index with nearest-first iteration.
+
+    Points live in square cells of ``cell_degrees`` on a side. A query scans
+    rings of cells outward from the query point's cell. After each ring,
+    every point closer than the ring's inner edge has been seen and can be
+    yielded in distance order. Cell tuples are replaced on write and never
+    mutated, so readers do not need the lock. The grid does not wrap across
+    the antimeridian. With a ``bus``, writes are replayed in other workers.
+    """
+
+    def __init__(self, cell_degrees: float = 0.1, bus: Optional[InvalidationBus] = None):
+        self.cell_degrees = cell_degrees
+        self._cells: Dict[Tuple[int, int], Tuple[Tuple[int, float, float], ...]] = {}
+        self._points: Dict[int, Tuple[float, float]] = {}
+        # (min_y, max_y, min_x, max_x) of cells ever occupied; grows only
+        self._extent: Optional[Tuple[int, int, int, int]] = None
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.bus = bus
+        if bus is not None:
+            bus.subscribe("geo.put", self._put)
+            bus.subscribe("geo.remove", self._remove)
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees))
+
+    def _remove_locked(self, business_id: int):
+        point = self._points.pop(business_id, None)
+        if point is None:
+            return
+        key = self._cell(*point)
+        remaining = tuple(entry for entry in self._cells[key] if entry[0] != business_id)
+        if remaining:
+            self._cells[key] = remaining
+        else:
+            del self._cells[key]
+
+    def put(self, business_id: int, lat: Optional[float], lng: Optional[float]):
+        """
+        Add or move a business; None coordinates remove it.
+
+        Ignored until the index is loaded, since `load` will read the row.
+        """
+        self._put(business_id, lat, lng)
+        if self.bus is not None:
+            self.bus.publish("geo.put", business_id, lat, lng)
+
+    def _put(self, business_id: int, lat: Optional[float], lng: Optional[float]):
+        with self._lock:
+            if not self.loaded:
+                return
+            self._remove_locked(business_id)
+            if lat is None or lng is None:
+                return
+            key = self._cell(lat, lng)
+            self._cells[key] = self._cells.get(key, ()) + ((business_id, lat, lng),)
+            self._points[business_id] = (lat, lng)
+            self._extent = self._grow_extent(self._extent, [key])
+
+    @staticmethod
+    def _grow_extent(extent, keys) -> Optional[Tuple[int, int, int, int]]:
+        for y, x in keys:
+            if extent is None:
+                extent = (y, y, x, x)
+            else:
+                extent = (min(extent[0], y), max(extent[1], y), min(extent[2], x), max(extent[3], x))
+        return extent
+
+    def remove(self, business_id: int):
+        self._remove(business_id)
+        if self.bus is not None:
+            self.bus.publish("geo.remove", business_id)
+
+    def _remove(self, business_id: int):
+        with self._lock:
+            self._remove_locked(business_id)
+
+    def load(self, db: Session):
+        """Replace the index contents with every geocoded business"""
+        rows = db.query(
+            models.Business.id, models.Business.latitude, models.Business.longitude
+        ).filter(
+            models.Business.latitude.isnot(None),
+            models.Business.longitude.isnot(None)
+        ).all()
+        cells = defaultdict(list)
+        points = {}
+        for business_id, lat, lng in rows:
+            cells[self._cell(lat, lng)].append((business_id, lat, lng))
+            points[business_id] = (lat, lng)
+        with self._lock:
+            self._cells = {key: tuple(entries) for key, entries in cells.items()}
+            self._points = points
+            self._extent = self._grow_extent(None, self._cells)
+            self.loaded = True
+
+    def ensure_loaded(self, db: Session):
+        if not self.loaded:
+            self.load(db)
+
+    def nearest(
+        self,
+        lat: float,
+        lng: float,
+        radius_km: Optional[float] = None
+    ) -> Iterator[Tuple[float, int]]:
+        """Yield (distance_km, business_id) in ascending order, up to radius_km"""
+        cells, extent = self._cells, self._extent
+        if extent is None:
+            return
+        center_y, center_x = self._cell(lat, lng)
+        min_y, max_y, min_x, max_x = extent
+
+        heap: List[Tuple[float, int]] = []
+        ring = 0
+        while True:
+            for y, x in self._ring(center_y, center_x, ring):
+                for business_id, point_lat, point_lng in cells.get((y, x), ()):
+                    distance = haversine_km(lat, lng, point_lat, point_lng)
+                    if radius_km is None or distance <= radius_km:
+                        heapq.heappush(heap, (distance, business_id))
+
+            covered = (
+                center_y - ring <= min_y and center_y + ring >= max_y
+                and center_x - ring <= min_x and center_x + ring >= max_x
+            )
+            bound = self._ring_bound_km(lat, ring)
+            if covered or (radius_km is not None and bound > radius_km):
+                break
+            # Unscanned cells are at least `bound` away, so closer hits are final
+            while heap and heap[0][0] <= bound:
+                yield heapq.heappop(heap)
+            ring += 1
+
+        while heap:
+            yield heapq.heappop(heap)
+
+    @staticmethod
+    def _ring(center_y: int, center_x: int, ring: int) -> Iterator[Tuple[int, int]]:
+        if ring == 0:
+            yield center_y, center_x
+            return
+        for x in range(center_x - ring, center_x + ring + 1):
+            yield center_y - ring, x
+            yield center_y + ring, x
+        for y in range(center_y - ring + 1, center_y + ring):
+            yield y, center_x - ring
+            yield y, center_x + ring
+
+    def _ring_bound_km(self, lat: float, ring: int) -> float:
+        """Minimum distance from the query to any cell outside the first `ring` rings"""
+        span = ring * self.cell_degrees
+        # East-west degrees shrink towards the poles; use the widest latitude
+        # the next ring can reach so the bound stays conservative
+        widest = min(90.0, abs(lat) + span + self.cell_degrees)
+        return span * KM_PER_DEGREE * math.cos(math.radians(widest))
+
+    def clear(self):
+        with self._lock:
+            self._cells = {}
+            self._points = {}
+            self._extent = None
+            self.loaded = False
+
+
+geo_index = GeoIndex(bus=bus)
+
+
+def paginate_nearest(
+    query,
+    index: GeoIndex,
+    lat: float,
+    lng: float,
+    radius_km: float,
+    page: PageParams
+) -> Tuple[List[models.Business], Optional[str]]:
+    """
+    Page through businesses matching ``query`` nearest-first.
+
+    Candidates come from the spatial index in distance order and are checked
+    against ``query`` in batches, so other filters (specialty, keywords) still
+    apply. The cursor is the (distance, id) of the last business returned.
+    Each returned business gets a ``distance_km`` attribute.
+    """
+    after = decode_cursor(page.cursor, [float, int]) if page.cursor else None
+    batch_size = 2 * (page.limit + 1)
+    matches: List[Tuple[float, models.Business]] = []
+    batch: List[Tuple[float, int]] = []
+
+    def check_batch():
+        ids = [business_id for _, business_id in batch]
+        found = {b.id: b for b in query.filter(models.Business.id.in_(ids)).all()}
+        matches.extend((distance, found[business_id]) for distance, business_id in batch if business_id in found)
+        batch.clear()
+
+    for hit in index.nearest(lat, lng, radius_km):
+        if after is not None and hit <= after:
+            continue
+        batch.append(hit)
+        if len(batch) >= batch_size:
+            check_batch()
+            if len(matches) > page.limit:
+                break
+    if batch:
+        check_batch()
+
+    next_cursor = None
+    if len(matches) > page.limit:
+        matches = matches[:page.limit]
+        distance, business = matches[-1]
+        next_cursor = encode_cursor([distance, business.id])
+    for distance, business in matches:
+        business.distance_km = round(distance, 3)
+    return [business for _, business in matches], next_cursor
+
+
+def backfill(db: Session) -> int:
+    """Geocode businesses that have an address but no coordinates"""
+    businesses = db.query(models.Business).filter(
+        models.Business.latitude.is_(None),
+        models.Business.address.isnot(None)
+    ).all()
+    updated = 0
+    for business in businesses:
+        assign_coordinates(business)
+        if business.latitude is not None:
+            updated += 1
+    if updated:
+        db.commit()
+    return updated
+
+
+def init_geo(engine: Engine):
+    """Geocode businesses that predate geocoding and build the spatial index"""
+    db = Session(bind=engine)
+    try:
+        backfill(db)
+        geo_index.load(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        print(f"✅ Geocoded {backfill(db)} businesses")
+    finally:
+        db.close()
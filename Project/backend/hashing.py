@@ -0,0 +1,91 @@
+"""
+Password hashing in a bounded pool of worker processes.
+
+A bcrypt hash or verify at the default cost takes about a quarter of a second
+of CPU. Run inside request handlers, a burst of logins ties up the threadpool
+and, while bcrypt holds the GIL, slows every other request in the worker.
+Here the work runs in separate processes. The request thread only waits on
+the result, which releases the GIL.
+
+Request handlers await `hash_async` / `verify_async`, which free the event
+loop while a worker hashes. The number of calls queued or running is
+capped. When the cap is reached, new calls fail at once with `HasherBusy`
+instead of waiting behind the backlog; `auth` turns that into a 503 with
+Retry-After.
+
+Configure with PASSWORD_HASH_WORKERS (0 hashes in a thread instead of a
+process), PASSWORD_HASH_MAX_PENDING and BCRYPT_ROUNDS. Raising
+BCRYPT_ROUNDS upgrades existing hashes as their owners log in.
+"""
+import os
+
+from passlib.context import CryptContext
+
+from workers import PoolBusy, WorkerPool
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+DEFAULT_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 1)))
+DEFAULT_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(8 * max(DEFAULT_WORKERS, 1))))
+
+# Configure bcrypt with truncate_error=False to handle the bcrypt 72-byte limit.
+# min_rounds marks hashes made at a lower cost as needing an update.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__truncate_error=False
+)
+
+
+def hash_password(password: str) -> str:
+    # Truncate password to 72 bytes if needed (bcrypt limitation)
+    if len(password.encode('utf-8')) > 72:
+        password = password[:72]
+    return pwd_context.hash(password)
+
+
+def check_password(password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(password, hashed_password)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """True when a hash was made with settings other than the current ones"""
+    try:
+        return pwd_context.needs_update(hashed_password)
+    except (TypeError, ValueError):
+        return False
+
+
+class HasherBusy(PoolBusy):
+    """Raised when too many hashing calls are already queued"""
+
+    subject = "Password hasher"
+
+
+class PasswordHasher(WorkerPool):
+    """
+    Runs hashing functions in a process pool with a cap on queued calls.
+
+    ``workers=0`` runs them without worker processes, with the same cap.
+    """
+
+    busy_error = HasherBusy
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_pending: int = DEFAULT_MAX_PENDING):
+        super().__init__(workers, max_pending, average_seconds=0.25)
+
+    def hash(self, password: str) -> str:
+        return self.run(hash_password, password)
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        return self.run(check_password, password, hashed_password)
+
+    async def hash_async(self, password: str) -> str:
+        return await self.run_async(hash_password, password)
+
+    async def verify_async(self, password: str, hashed_password: str) -> bool:
+        return await self.run_async(check_password, password, hashed_password)
+
+
+password_hasher = PasswordHasher()
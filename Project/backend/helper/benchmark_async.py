@@ -0,0 +1,128 @@
+"""
+Benchmark for request latency on the async database stack versus a sync one.
+
+Seeds a throwaway SQLite database, then sends bursts of concurrent requests
+for one business's booked slots (an uncached, database-bound endpoint). The
+same query is served two ways:
+
+- async: the real /public/businesses/{id}/booked-slots route on AsyncSession
+- sync:  an equivalent `def` route on a sync Session, run by FastAPI in its
+  thread pool the way every route was before the async migration
+
+Reports p50 / p99 latency and requests per second for each. Run from the
+backend directory:
+
+    python helper/benchmark_async.py --clients 500 --rounds 3
+
+Point DATABASE_URL at a PostgreSQL database to measure asyncpg instead.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, time as time_of_day
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "benchmark.db"))
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy.orm import Session
+
+import models
+from database import SessionLocal, async_engine, engine
+from main import app as async_app
+
+DAY = date(2025, 1, 6)
+
+
+def seed(appointments: int) -> int:
+    with SessionLocal() as db:
+        business = models.Business(email="bench@example.com", hashed_password="x", business_name="Bench")
+        customer = models.Customer(email="customer@example.com", hashed_password="x", full_name="Customer")
+        db.add_all([business, customer])
+        db.flush()
+        for i in range(appointments):
+            db.add(models.Appointment(
+                appointment_id=f"BENCH{i:04d}", customer_id=customer.id, business_id=business.id,
+                appointment_date=DAY, appointment_time=time_of_day(8 + i % 10, i % 60), status="confirmed"
+            ))
+        db.commit()
+        return business.id
+
+
+def sync_app() -> FastAPI:
+    """The booked-slots route as it looked on the sync stack"""
+    app = FastAPI()
+
+    def get_sync_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @app.get("/public/businesses/{business_id}/booked-slots")
+    def get_booked_slots(business_id: int, date: str, db: Session = Depends(get_sync_db)):
+        db.query(models.Business).filter(models.Business.id == business_id).first()
+        appointments = db.query(models.Appointment).filter(
+            models.Appointment.business_id == business_id,
+            models.Appointment.appointment_date == DAY,
+            models.Appointment.status != 'cancelled'
+        ).all()
+        return {"booked_slots": [str(apt.appointment_time) for apt in appointments]}
+
+    return app
+
+
+async def measure(app: FastAPI, url: str, clients: int, rounds: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def one():
+            started = time.perf_counter()
+            response = await client.get(url)
+            response.raise_for_status()
+            return time.perf_counter() - started
+
+        await one()  # warm up connections and caches
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(rounds):
+            latencies += await asyncio.gather(*(one() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+    return latencies, elapsed
+
+
+def report(name: str, latencies, elapsed: float):
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{name:<6} p50 {quantiles[49] * 1000:8.1f} ms   p99 {quantiles[98] * 1000:8.1f} ms   "
+          f"{len(latencies) / elapsed:8.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, default=500, help="concurrent requests per round")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--appointments", type=int, default=20, help="booked slots returned per request")
+    args = parser.parse_args()
+
+    business_id = seed(args.appointments)
+    url = f"/public/businesses/{business_id}/booked-slots?date={DAY.isoformat()}"
+    print(f"database: {engine.url.get_backend_name()}, {args.clients} concurrent clients x {args.rounds} rounds")
+
+    async def run():
+        report("sync", *await measure(sync_app(), url, args.clients, args.rounds))
+        report("async", *await measure(async_app, url, args.clients, args.rounds))
+        await async_engine.dispose()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Benchmark for radius queries on the spatial index.
+
+Fills a GeoIndex with random businesses across the continental US and
+reports the mean time of a radius query around Dallas. Run from the backend
+directory:
+
+    python helper/benchmark_geo.py --businesses 50000 --radius-km 10
+"""
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from geo import GeoIndex
+
+DALLAS = (32.7767, -96.7970)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--businesses", type=int, default=50000)
+    parser.add_argument("--radius-km", type=float, default=10)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    index = GeoIndex()
+    index.loaded = True
+    for business_id in range(1, args.businesses + 1):
+        index.put(business_id, 25 + rng.random() * 24, -124 + rng.random() * 57)
+
+    found = len(list(index.nearest(*DALLAS, radius_km=args.radius_km)))
+    started = time.perf_counter()
+    for _ in range(args.queries):
+        list(index.nearest(*DALLAS, radius_km=args.radius_km))
+    elapsed = time.perf_counter() - started
+
+    print(f"businesses:     {len(index)}")
+    print(f"radius:         {args.radius_km:g} km ({found} found)")
+    print(f"mean query:     {elapsed / args.queries * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
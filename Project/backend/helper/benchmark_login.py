@@ -0,0 +1,79 @@
+"""
+Benchmark for login throughput through the password hashing pool.
+
+Runs concurrent customer logins against a throwaway in-memory database and
+reports logins per second, overall and per hashing worker (one worker per
+core by default). Run from the backend directory:
+
+    python helper/benchmark_login.py --logins 200 --concurrency 16
+
+Use BCRYPT_ROUNDS and PASSWORD_HASH_WORKERS to compare settings.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+import models
+from auth import authenticate_customer, get_password_hash
+from hashing import BCRYPT_ROUNDS, password_hasher
+
+
+async def run(args):
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with Session() as db:
+        db.add(models.Customer(email="bench@example.com", hashed_password=await get_password_hash("password123"),
+                               full_name="Bench"))
+        await db.commit()
+
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def login():
+        async with slots, Session() as db:
+            try:
+                return "ok" if await authenticate_customer(db, "bench@example.com", "password123") else "failed"
+            except HTTPException as exc:
+                return exc.status_code
+
+    # Start the worker processes before timing
+    await password_hasher.run_async(len, "")
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login() for _ in range(args.logins)))
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+    return results, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    results, elapsed = asyncio.run(run(args))
+
+    succeeded = results.count("ok")
+    workers = max(password_hasher.workers, 1)
+    print(f"bcrypt rounds:      {BCRYPT_ROUNDS}")
+    print(f"hashing workers:    {password_hasher.workers}")
+    print(f"concurrency:        {args.concurrency}")
+    print(f"logins:             {succeeded} ok, {results.count(503)} rejected (503) in {elapsed:.2f}s")
+    print(f"logins/second:      {succeeded / elapsed:.1f}")
+    print(f"logins/second/core: {succeeded / elapsed / workers:.1f}")
+    password_hasher.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Shared pytest fixtures for backend unit tests
+"""
+import contextlib
+import pytest
+import sys
+from pathlib import Path
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Add parent directory to path to import backend modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import models
+
+
+class FakeClock:
+    """Stand-in for time.monotonic or time.time that only moves when told to"""
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    """A FakeClock at 0; tests move it by setting ``clock.now``"""
+    return FakeClock()
+
+
+@pytest.fixture
+def count_queries():
+    """
+    ``with count_queries(engine) as statements:`` records the SQL statements
+    a sync or async engine runs inside the block.
+    """
+    @contextlib.contextmanager
+    def counting(engine):
+        engine = getattr(engine, "sync_engine", engine)
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+    return counting
+
+
+@pytest.fixture
+def db_engine():
+    """In-memory SQLite engine with all tables created"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    models.Base.metadata.create_all(bind=engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def db_session(db_engine):
+    """Session bound to the in-memory test engine"""
+    session = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def anyio_backend():
+    """Run async tests (marked with pytest.mark.anyio) on asyncio only"""
+    return "asyncio"
+
+
+@pytest.fixture
+async def async_db_engine(anyio_backend):
+    """In-memory aiosqlite engine with all tables created"""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+async def async_db_session(async_db_engine):
+    """AsyncSession configured like database.AsyncSessionLocal"""
+    async with async_sessionmaker(async_db_engine, autoflush=False, expire_on_commit=False)() as session:
+        yield session
@@ -0,0 +1,310 @@
+"""
+Pytest tests for the availability engine in availability.py
+"""
+import pytest
+from datetime import date, time
+
+import models
+from invalidation import InvalidationBus
+from availability import (
+    CalendarStore,
+    TICK_MINUTES,
+    compute_availability,
+    free_starts,
+    merge_intervals,
+    tick_mask
+)
+
+
+def add_business(db):
+    business = models.Business(
+        email="salon@example.com",
+        hashed_password="x",
+        business_name="Salon"
+    )
+    db.add(business)
+    db.commit()
+    return business
+
+
+def add_weekday_hours(db, business_id):
+    """Open 09:00-12:00 in 30 minute slots every weekday"""
+    for day_of_week in range(5):
+        db.add(models.TimeSlot(
+            business_id=business_id, day_of_week=day_of_week,
+            start_time=time(9, 0), end_time=time(12, 0), slot_duration_minutes=30
+        ))
+    db.commit()
+
+
+def mask_to_times(mask):
+    """Decode a bookable-start bitmask into times"""
+    return [
+        time(tick * TICK_MINUTES // 60, tick * TICK_MINUTES % 60)
+        for tick in range(mask.bit_length()) if mask >> tick & 1
+    ]
+
+
+def add_customer(db):
+    customer = models.Customer(email="c@example.com", hashed_password="x", full_name="C")
+    db.add(customer)
+    db.commit()
+    return customer
+
+
+class TestIntervalArithmetic:
+    """Test suite for the in-memory interval helpers"""
+
+    def test_merge_intervals_merges_overlapping_and_touching(self):
+        """Test that overlapping and adjacent intervals collapse into one"""
+        assert merge_intervals([(60, 90), (0, 30), (30, 45), (80, 120)]) == [(0, 45), (60, 120)]
+
+    def test_free_starts_steps_through_window(self):
+        """Test that a window is expanded by its step and must fit entirely"""
+        assert free_starts([(540, 630, 30)], []) == [540, 570, 600]
+
+    def test_free_starts_skips_busy_intervals(self):
+        """Test that starts overlapping a busy interval are removed"""
+        assert free_starts([(540, 660, 30)], [(570, 600)]) == [540, 600, 630]
+
+    def test_free_starts_respects_requested_duration(self):
+        """Test that a longer duration rules out starts that would run into a booking"""
+        assert free_starts([(540, 660, 30)], [(600, 630)], duration_minutes=60) == [540]
+
+
+class TestComputeAvailability:
+    """Test suite for compute_availability"""
+
+    def test_expands_slots_for_matching_weekdays_only(self, db_session):
+        """Test that windows apply only to their day_of_week"""
+        business = add_business(db_session)
+        db_session.add(models.TimeSlot(
+            business_id=business.id, day_of_week=0,
+            start_time=time(9, 0), end_time=time(10, 0), slot_duration_minutes=30
+        ))
+        db_session.commit()
+
+        # 2025-01-06 is a Monday
+        result = compute_availability(db_session, business.id, date(2025, 1, 6), date(2025, 1, 7))
+
+        assert result[date(2025, 1, 6)] == [time(9, 0), time(9, 30)]
+        assert result[date(2025, 1, 7)] == []
+
+    def test_subtracts_non_cancelled_appointments(self, db_session):
+        """Test that booked appointments block their interval and cancelled ones do not"""
+        business = add_business(db_session)
+        customer = add_customer(db_session)
+        db_session.add(models.TimeSlot(
+            business_id=business.id, day_of_week=0,
+            start_time=time(9, 0), end_time=time(11, 0), slot_duration_minutes=30
+        ))
+        db_session.add_all([
+            models.Appointment(
+                appointment_id="A1", customer_id=customer.id, business_id=business.id,
+                appointment_date=date(2025, 1, 6), appointment_time=time(9, 0),
+                duration_minutes=60, status="confirmed"
+            ),
+            models.Appointment(
+                appointment_id="A2", customer_id=customer.id, business_id=business.id,
+                appointment_date=date(2025, 1, 6), appointment_time=time(10, 30),
+                duration_minutes=30, status="cancelled"
+            ),
+        ])
+        db_session.commit()
+
+        result = compute_availability(db_session, business.id, date(2025, 1, 6), date(2025, 1, 6))
+
+        assert result[date(2025, 1, 6)] == [time(10, 0), time(10, 30)]
+
+    def test_inactive_slots_are_ignored(self, db_session):
+        """Test that inactive time slots produce no availability"""
+        business = add_business(db_session)
+        db_session.add(models.TimeSlot(
+            business_id=business.id, day_of_week=0,
+            start_time=time(9, 0), end_time=time(10, 0), is_active=False
+        ))
+        db_session.commit()
+
+        result = compute_availability(db_session, business.id, date(2025, 1, 6), date(2025, 1, 6))
+
+        assert result[date(2025, 1, 6)] == []
+
+    def test_query_count_does_not_grow_with_range(self, db_engine, db_session, count_queries):
+        """Test that a 30-day range costs the same number of queries as one day"""
+        business = add_business(db_session)
+        db_session.add(models.TimeSlot(
+            business_id=business.id, day_of_week=2,
+            start_time=time(9, 0), end_time=time(17, 0)
+        ))
+        db_session.commit()
+        business_id = business.id
+
+        with count_queries(db_engine) as statements:
+            result = compute_availability(db_session, business_id, date(2025, 1, 1), date(2025, 1, 30))
+
+        assert len(result) == 30
+        assert len(statements) == 2
+
+
+class TestCalendarStore:
+    """Test suite for the bitmap-backed CalendarStore"""
+
+    def test_tick_mask_covers_partial_ticks(self):
+        """Test that an interval marks every tick it touches"""
+        assert tick_mask(0, 5) == 0b1
+        assert tick_mask(5, 7) == 0b110
+
+    def test_matches_compute_availability(self, db_session):
+        """Test that bitmaps agree with the interval engine over a quarter"""
+        business = add_business(db_session)
+        customer = add_customer(db_session)
+        add_weekday_hours(db_session, business.id)
+        db_session.add(models.Appointment(
+            appointment_id="A1", customer_id=customer.id, business_id=business.id,
+            appointment_date=date(2025, 1, 8), appointment_time=time(9, 30),
+            duration_minutes=45, status="confirmed"
+        ))
+        db_session.commit()
+
+        store = CalendarStore()
+        masks = store.free_masks(db_session, business.id, date(2025, 1, 1), 90)
+        expected = compute_availability(db_session, business.id, date(2025, 1, 1), date(2025, 3, 31))
+
+        assert [mask_to_times(mask) for mask in masks] == list(expected.values())
+        assert mask_to_times(masks[7]) == [time(9, 0), time(10, 30), time(11, 0), time(11, 30)]
+
+    def test_unaligned_times_agree_with_compute_availability(self, db_session):
+        """Test that windows and bookings off the 5-minute grid give the same starts in both engines"""
+        business = add_business(db_session)
+        customer = add_customer(db_session)
+        db_session.add(models.TimeSlot(
+            business_id=business.id, day_of_week=0,
+            start_time=time(9, 7), end_time=time(11, 0), slot_duration_minutes=30
+        ))
+        db_session.add(models.Appointment(
+            appointment_id="A1", customer_id=customer.id, business_id=business.id,
+            appointment_date=date(2025, 1, 6), appointment_time=time(10, 13),
+            duration_minutes=10, status="confirmed"
+        ))
+        db_session.commit()
+
+        expected = compute_availability(db_session, business.id, date(2025, 1, 6), date(2025, 1, 6), 32)
+        masks = CalendarStore().free_masks(db_session, business.id, date(2025, 1, 6), 1, 32)
+
+        # 09:40-10:12 would need the 10:10 tick that the 10:13 booking claims
+        assert expected[date(2025, 1, 6)] == [time(9, 10)]
+        assert mask_to_times(masks[0]) == [time(9, 10)]
+
+    def test_warm_range_issues_no_queries(self, db_engine, db_session, count_queries):
+        """Test that a repeated range is answered entirely from memory"""
+        business = add_business(db_session)
+        add_weekday_hours(db_session, business.id)
+        business_id = business.id
+        store = CalendarStore()
+        store.free_masks(db_session, business_id, date(2025, 1, 1), 90)
+
+        with count_queries(db_engine) as statements:
+            masks = store.free_masks(db_session, business_id, date(2025, 1, 1), 90)
+
+        assert len(masks) == 90
+        assert len(statements) == 0
+
+    @pytest.mark.anyio
+    async def test_book_updates_bitmap_in_place(self, db_engine, db_session, count_queries):
+        """Test that a booking removes its start times without reloading"""
+        business = add_business(db_session)
+        add_weekday_hours(db_session, business.id)
+        business_id = business.id
+        store = CalendarStore()
+        store.free_masks(db_session, business_id, date(2025, 1, 6), 1)
+
+        await store.book(business_id, date(2025, 1, 6), time(9, 0), 60)
+        with count_queries(db_engine) as statements:
+            masks = store.free_masks(db_session, business_id, date(2025, 1, 6), 1)
+
+        assert len(statements) == 0
+        assert mask_to_times(masks[0]) == [time(10, 0), time(10, 30), time(11, 0), time(11, 30)]
+
+    @pytest.mark.anyio
+    async def test_release_reloads_day_from_database(self, db_session):
+        """Test that a released day is rebuilt from the appointments table"""
+        business = add_business(db_session)
+        customer = add_customer(db_session)
+        add_weekday_hours(db_session, business.id)
+        appointment = models.Appointment(
+            appointment_id="A1", customer_id=customer.id, business_id=business.id,
+            appointment_date=date(2025, 1, 6), appointment_time=time(9, 0),
+            duration_minutes=30, status="confirmed"
+        )
+        db_session.add(appointment)
+        db_session.commit()
+        store = CalendarStore()
+        before = store.free_masks(db_session, business.id, date(2025, 1, 6), 1)
+
+        appointment.status = "cancelled"
+        db_session.commit()
+        await store.release(business.id, date(2025, 1, 6))
+        after = store.free_masks(db_session, business.id, date(2025, 1, 6), 1)
+
+        assert time(9, 0) not in mask_to_times(before[0])
+        assert time(9, 0) in mask_to_times(after[0])
+
+    @pytest.mark.anyio
+    async def test_invalidate_picks_up_new_time_slots(self, db_session):
+        """Test that invalidating a business rebuilds its weekly template"""
+        business = add_business(db_session)
+        store = CalendarStore()
+        assert store.free_masks(db_session, business.id, date(2025, 1, 11), 1) == [0]
+
+        db_session.add(models.TimeSlot(
+            business_id=business.id, day_of_week=5,
+            start_time=time(10, 0), end_time=time(11, 0), slot_duration_minutes=60
+        ))
+        db_session.commit()
+        await store.invalidate(business.id)
+
+        masks = store.free_masks(db_session, business.id, date(2025, 1, 11), 1)
+        assert mask_to_times(masks[0]) == [time(10, 0)]
+
+    def test_template_loaded_across_invalidation_is_not_kept(self, db_session, monkeypatch):
+        """Test that time slots changing during a template load do not leave it cached"""
+        import availability
+
+        business = add_business(db_session)
+        store = CalendarStore()
+        load = availability.load_windows
+
+        def racing_load(db, business_id):
+            windows = load(db, business_id)
+            store._invalidate(business_id)
+            return windows
+
+        monkeypatch.setattr(availability, "load_windows", racing_load)
+        store.free_masks(db_session, business.id, date(2025, 1, 6), 1)
+
+        assert business.id not in store
+
+    @pytest.mark.anyio
+    async def test_changes_are_replayed_in_other_workers(self, db_session):
+        """Test that a booking in one worker makes another reload that day"""
+        business = add_business(db_session)
+        add_weekday_hours(db_session, business.id)
+
+        class RecordingClient:
+            messages = []
+
+            async def publish(self, channel, message):
+                self.messages.append(message)
+
+        bus_a, bus_b = InvalidationBus(), InvalidationBus()
+        bus_a.connect(RecordingClient(), listen=False)
+        await bus_a.start()
+        worker_a, worker_b = CalendarStore(bus=bus_a), CalendarStore(bus=bus_b)
+        worker_b.free_masks(db_session, business.id, date(2025, 1, 6), 1)
+
+        await worker_a.book(business.id, date(2025, 1, 6), time(9, 0), 30)
+        await bus_a.close()
+        for message in RecordingClient.messages:
+            bus_b.deliver(message)
+
+        assert date(2025, 1, 6) not in worker_b._calendars[business.id].busy
@@ -0,0 +1,165 @@
+"""
+Pytest tests for the upload storage backends in blobs.py and direct uploads
+"""
+import base64
+import hashlib
+
+import httpx
+import pytest
+from fastapi import BackgroundTasks, HTTPException
+from sqlalchemy import select
+
+import blobs
+import models
+import schemas
+from blobs import BlobStore, LocalBackend, S3Backend
+from routers import upload as upload_router
+
+PNG = bytes.fromhex("89504e470d0a1a0a0000000d49484452") + b"\x00" * 100
+BUCKET = "uploads-test"
+
+
+def png_name(content=PNG):
+    return f"{hashlib.sha256(content).hexdigest()}.png"
+
+
+@pytest.fixture(scope="module")
+def s3_endpoint():
+    moto_server = pytest.importorskip("moto.server")
+    server = moto_server.ThreadedMotoServer(port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield f"http://{host}:{port}"
+    server.stop()
+
+
+@pytest.fixture
+def s3(s3_endpoint, monkeypatch):
+    boto3 = pytest.importorskip("boto3")
+    from botocore.config import Config
+
+    for name, value in {"AWS_ACCESS_KEY_ID": "test", "AWS_SECRET_ACCESS_KEY": "test",
+                        "AWS_DEFAULT_REGION": "us-east-1"}.items():
+        monkeypatch.setenv(name, value)
+    client = boto3.client("s3", endpoint_url=s3_endpoint, config=Config(signature_version="s3v4"))
+    client.create_bucket(Bucket=BUCKET)
+    yield S3Backend(client, BUCKET, "media/")
+    for item in client.list_objects_v2(Bucket=BUCKET).get("Contents", ()):
+        client.delete_object(Bucket=BUCKET, Key=item["Key"])
+
+
+class TestLocalBackend:
+    """Test suite for files on local disk"""
+
+    def test_put_stat_list_delete(self, tmp_path):
+        """Test that a temporary file is moved into place and can be listed and removed"""
+        backend = LocalBackend(tmp_path / "blobs")
+        temp_path = backend.spool_dir / ".upload-1.part"
+        temp_path.write_bytes(PNG)
+
+        backend.put(temp_path, png_name(), "image/png")
+
+        assert not temp_path.exists()
+        assert backend.stat(png_name()).size == len(PNG)
+        assert backend.stat("missing.png") is None
+        assert backend.read(png_name(), 8) == PNG[:8]
+        assert backend.sha256(png_name()) == hashlib.sha256(PNG).hexdigest()
+        assert [name for name, _ in backend.list()] == [png_name()]
+        backend.delete([png_name(), "missing.png"])
+        assert list(backend.list()) == []
+
+
+class TestS3Backend:
+    """Test suite for objects in an S3-compatible bucket"""
+
+    @pytest.mark.anyio
+    async def test_round_trip(self, s3, tmp_path):
+        """Test that an upload is stored under the prefix and read back, hashed, copied and deleted"""
+        store = BlobStore(s3)
+        temp_path = tmp_path / ".upload-1.part"
+        temp_path.write_bytes(PNG)
+
+        await store.put(temp_path, png_name(), "image/png")
+
+        assert not temp_path.exists()
+        head = s3.client.head_object(Bucket=BUCKET, Key=f"media/{png_name()}")
+        assert (head["ContentType"], head["CacheControl"]) == ("image/png", blobs.IMMUTABLE)
+        info = await store.stat(png_name())
+        assert info.size == len(PNG)
+        assert await store.stat("missing.png") is None
+        assert await store.read(png_name(), 8) == PNG[:8]
+        assert await store.sha256(png_name()) == hashlib.sha256(PNG).hexdigest()
+        async with store.local_copy(png_name()) as path:
+            assert path.read_bytes() == PNG
+        assert not path.exists()
+        assert [name for name, _ in s3.list()] == [png_name()]
+
+        await store.delete([png_name()])
+        assert list(s3.list()) == []
+
+    def test_presigned_urls(self, s3):
+        """Test that a client can PUT to the upload URL with its headers and GET the download URL"""
+        sha256 = hashlib.sha256(PNG).hexdigest()
+        url, headers = s3.upload_url(png_name(), "image/png", len(PNG), sha256)
+
+        assert headers["x-amz-checksum-sha256"] == base64.b64encode(bytes.fromhex(sha256)).decode()
+        assert "X-Amz-Signature" in url
+        assert httpx.put(url, content=PNG, headers=headers).status_code == 200
+        assert httpx.get(s3.download_url(png_name())).content == PNG
+
+
+class TestDirectUpload:
+    """Test suite for presigned uploads and their completion"""
+
+    @pytest.fixture
+    async def business(self, async_db_session):
+        business = models.Business(email="direct@example.com", hashed_password="x", business_name="Direct")
+        async_db_session.add(business)
+        await async_db_session.commit()
+        return business
+
+    async def complete(self, db, business, filename):
+        return await upload_router.complete_direct_upload(
+            schemas.DirectUploadComplete(kind="cover", filename=filename), BackgroundTasks(), business, db
+        )
+
+    @pytest.mark.anyio
+    async def test_local_storage_has_no_direct_uploads(self, tmp_path, business, monkeypatch):
+        """Test that presigning is refused when files are stored on disk"""
+        monkeypatch.setattr(blobs.blob_store, "backend", LocalBackend(tmp_path))
+        request = schemas.DirectUploadRequest(
+            kind="profile", content_type="image/png", size=len(PNG), sha256=hashlib.sha256(PNG).hexdigest()
+        )
+
+        with pytest.raises(HTTPException) as error:
+            await upload_router.create_direct_upload(request, business)
+        assert error.value.status_code == 501
+
+    @pytest.mark.anyio
+    async def test_completed_upload_becomes_the_image(self, s3, business, async_db_session, monkeypatch):
+        """Test that a verified direct upload is referenced like an upload through the API"""
+        monkeypatch.setattr(blobs.blob_store, "backend", s3)
+        request = schemas.DirectUploadRequest(
+            kind="cover", content_type="image/png", size=len(PNG), sha256=hashlib.sha256(PNG).hexdigest()
+        )
+        direct = await upload_router.create_direct_upload(request, business)
+        assert httpx.put(direct.url, content=PNG, headers=direct.headers).status_code == 200
+
+        response = await self.complete(async_db_session, business, direct.filename)
+
+        assert response["filename"] == business.cover_image == png_name()
+        stored = await async_db_session.scalar(select(models.StoredFile))
+        assert (stored.filename, stored.refcount, stored.size) == (png_name(), 1, len(PNG))
+
+    @pytest.mark.anyio
+    async def test_content_must_match_the_name(self, s3, business, async_db_session, monkeypatch):
+        """Test that missing objects, other content and other types are rejected"""
+        monkeypatch.setattr(blobs.blob_store, "backend", s3)
+        s3.client.put_object(Bucket=BUCKET, Key=f"media/{png_name()}", Body=PNG + b"tampered")
+        s3.client.put_object(Bucket=BUCKET, Key=f"media/{png_name(b'text')}", Body=b"text")
+
+        for filename, status_code in [(png_name(b"absent"), 404), (png_name(), 422), (png_name(b"text"), 415)]:
+            with pytest.raises(HTTPException) as error:
+                await self.complete(async_db_session, business, filename)
+            assert error.value.status_code == status_code
+        assert business.cover_image is None
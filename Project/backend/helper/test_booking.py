@@ -0,0 +1,393 @@
+"""
+Pytest tests for double-booking prevention in booking.py
+"""
+import asyncio
+import random
+from datetime import date, time
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+import booking
+import models
+import schemas
+from connections import PoolMetrics
+from database import AsyncSessionLocal, create_request_engine
+from routers.business import update_appointment_statuses
+from routers.customer import create_appointments
+
+DAY = date(2030, 1, 7)
+
+
+@pytest.fixture
+async def file_engine(tmp_path, anyio_backend):
+    """Pooled aiosqlite engine on a file, configured like the app's"""
+    engine = create_request_engine(f"sqlite:///{tmp_path / 'booking.db'}", PoolMetrics())
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+        await conn.execute(models.Business.__table__.insert().values(
+            id=1, email="b@example.com", hashed_password="x", business_name="B"
+        ))
+        await conn.execute(models.Customer.__table__.insert().values(
+            id=1, email="c@example.com", hashed_password="x", full_name="C"
+        ))
+    yield engine
+    await engine.dispose()
+
+
+def appointment(start: time, duration: int = 30, status: str = "confirmed", appointment_id=None):
+    return models.Appointment(
+        appointment_id=appointment_id or f"A{random.getrandbits(40):010X}",
+        customer_id=1,
+        business_id=1,
+        appointment_date=DAY,
+        appointment_time=start,
+        duration_minutes=duration,
+        status=status
+    )
+
+
+async def book(engine, start: time, duration: int = 30):
+    """Book in a fresh session; returns the appointment or None on a 409"""
+    async with AsyncSessionLocal(bind=engine) as db:
+        db_appointment = appointment(start, duration)
+        db.add(db_appointment)
+        try:
+            await booking.commit_booking(db, db_appointment)
+        except HTTPException as error:
+            assert error.status_code == 409
+            return None
+        return db_appointment
+
+
+class TestTicks:
+    """Test suite for the ticks an appointment claims"""
+
+    def test_ticks_cover_the_whole_duration(self):
+        """Test that a 30 minute appointment claims six 5 minute ticks"""
+        assert booking.ticks(time(9, 0), 30) == range(108, 114)
+
+    def test_partial_tick_is_claimed(self):
+        """Test that an appointment ending mid-tick still claims that tick"""
+        assert booking.ticks(time(9, 2), 5) == range(108, 110)
+
+    def test_cancelled_appointment_claims_nothing(self):
+        """Test that non-blocking statuses hold no time"""
+        assert booking.claims_for(appointment(time(9, 0), status="cancelled")) == []
+
+
+class TestClaims:
+    """Test suite for commit_booking"""
+
+    @pytest.mark.anyio
+    async def test_overlapping_booking_conflicts(self, file_engine):
+        """Test that a booking overlapping a live one is rejected"""
+        assert await book(file_engine, time(9, 0)) is not None
+
+        assert await book(file_engine, time(9, 0)) is None
+        assert await book(file_engine, time(8, 45)) is None
+        assert await book(file_engine, time(9, 30)) is not None
+
+    @pytest.mark.anyio
+    async def test_cancelling_frees_the_time(self, file_engine):
+        """Test that re-claiming a cancelled appointment releases its ticks"""
+        first = await book(file_engine, time(9, 0))
+        async with AsyncSessionLocal(bind=file_engine) as db:
+            db_appointment = await db.get(models.Appointment, first.id)
+            db_appointment.status = "cancelled"
+            await booking.commit_booking(db, db_appointment)
+
+        assert await book(file_engine, time(9, 0)) is not None
+
+    @pytest.mark.anyio
+    async def test_reschedule_may_overlap_its_own_time(self, file_engine):
+        """Test that moving an appointment by less than its length does not conflict with itself"""
+        first = await book(file_engine, time(9, 0))
+        async with AsyncSessionLocal(bind=file_engine) as db:
+            db_appointment = await db.get(models.Appointment, first.id)
+            db_appointment.appointment_time = time(9, 15)
+            await booking.commit_booking(db, db_appointment)
+
+        assert await book(file_engine, time(9, 0), duration=15) is not None
+        assert await book(file_engine, time(9, 40)) is None
+
+    @pytest.mark.anyio
+    async def test_other_integrity_errors_are_not_conflicts(self, file_engine):
+        """Test that a duplicate appointment ID is re-raised for the caller to retry"""
+        await book(file_engine, time(9, 0))
+        async with AsyncSessionLocal(bind=file_engine) as db:
+            taken_id = await db.scalar(select(models.Appointment.appointment_id))
+            db_appointment = appointment(time(10, 0), appointment_id=taken_id)
+            db.add(db_appointment)
+            with pytest.raises(IntegrityError):
+                await booking.commit_booking(db, db_appointment)
+
+
+class TestConcurrentBookings:
+    """Stress test: many parallel bookings of a few hot slots"""
+
+    @pytest.mark.anyio
+    async def test_parallel_bookings_never_overlap(self, file_engine):
+        """Test that 2000 concurrent bookings of overlapping slots leave no double booking"""
+        hot_starts = [time(9, minute) for minute in (0, 10, 15, 20, 30, 45)]
+        attempts = [(random.choice(hot_starts), random.choice((15, 30, 45))) for _ in range(2000)]
+
+        results = await asyncio.gather(*(book(file_engine, start, duration) for start, duration in attempts))
+
+        booked = [result for result in results if result is not None]
+        assert booked
+        intervals = sorted(
+            (start.hour * 60 + start.minute, start.hour * 60 + start.minute + duration)
+            for start, duration in ((a.appointment_time, a.duration_minutes) for a in booked)
+        )
+        for (_, end), (next_start, _) in zip(intervals, intervals[1:]):
+            assert end <= next_start
+        async with AsyncSessionLocal(bind=file_engine) as db:
+            stored = await db.scalar(select(func.count()).select_from(models.Appointment))
+        assert stored == len(booked)
+
+
+class TestInitClaims:
+    """Test suite for claiming appointments booked before slot claims existed"""
+
+    def test_upcoming_appointments_are_claimed(self, db_session, db_engine):
+        """Test that legacy bookings get claims and a legacy double booking is left alone"""
+        db_session.add_all([
+            models.Business(id=1, email="b@example.com", hashed_password="x", business_name="B"),
+            models.Customer(id=1, email="c@example.com", hashed_password="x", full_name="C"),
+        ])
+        first = appointment(time(9, 0), appointment_id="FIRST")
+        overlapping = appointment(time(9, 0), appointment_id="SECOND")
+        past = appointment(time(9, 0), appointment_id="PAST")
+        past.appointment_date = date(2000, 1, 3)
+        db_session.add_all([first, overlapping, past])
+        db_session.commit()
+
+        assert booking.init_claims(db_engine) == 6
+        assert booking.init_claims(db_engine) == 0
+        claimed = db_session.scalars(select(models.SlotClaim.appointment_id).distinct()).all()
+        assert claimed == [first.id]
+
+
+@pytest.fixture
+async def accounts(async_db_session):
+    business = models.Business(email="b@example.com", hashed_password="x", business_name="B")
+    customer = models.Customer(email="c@example.com", hashed_password="x", full_name="C")
+    async_db_session.add_all([business, customer])
+    await async_db_session.commit()
+    return business, customer
+
+
+def batch_booking(start: time, business_id: int = 1, duration: int = 30):
+    return schemas.AppointmentCreate(
+        business_id=business_id, appointment_date=DAY, appointment_time=start, duration_minutes=duration
+    )
+
+
+def claim_after_check(monkeypatch, db, start: time, always: bool = False, also=None):
+    """
+    Have another booking claim ``start`` right after the first `conflicts`
+    check, as a worker committing between a batch's check and its commit
+    would. ``also`` is awaited to make more changes in that commit. With
+    ``always``, every check misses the claim.
+    """
+    check = booking.conflicts
+    calls = []
+
+    async def racing_conflicts(session, slots):
+        clashing = set() if always and calls else await check(session, slots)
+        if not calls:
+            rival = appointment(start)
+            db.add(rival)
+            await db.flush()
+            await db.execute(insert(models.SlotClaim), booking.claim_rows(booking.Slot(1, DAY, start, 30), rival.id))
+            if also is not None:
+                await also()
+            await db.commit()
+        calls.append(slots)
+        return clashing
+
+    monkeypatch.setattr(booking, "conflicts", racing_conflicts)
+    return calls
+
+
+class TestBatchEndpoints:
+    """Test suite for the batch booking and batch status endpoints"""
+
+    @pytest.mark.anyio
+    async def test_batch_booking_reports_each_item(self, async_db_session, accounts):
+        """Test that valid bookings are created together and the rest reported"""
+        _, customer = accounts
+        batch = schemas.AppointmentCreateBatch(appointments=[
+            batch_booking(time(9, 0)),
+            batch_booking(time(9, 15)),  # overlaps the first
+            batch_booking(time(10, 0), business_id=99),
+            batch_booking(time(10, 0)),
+        ])
+
+        response = await create_appointments(batch, current_customer=customer, db=async_db_session)
+
+        codes = [result["status_code"] for result in response["results"]]
+        assert codes == [200, 409, 404, 200]
+        claims = await async_db_session.scalar(select(func.count()).select_from(models.SlotClaim))
+        assert claims == 12
+
+    @pytest.mark.anyio
+    async def test_batch_status_update_applies_valid_items(self, async_db_session, accounts):
+        """Test that statuses are validated in one pass and applied with one transaction"""
+        business, customer = accounts
+        booked = await create_appointments(
+            schemas.AppointmentCreateBatch(appointments=[batch_booking(time(9, 0)), batch_booking(time(10, 0))]),
+            current_customer=customer,
+            db=async_db_session
+        )
+        first, second = (result["appointment"].id for result in booked["results"])
+        batch = schemas.AppointmentStatusBatch(updates=[
+            schemas.AppointmentStatusChange(id=first, status="completed", business_note="Done"),
+            schemas.AppointmentStatusChange(id=second, status="cancelled"),
+            schemas.AppointmentStatusChange(id=second, status="confirmed"),
+            schemas.AppointmentStatusChange(id=999, status="confirmed"),
+            schemas.AppointmentStatusChange(id=first, status="bogus"),
+        ])
+
+        response = await update_appointment_statuses(batch, current_business=business, db=async_db_session)
+
+        results = response["results"]
+        assert [result["status_code"] for result in results] == [200, 200, 400, 404, 400]
+        assert results[0]["appointment"].business_note == "Done"
+        assert results[1]["appointment"].status == "cancelled"
+        owners = set(await async_db_session.scalars(select(models.SlotClaim.appointment_id)))
+        assert owners == {first}
+
+    @pytest.mark.anyio
+    async def test_reopening_taken_time_conflicts(self, async_db_session, accounts):
+        """Test that a cancelled appointment cannot be reopened over a newer booking"""
+        business, customer = accounts
+        booked = await create_appointments(
+            schemas.AppointmentCreateBatch(appointments=[batch_booking(time(9, 0))]),
+            current_customer=customer,
+            db=async_db_session
+        )
+        cancelled = booked["results"][0]["appointment"].id
+        await update_appointment_statuses(
+            schemas.AppointmentStatusBatch(updates=[schemas.AppointmentStatusChange(id=cancelled, status="cancelled")]),
+            current_business=business,
+            db=async_db_session
+        )
+        await create_appointments(
+            schemas.AppointmentCreateBatch(appointments=[batch_booking(time(9, 10))]),
+            current_customer=customer,
+            db=async_db_session
+        )
+
+        response = await update_appointment_statuses(
+            schemas.AppointmentStatusBatch(updates=[schemas.AppointmentStatusChange(id=cancelled, status="confirmed")]),
+            current_business=business,
+            db=async_db_session
+        )
+
+        assert response["results"][0]["status_code"] == 409
+
+    @pytest.mark.anyio
+    async def test_batch_booking_rechecks_after_losing_a_race(self, async_db_session, accounts, monkeypatch):
+        """Test that time claimed between the check and the commit fails only the bookings that clash"""
+        _, customer = accounts
+        calls = claim_after_check(monkeypatch, async_db_session, time(9, 0))
+
+        response = await create_appointments(
+            schemas.AppointmentCreateBatch(appointments=[batch_booking(time(9, 0)), batch_booking(time(11, 0))]),
+            current_customer=customer,
+            db=async_db_session
+        )
+
+        assert [result["status_code"] for result in response["results"]] == [409, 200]
+        assert len(calls) == 2
+        assert await async_db_session.scalar(select(func.count()).select_from(models.Appointment)) == 2
+
+    @pytest.mark.anyio
+    async def test_batch_status_update_rechecks_after_losing_a_race(self, async_db_session, accounts, monkeypatch):
+        """Test that reopening time claimed between the check and the commit fails only that item"""
+        business, customer = accounts
+        booked = await create_appointments(
+            schemas.AppointmentCreateBatch(appointments=[batch_booking(time(9, 0)), batch_booking(time(11, 0))]),
+            current_customer=customer,
+            db=async_db_session
+        )
+        ids = [result["appointment"].id for result in booked["results"]]
+        await update_appointment_statuses(
+            schemas.AppointmentStatusBatch(updates=[
+                schemas.AppointmentStatusChange(id=appointment_id, status="cancelled") for appointment_id in ids
+            ]),
+            current_business=business,
+            db=async_db_session
+        )
+        claim_after_check(monkeypatch, async_db_session, time(9, 0))
+
+        response = await update_appointment_statuses(
+            schemas.AppointmentStatusBatch(updates=[
+                schemas.AppointmentStatusChange(id=appointment_id, status="confirmed") for appointment_id in ids
+            ]),
+            current_business=business,
+            db=async_db_session
+        )
+
+        assert [result["status_code"] for result in response["results"]] == [409, 200]
+        assert response["results"][1]["appointment"].status == "confirmed"
+
+    @pytest.mark.anyio
+    async def test_batch_status_update_rereads_rows_after_losing_a_race(self, async_db_session, accounts, monkeypatch):
+        """Test that a status changed by another request during the race is seen on the retry"""
+        business, customer = accounts
+        booked = await create_appointments(
+            schemas.AppointmentCreateBatch(appointments=[batch_booking(time(9, 0)), batch_booking(time(11, 0))]),
+            current_customer=customer,
+            db=async_db_session
+        )
+        reopened, confirmed = [result["appointment"].id for result in booked["results"]]
+        await update_appointment_statuses(
+            schemas.AppointmentStatusBatch(updates=[schemas.AppointmentStatusChange(id=reopened, status="cancelled")]),
+            current_business=business,
+            db=async_db_session
+        )
+
+        async def cancel_elsewhere():
+            # What PATCH /business/appointments/{id}/status does for a cancellation
+            await async_db_session.execute(
+                update(models.Appointment).where(models.Appointment.id == confirmed).values(status="cancelled")
+            )
+            await async_db_session.execute(delete(models.SlotClaim).where(models.SlotClaim.appointment_id == confirmed))
+
+        claim_after_check(monkeypatch, async_db_session, time(9, 0), also=cancel_elsewhere)
+
+        response = await update_appointment_statuses(
+            schemas.AppointmentStatusBatch(updates=[
+                schemas.AppointmentStatusChange(id=reopened, status="confirmed"),
+                schemas.AppointmentStatusChange(id=confirmed, status="confirmed"),
+            ]),
+            current_business=business,
+            db=async_db_session
+        )
+
+        assert [result["status_code"] for result in response["results"]] == [409, 200]
+        owners = set(await async_db_session.scalars(
+            select(models.SlotClaim.appointment_id).where(models.SlotClaim.appointment_id.in_([reopened, confirmed]))
+        ))
+        assert owners == {confirmed}
+
+    @pytest.mark.anyio
+    async def test_batch_fails_whole_after_losing_every_race(self, async_db_session, accounts, monkeypatch):
+        """Test that a batch that keeps losing the race gets one 409 after BATCH_ATTEMPTS checks"""
+        _, customer = accounts
+        calls = claim_after_check(monkeypatch, async_db_session, time(9, 0), always=True)
+
+        with pytest.raises(HTTPException) as error:
+            await create_appointments(
+                schemas.AppointmentCreateBatch(appointments=[batch_booking(time(9, 0)), batch_booking(time(11, 0))]),
+                current_customer=customer,
+                db=async_db_session
+            )
+
+        assert error.value.status_code == 409
+        assert len(calls) == booking.BATCH_ATTEMPTS
@@ -0,0 +1,278 @@
+"""
+Pytest tests for the response cache in cache.py
+"""
+import asyncio
+import json
+import time
+from typing import List
+
+import pytest
+from fastapi import HTTPException
+
+import models
+import schemas
+import cache
+from cache import MemoryBackend, RedisBackend, ResponseCache, init_cache, render, business_tag, SEARCH_TAG
+from invalidation import InvalidationBus
+
+
+class TestResponseCache:
+    """Test suite for ResponseCache"""
+
+    @pytest.mark.anyio
+    async def test_hit_after_set(self):
+        """Test that a stored body is returned and counted as a hit"""
+        cache = ResponseCache()
+        assert await cache.get("a") is None
+        await cache.set("a", b"[1]")
+
+        assert await cache.get("a") == b"[1]"
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    @pytest.mark.anyio
+    async def test_entries_expire_after_ttl(self, clock):
+        """Test that an entry older than the TTL is a miss"""
+        cache = ResponseCache(MemoryBackend(clock=clock), ttl_seconds=10)
+        await cache.set("a", b"x")
+
+        clock.now = 9.9
+        assert await cache.get("a") == b"x"
+        clock.now = 10
+        assert await cache.get("a") is None
+        assert cache.backend.expirations == 1
+        assert (await cache.stats())["bytes"] == 0
+
+    @pytest.mark.anyio
+    async def test_least_recently_used_is_evicted_over_budget(self):
+        """Test that the memory budget evicts the coldest entries first"""
+        cache = ResponseCache(MemoryBackend(max_bytes=10))
+        await cache.set("a", b"aaaa")
+        await cache.set("b", b"bbbb")
+        await cache.get("a")
+        await cache.set("c", b"cccc")
+
+        assert await cache.get("b") is None
+        assert await cache.get("a") == b"aaaa"
+        assert await cache.get("c") == b"cccc"
+        assert cache.backend.evictions == 1
+        assert (await cache.stats())["bytes"] == 8
+
+    @pytest.mark.anyio
+    async def test_oversized_body_is_not_stored(self):
+        """Test that a body larger than the whole budget is skipped"""
+        cache = ResponseCache(MemoryBackend(max_bytes=4))
+        await cache.set("a", b"12345")
+
+        assert await cache.get("a") is None
+        assert cache.backend.evictions == 0
+
+    @pytest.mark.anyio
+    async def test_invalidate_drops_only_tagged_entries(self):
+        """Test that invalidation is precise to the tags given"""
+        cache = ResponseCache()
+        await cache.set(("business", 1), b"1", tags=[business_tag(1)])
+        await cache.set(("business", 2), b"2", tags=[business_tag(2)])
+        await cache.set(("search", None), b"s", tags=[SEARCH_TAG])
+
+        await cache.invalidate(business_tag(1), SEARCH_TAG)
+
+        assert await cache.get(("business", 1)) is None
+        assert await cache.get(("search", None)) is None
+        assert await cache.get(("business", 2)) == b"2"
+        assert cache.backend.invalidations == 2
+
+    @pytest.mark.anyio
+    async def test_stale_body_is_not_stored_after_concurrent_invalidation(self):
+        """Test that a response built before an invalidation is discarded"""
+        cache = ResponseCache()
+        _, generation = await cache.lookup("a")
+        await cache.invalidate(business_tag(1))
+        await cache.set("a", b"old", tags=[business_tag(1)], generation=generation)
+
+        assert await cache.get("a") is None
+
+
+class TestRespond:
+    """Test suite for ResponseCache.respond"""
+
+    @pytest.mark.anyio
+    async def test_builds_once_then_serves_bytes(self, db_session):
+        """Test that ORM results are rendered once and then served from cache"""
+        db_session.add(models.Service(business_id=1, name="Cut", price=20.0))
+        db_session.commit()
+        calls = []
+
+        async def produce():
+            calls.append(1)
+            return db_session.query(models.Service).all()
+
+        cache = ResponseCache()
+        first = await cache.respond("services", List[schemas.Service], produce)
+        second = await cache.respond("services", List[schemas.Service], produce)
+
+        assert len(calls) == 1
+        assert first.headers["X-Cache"] == "MISS"
+        assert second.headers["X-Cache"] == "HIT"
+        assert second.body == first.body
+        assert json.loads(second.body)[0]["name"] == "Cut"
+
+    @pytest.mark.anyio
+    async def test_errors_are_not_cached(self):
+        """Test that an HTTPException from produce propagates and is not stored"""
+        cache = ResponseCache()
+
+        async def missing():
+            raise HTTPException(status_code=404, detail="Business not found")
+
+        with pytest.raises(HTTPException):
+            await cache.respond("business", schemas.Business, missing)
+        assert (await cache.stats())["entries"] == 0
+
+    def test_render_matches_response_model(self):
+        """Test that rendered JSON has the same fields as the response model"""
+        body = render(schemas.Page[schemas.TimeSlot], {"items": [], "next_cursor": None})
+        assert json.loads(body) == {"items": [], "next_cursor": None}
+
+
+async def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        await asyncio.sleep(0.02)
+    return condition()
+
+
+class TestSharedCache:
+    """Test suite for the Redis backend and cross-worker invalidation"""
+
+    @pytest.fixture(autouse=True)
+    def _server(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        self.server = fakeredis.FakeServer()
+        self.client = lambda: fakeredis.FakeAsyncRedis(server=self.server)
+
+    @pytest.mark.anyio
+    async def test_workers_share_entries_and_invalidations(self):
+        """Test that one worker's response is served and invalidated for another"""
+        worker_a = ResponseCache(RedisBackend(self.client()))
+        worker_b = ResponseCache(RedisBackend(self.client()))
+        await worker_a.set(("business", 1), b"{}", tags=[business_tag(1)])
+
+        assert await worker_b.get(("business", 1)) == b"{}"
+        await worker_b.invalidate(business_tag(1))
+        assert await worker_a.get(("business", 1)) is None
+        assert worker_b.backend.invalidations == 1
+
+    @pytest.mark.anyio
+    async def test_stale_body_is_not_stored_after_invalidation_elsewhere(self):
+        """Test that the shared generation counter guards against stale writes"""
+        worker_a = ResponseCache(RedisBackend(self.client()))
+        worker_b = ResponseCache(RedisBackend(self.client()))
+        _, generation = await worker_a.lookup("search")
+        await worker_b.invalidate(SEARCH_TAG)
+        await worker_a.set("search", b"old", tags=[SEARCH_TAG], generation=generation)
+
+        assert await worker_b.get("search") is None
+
+    @pytest.mark.anyio
+    async def test_respond_makes_one_lookup_per_request(self, monkeypatch):
+        """Test that the body and generation come back from a single command"""
+        cache = ResponseCache(RedisBackend(self.client()))
+        commands = []
+        execute = cache.backend.client.execute_command
+
+        async def recording(*args, **options):
+            commands.append(args[0])
+            return await execute(*args, **options)
+
+        monkeypatch.setattr(cache.backend.client, "execute_command", recording)
+
+        async def produce():
+            return {"items": [], "next_cursor": None}
+
+        miss = await cache.respond("page", schemas.Page[schemas.TimeSlot], produce)
+        hit = await cache.respond("page", schemas.Page[schemas.TimeSlot], produce)
+
+        assert (miss.headers["X-Cache"], hit.headers["X-Cache"]) == ("MISS", "HIT")
+        assert commands == ["MGET", "MGET"]
+
+    @pytest.mark.anyio
+    async def test_memory_backends_are_invalidated_over_the_bus(self):
+        """Test that an invalidation in one worker drops the other's local copy"""
+        bus_a, bus_b = InvalidationBus(), InvalidationBus()
+        worker_a = ResponseCache(bus=bus_a)
+        worker_b = ResponseCache(bus=bus_b)
+        bus_a.connect(self.client(), listen=False)
+        bus_b.connect(self.client())
+        await bus_a.start()
+        await bus_b.start()
+        try:
+            await worker_b.set(("business", 1), b"{}", tags=[business_tag(1)])
+            await worker_a.invalidate(business_tag(1))
+            await bus_a.flush()
+
+            assert await wait_for(lambda: worker_b.backend.invalidations == 1)
+            assert await worker_b.get(("business", 1)) is None
+            assert bus_a.sent == 1
+        finally:
+            await bus_a.close()
+            await bus_b.close()
+
+    @pytest.mark.anyio
+    async def test_publish_from_threads_and_before_start(self):
+        """Test that messages from worker threads, or queued before start, are delivered"""
+        bus_a, bus_b = InvalidationBus(), InvalidationBus()
+        seen = []
+        bus_b.subscribe("files.invalidate", lambda *names: seen.extend(names))
+        bus_a.connect(self.client(), listen=False)
+        bus_b.connect(self.client())
+        await bus_b.start()
+        try:
+            bus_a.publish("files.invalidate", "early.png")
+            await bus_a.start()
+            await asyncio.to_thread(bus_a.publish, "files.invalidate", "sweeper.png")
+            await bus_a.flush()
+
+            assert await wait_for(lambda: len(seen) == 2)
+            assert seen == ["early.png", "sweeper.png"]
+        finally:
+            await bus_a.close()
+            await bus_b.close()
+
+    @pytest.mark.anyio
+    async def test_cache_url_shares_cache_and_messages_across_workers(self, monkeypatch):
+        """Test that init_cache with a URL wires the async client into the cache and the bus"""
+        import redis.asyncio
+
+        monkeypatch.setattr(redis.asyncio.Redis, "from_url", lambda url: self.client())
+        monkeypatch.setattr(cache, "response_cache", ResponseCache(bus=InvalidationBus()))
+        monkeypatch.setattr(cache, "bus", cache.response_cache.bus)
+        other_worker = InvalidationBus()
+        seen = []
+        other_worker.subscribe("cache.invalidate", lambda *tags: seen.extend(tags))
+        other_worker.connect(self.client())
+        await other_worker.start()
+
+        init_cache("redis://cache:6379/0", workers=4)
+        await cache.bus.start()
+        try:
+            assert isinstance(cache.response_cache.backend, RedisBackend)
+            await cache.response_cache.set("search", b"[]", tags=[SEARCH_TAG])
+            assert await ResponseCache(RedisBackend(self.client())).get("search") == b"[]"
+
+            cache.bus.publish("cache.invalidate", SEARCH_TAG)
+            await cache.bus.flush()
+            assert await wait_for(lambda: seen == [SEARCH_TAG])
+            assert cache.bus.stats()["sent"] == 1
+        finally:
+            await cache.bus.close()
+            await other_worker.close()
+
+    def test_bus_ignores_own_messages(self):
+        """Test that a worker does not re-apply its own invalidation"""
+        bus = InvalidationBus()
+        seen = []
+        bus.subscribe("t", lambda *args: seen.append(args))
+
+        assert not bus.deliver(json.dumps({"origin": bus.origin, "topic": "t", "args": [1]}))
+        assert bus.deliver(json.dumps({"origin": "other", "topic": "t", "args": [1]}))
+        assert seen == [(1,)]
@@ -0,0 +1,135 @@
+"""
+Pytest tests for conditional request handling in conditional.py
+"""
+import time
+from datetime import datetime
+
+import pytest
+from fastapi import Request, Response
+
+import models
+import schemas
+import conditional
+from cache import ResponseCache
+
+
+def make_request(**headers):
+    return Request({
+        "type": "http",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]
+    })
+
+
+def add_service(db, name="Cut"):
+    service = models.Service(business_id=1, name=name, price=20.0)
+    db.add(service)
+    db.commit()
+    return service
+
+
+class TestValidators:
+    """Test suite for ETag / Last-Modified computation"""
+
+    def test_etag_changes_when_a_row_is_updated(self, db_session):
+        """Test that updating a row bumps updated_at and therefore the ETag"""
+        service = add_service(db_session)
+        before, _ = conditional.validators([service])
+        assert conditional.validators([service])[0] == before
+
+        time.sleep(0.001)
+        service.price = 25.0
+        db_session.commit()
+
+        assert conditional.validators([service])[0] != before
+
+    def test_etag_changes_when_a_row_leaves_the_list(self, db_session):
+        """Test that deletions change a collection's ETag"""
+        first, second = add_service(db_session, "A"), add_service(db_session, "B")
+
+        assert conditional.validators([first, second])[0] != conditional.validators([first])[0]
+
+    def test_last_modified_is_newest_row(self, db_session):
+        """Test that Last-Modified is the latest updated_at in the response"""
+        service = add_service(db_session)
+        service.updated_at = datetime(2025, 3, 4, 5, 6, 7, 890)
+
+        assert conditional.validators([service])[1] == "Tue, 04 Mar 2025 05:06:07 GMT"
+
+
+class TestIsNotModified:
+    """Test suite for request precondition evaluation"""
+
+    def test_if_none_match_accepts_lists_and_weak_tags(self):
+        """Test that any listed tag, weak or strong, matches"""
+        assert conditional.is_not_modified(make_request(if_none_match='"x", W/"abc"'), '"abc"', None)
+        assert conditional.is_not_modified(make_request(if_none_match="*"), '"abc"', None)
+        assert not conditional.is_not_modified(make_request(if_none_match='"x"'), '"abc"', None)
+
+    def test_if_modified_since_is_ignored_when_if_none_match_is_present(self):
+        """Test that If-None-Match takes precedence"""
+        request = make_request(if_none_match='"old"', if_modified_since="Wed, 01 Jan 2031 00:00:00 GMT")
+        assert not conditional.is_not_modified(request, '"new"', "Tue, 04 Mar 2025 05:06:07 GMT")
+
+    def test_if_modified_since(self):
+        """Test date comparison at one-second resolution"""
+        last_modified = "Tue, 04 Mar 2025 05:06:07 GMT"
+        assert conditional.is_not_modified(make_request(if_modified_since=last_modified), '"a"', last_modified)
+        assert not conditional.is_not_modified(
+            make_request(if_modified_since="Tue, 04 Mar 2025 05:06:06 GMT"), '"a"', last_modified
+        )
+        assert not conditional.is_not_modified(make_request(if_modified_since="garbage"), '"a"', last_modified)
+
+    def test_check_stamps_headers_or_returns_304(self, db_session):
+        """Test the helper used by endpoints that return data directly"""
+        service = add_service(db_session)
+        response = Response()
+        assert conditional.check(make_request(), response, [service], private=True) is None
+        assert response.headers["Cache-Control"] == "private, no-cache"
+
+        unchanged = conditional.check(make_request(if_none_match=response.headers["ETag"]), Response(), [service])
+        assert unchanged.status_code == 304
+
+
+class TestCachedConditionalResponses:
+    """Test suite for 304 handling inside ResponseCache.respond"""
+
+    @pytest.mark.anyio
+    async def test_cold_cache_answers_304_without_serialising(self, db_session):
+        """Test that a matching ETag skips rendering and caching"""
+        service = add_service(db_session)
+        etag, _ = conditional.validators([service])
+        cache = ResponseCache()
+
+        # An unrenderable response type proves the body was never serialised
+        async def produce():
+            return service
+
+        response = await cache.respond(
+            "service", object, produce,
+            request=make_request(if_none_match=etag), validate=lambda s: conditional.validators([s])
+        )
+
+        assert response.status_code == 304
+        assert response.headers["ETag"] == etag
+        assert (await cache.stats())["entries"] == 0
+
+    @pytest.mark.anyio
+    async def test_warm_cache_serves_validators_and_304(self, db_session):
+        """Test that stored validators are replayed on hits"""
+        service = add_service(db_session)
+        cache = ResponseCache()
+
+        async def produce():
+            return service
+
+        respond = lambda request: cache.respond(
+            "service", schemas.Service, produce,
+            request=request, validate=lambda s: conditional.validators([s])
+        )
+
+        first = await respond(make_request())
+        second = await respond(make_request(if_none_match=first.headers["ETag"]))
+
+        assert first.status_code == 200 and first.headers["X-Cache"] == "MISS"
+        assert second.status_code == 304
+        assert second.headers["Last-Modified"] == first.headers["Last-Modified"]
@@ -0,0 +1,119 @@
+"""
+Pytest tests for engine configuration in connections.py
+"""
+import pytest
+from sqlalchemy import create_engine, exc, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import connections
+from connections import PoolMetrics, configure, engine_options
+
+
+@pytest.fixture
+def sqlite_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'test.db'}"
+
+
+def pragma(connection, name):
+    return connection.execute(text(f"PRAGMA {name}")).scalar()
+
+
+class TestEngineOptions:
+    """Test suite for engine_options"""
+
+    def test_server_databases_recycle_and_ping(self):
+        """Test that PostgreSQL pools are sized, recycled and pre-pinged"""
+        options = engine_options("postgresql://user:pw@db/app")
+
+        assert options["pool_size"] == connections.POOL_SIZE
+        assert options["max_overflow"] == connections.MAX_OVERFLOW
+        assert options["pool_recycle"] == connections.POOL_RECYCLE_SECONDS
+        assert options["pool_pre_ping"] is connections.POOL_PRE_PING
+
+    def test_in_memory_sqlite_keeps_default_pool(self):
+        """Test that an in-memory database gets no pool sizing"""
+        assert engine_options("sqlite://") == {"connect_args": {"check_same_thread": False}}
+
+
+class TestSQLitePragmas:
+    """Test suite for the SQLite connect hook"""
+
+    def test_sync_connections_are_tuned(self, sqlite_url):
+        """Test that every new connection gets WAL and the other pragmas"""
+        engine = create_engine(sqlite_url, **engine_options(sqlite_url))
+        configure(engine)
+        try:
+            with engine.connect() as conn:
+                assert pragma(conn, "journal_mode") == "wal"
+                assert pragma(conn, "synchronous") == 1  # NORMAL
+                assert pragma(conn, "foreign_keys") == 1
+                assert pragma(conn, "busy_timeout") == connections.SQLITE_BUSY_TIMEOUT_MS
+                assert pragma(conn, "cache_size") == -connections.SQLITE_CACHE_SIZE_KB
+        finally:
+            engine.dispose()
+
+    @pytest.mark.anyio
+    async def test_async_connections_are_tuned(self, sqlite_url):
+        """Test that the hook also runs for aiosqlite connections"""
+        url = sqlite_url.replace("sqlite://", "sqlite+aiosqlite://")
+        engine = create_async_engine(url, **engine_options(sqlite_url, asyncio=True))
+        configure(engine.sync_engine)
+        try:
+            async with engine.connect() as conn:
+                assert await conn.run_sync(lambda sync: pragma(sync, "journal_mode")) == "wal"
+                assert await conn.run_sync(lambda sync: pragma(sync, "foreign_keys")) == 1
+        finally:
+            await engine.dispose()
+
+
+class TestPoolMetrics:
+    """Test suite for checkout wait metrics"""
+
+    def test_checkouts_are_timed(self, sqlite_url):
+        """Test that each checkout is counted and the pool occupancy reported"""
+        metrics = PoolMetrics()
+        engine = create_engine(sqlite_url, **engine_options(sqlite_url, metrics))
+        configure(engine, metrics)
+        try:
+            with engine.connect():
+                stats = metrics.stats()
+                assert stats["checked_out"] == 1
+            for _ in range(3):
+                with engine.connect():
+                    pass
+
+            stats = metrics.stats()
+            assert stats["checkouts"] == 4
+            assert stats["checked_out"] == 0
+            assert stats["size"] == connections.POOL_SIZE
+            assert 0 <= stats["wait_p50_ms"] <= stats["wait_p99_ms"] <= stats["wait_max_ms"]
+        finally:
+            engine.dispose()
+
+    def test_exhausted_pool_counts_timeouts(self, sqlite_url):
+        """Test that a checkout that gives up waiting is reported"""
+        metrics = PoolMetrics()
+        options = {**engine_options(sqlite_url, metrics), "pool_size": 1, "max_overflow": 0, "pool_timeout": 0.05}
+        engine = create_engine(sqlite_url, **options)
+        configure(engine, metrics)
+        try:
+            with engine.connect():
+                with pytest.raises(exc.TimeoutError):
+                    engine.connect()
+            assert metrics.stats()["timeouts"] == 1
+            assert metrics.stats()["checkouts"] == 1
+        finally:
+            engine.dispose()
+
+    def test_metrics_survive_dispose(self, sqlite_url):
+        """Test that the pool rebuilt by dispose() still reports checkouts"""
+        metrics = PoolMetrics()
+        engine = create_engine(sqlite_url, **engine_options(sqlite_url, metrics))
+        configure(engine, metrics)
+        try:
+            engine.dispose()
+            with engine.connect():
+                pass
+            assert metrics.stats()["checkouts"] == 1
+        finally:
+            engine.dispose()
@@ -0,0 +1,165 @@
+"""
+Pytest tests for offline geocoding and the spatial index in geo.py
+"""
+import random
+
+import pytest
+
+import models
+from geo import GeoIndex, Gazetteer, geocode, haversine_km, paginate_nearest
+from pagination import PageParams
+
+DALLAS = (32.7767, -96.7970)
+RICHARDSON = (32.9483, -96.7299)
+
+
+def add_business(db, email, lat, lng, specialty=None):
+    business = models.Business(
+        email=email, hashed_password="x", business_name=email,
+        specialty=specialty, latitude=lat, longitude=lng
+    )
+    db.add(business)
+    db.commit()
+    return business
+
+
+class TestGeocode:
+    """Test suite for gazetteer lookups"""
+
+    def test_resolves_full_address_by_city_and_state(self):
+        """Test that the city and state are picked out of a street address"""
+        assert geocode("123 Main St, Richardson, TX 75080") == RICHARDSON
+
+    def test_resolves_city_forms(self):
+        """Test that "City, ST", "City ST" and a bare city all resolve"""
+        assert geocode("Dallas, TX") == DALLAS
+        assert geocode("dallas tx") == DALLAS
+        assert geocode("St. Louis") == geocode("St Louis, MO") is not None
+
+    def test_zip_code_takes_precedence(self):
+        """Test that a known ZIP code beats the city name"""
+        gazetteer = Gazetteer({"75080": (32.97, -96.71), "richardson, tx": RICHARDSON})
+        assert gazetteer.geocode("Richardson, TX 75080-1234") == (32.97, -96.71)
+
+    def test_unknown_place_returns_none(self):
+        """Test that unrecognised text is not geocoded"""
+        assert geocode("Nowhere, ZZ") is None
+        assert geocode("") is None
+
+
+class TestGeoIndex:
+    """Test suite for the grid spatial index"""
+
+    def build(self, points):
+        index = GeoIndex()
+        index.loaded = True
+        for business_id, (lat, lng) in enumerate(points, start=1):
+            index.put(business_id, lat, lng)
+        return index
+
+    def test_nearest_matches_brute_force(self):
+        """Test radius results are complete and sorted against a linear scan"""
+        rng = random.Random(7)
+        points = [(32 + rng.random() * 2, -98 + rng.random() * 2) for _ in range(2000)]
+        index = self.build(points)
+
+        result = list(index.nearest(*DALLAS, radius_km=40))
+        expected = sorted(
+            (haversine_km(*DALLAS, lat, lng), business_id)
+            for business_id, (lat, lng) in enumerate(points, start=1)
+            if haversine_km(*DALLAS, lat, lng) <= 40
+        )
+
+        assert result == expected
+
+    def test_nearest_without_radius_reaches_distant_points(self):
+        """Test that k-nearest iteration finds points many cells away"""
+        index = self.build([(40.7128, -74.0060), RICHARDSON])
+
+        assert [business_id for _, business_id in index.nearest(*DALLAS)] == [2, 1]
+
+    def test_put_moves_and_remove_deletes(self):
+        """Test that writes are reflected in later queries"""
+        index = self.build([DALLAS])
+        index.put(1, 40.7128, -74.0060)
+        assert list(index.nearest(*DALLAS, radius_km=50)) == []
+
+        index.put(1, *RICHARDSON)
+        assert [business_id for _, business_id in index.nearest(*DALLAS, radius_km=50)] == [1]
+
+        index.remove(1)
+        assert len(index) == 0
+        assert list(index.nearest(*DALLAS)) == []
+
+    def test_put_before_load_is_ignored(self, db_session):
+        """Test that an unloaded index waits for load to read the database"""
+        index = GeoIndex()
+        index.put(1, *DALLAS)
+        assert len(index) == 0
+
+        add_business(db_session, "a@x.com", *RICHARDSON)
+        index.load(db_session)
+        assert len(index) == 1
+
+    def test_radius_query_scans_only_nearby_cells(self):
+        """Test that a city-sized radius query looks at a few cells, not every business"""
+        rng = random.Random(11)
+        index = self.build([(25 + rng.random() * 24, -124 + rng.random() * 57) for _ in range(50000)])
+        scanned = []
+        ring = index._ring
+
+        def counting_ring(*args):
+            for cell in ring(*args):
+                scanned.append(cell)
+                yield cell
+
+        index._ring = counting_ring
+
+        list(index.nearest(*DALLAS, radius_km=10))
+
+        # 10 km is under two 0.1 degree cells in any direction: a 5x5 block
+        assert len(scanned) <= 25
+        assert sum(len(index._cells.get(cell, ())) for cell in scanned) < 100
+
+
+class TestPaginateNearest:
+    """Test suite for nearest-first pagination"""
+
+    def test_pages_are_sorted_and_combine_with_filters(self, db_session):
+        """Test that filtered pages are nearest-first without gaps or repeats"""
+        for i in range(9):
+            add_business(
+                db_session, f"{i}@x.com", DALLAS[0] + i * 0.01, DALLAS[1],
+                specialty="Dental" if i % 3 else "Salon"
+            )
+        index = GeoIndex()
+        index.load(db_session)
+        query = db_session.query(models.Business).filter(models.Business.specialty == "Dental")
+
+        seen = []
+        cursor = None
+        while True:
+            businesses, cursor = paginate_nearest(
+                query, index, *DALLAS, 50, PageParams(cursor=cursor, limit=2)
+            )
+            seen.extend(businesses)
+            if cursor is None:
+                break
+
+        assert [b.email for b in seen] == [f"{i}@x.com" for i in (1, 2, 4, 5, 7, 8)]
+        assert [b.distance_km for b in seen] == sorted(b.distance_km for b in seen)
+
+    def test_radius_excludes_far_businesses(self, db_session):
+        """Test that businesses outside the radius are not returned"""
+        add_business(db_session, "near@x.com", *RICHARDSON)
+        add_business(db_session, "far@x.com", 29.7604, -95.3698)
+        index = GeoIndex()
+        index.load(db_session)
+
+        businesses, cursor = paginate_nearest(
+            db_session.query(models.Business), index, *DALLAS, 50, PageParams(cursor=None, limit=10)
+        )
+
+        assert [b.email for b in businesses] == ["near@x.com"]
+        assert cursor is None
+        assert businesses[0].distance_km == pytest.approx(haversine_km(*DALLAS, *RICHARDSON), abs=0.001)
@@ -0,0 +1,120 @@
+"""
+Pytest tests for the password hashing pool in hashing.py
+"""
+import threading
+
+import pytest
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from sqlalchemy import select
+
+import auth
+import models
+from hashing import HasherBusy, PasswordHasher, hash_password, needs_rehash
+
+# A cheap hash made with outdated settings
+old_context = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=4)
+
+
+@pytest.fixture
+def inline_hasher(monkeypatch):
+    hasher = PasswordHasher(workers=0, max_pending=4)
+    monkeypatch.setattr(auth, "password_hasher", hasher)
+    return hasher
+
+
+class TestPasswordHasher:
+    """Test suite for PasswordHasher"""
+
+    def test_runs_in_worker_process(self):
+        """Test that calls are executed by the process pool"""
+        hasher = PasswordHasher(workers=1, max_pending=2)
+        try:
+            assert hasher.verify("secret", old_context.hash("secret")) is True
+            assert hasher.verify("wrong", old_context.hash("secret")) is False
+            assert hasher.stats()["completed"] == 2
+        finally:
+            hasher.shutdown()
+
+    @pytest.mark.anyio
+    async def test_async_calls_share_the_pool(self):
+        """Test that awaited calls run in the pool and count against the same limits"""
+        hasher = PasswordHasher(workers=1, max_pending=2)
+        try:
+            assert await hasher.verify_async("secret", old_context.hash("secret")) is True
+            assert needs_rehash(await hasher.hash_async("secret")) is False
+            assert hasher.stats()["completed"] == 2
+            assert hasher.stats()["pending"] == 0
+        finally:
+            hasher.shutdown()
+
+    def test_rejects_when_queue_is_full(self):
+        """Test that a call over the pending limit fails fast with a retry hint"""
+        hasher = PasswordHasher(workers=0, max_pending=1)
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+
+        worker = threading.Thread(target=hasher.run, args=(slow,))
+        worker.start()
+        try:
+            assert started.wait(5)
+            with pytest.raises(HasherBusy) as exc_info:
+                hasher.run(len, "x")
+            assert exc_info.value.retry_after >= 1
+        finally:
+            release.set()
+            worker.join()
+
+        assert hasher.run(len, "x") == 1
+        assert hasher.stats()["rejected"] == 1
+        assert hasher.stats()["pending"] == 0
+
+    def test_needs_rehash(self):
+        """Test that only hashes made with other settings need upgrading"""
+        assert needs_rehash(old_context.hash("secret")) is True
+        assert needs_rehash(hash_password("secret")) is False
+        assert needs_rehash("not a hash") is False
+
+
+class TestLoginWithHasher:
+    """Test suite for login behaviour built on the hasher"""
+
+    @pytest.mark.anyio
+    async def test_busy_hasher_is_a_503(self, monkeypatch):
+        """Test that backpressure surfaces as 503 with Retry-After"""
+        monkeypatch.setattr(auth, "password_hasher", PasswordHasher(workers=0, max_pending=0))
+
+        with pytest.raises(HTTPException) as exc_info:
+            await auth.verify_password("secret", old_context.hash("secret"))
+
+        assert exc_info.value.status_code == 503
+        assert int(exc_info.value.headers["Retry-After"]) >= 1
+
+    @pytest.mark.anyio
+    async def test_login_upgrades_outdated_hash(self, async_db_session, inline_hasher):
+        """Test that a successful login re-hashes with the current cost"""
+        customer = models.Customer(
+            email="old@example.com", hashed_password=old_context.hash("secret"), full_name="Old"
+        )
+        async_db_session.add(customer)
+        await async_db_session.commit()
+
+        assert needs_rehash(customer.hashed_password)
+        assert await auth.authenticate_customer(async_db_session, "old@example.com", "secret") is customer
+        await async_db_session.refresh(customer)
+
+        assert not needs_rehash(customer.hashed_password)
+        assert await auth.verify_password("secret", customer.hashed_password)
+
+    @pytest.mark.anyio
+    async def test_failed_login_keeps_hash(self, async_db_session, inline_hasher):
+        """Test that a wrong password never triggers a re-hash"""
+        old_hash = old_context.hash("secret")
+        async_db_session.add(models.Business(email="b@example.com", hashed_password=old_hash, business_name="B"))
+        await async_db_session.commit()
+
+        assert await auth.authenticate_business(async_db_session, "b@example.com", "wrong") is False
+        assert (await async_db_session.scalar(select(models.Business))).hashed_password == old_hash
@@ -0,0 +1,80 @@
+"""
+Pytest tests for appointment ID generation in ids.py
+"""
+from datetime import date, time
+
+import pytest
+from sqlalchemy import select
+
+import models
+import schemas
+from ids import ALPHABET, EPOCH, SEQUENCE_SIZE, AppointmentIds, encode
+from routers.customer import create_appointment
+
+
+class TestAppointmentIds:
+    """Test suite for AppointmentIds"""
+
+    def test_ids_are_short_and_unambiguous(self):
+        """Test that IDs are 10 characters without I, L, O or U"""
+        appointment_id = AppointmentIds().next()
+
+        assert len(appointment_id) == 10
+        assert set(appointment_id) <= set(ALPHABET)
+        assert not set("ILOU") & set(ALPHABET)
+
+    def test_ids_sort_by_creation_time(self, clock):
+        """Test that a later second always gives a larger ID"""
+        clock.now = EPOCH + 1_000_000.0
+        ids = AppointmentIds(clock=clock)
+        generated = []
+        for _ in range(50):
+            generated.append(ids.next())
+            clock.now += 1
+
+        assert generated == sorted(generated)
+
+    def test_no_repeats_within_a_second(self, clock):
+        """Test that a burst in one second exhausts the sequence before repeating"""
+        clock.now = EPOCH + 1_000_000.0
+        ids = AppointmentIds(clock=clock)
+        burst = [ids.next() for _ in range(SEQUENCE_SIZE)]
+
+        assert len(set(burst)) == SEQUENCE_SIZE
+        assert len({appointment_id[:7] for appointment_id in burst}) == 1
+
+    def test_encode_keeps_numeric_order(self):
+        """Test that base32 strings compare like the numbers they encode"""
+        values = [0, 1, 31, 32, 1023, 1024, 32 ** 7 - 1]
+        assert [encode(value, 7) for value in values] == sorted(encode(value, 7) for value in values)
+
+
+class TestCreateAppointmentIds:
+    """Test suite for ID conflicts in create_appointment"""
+
+    @pytest.mark.anyio
+    async def test_taken_id_is_retried(self, async_db_session, monkeypatch):
+        """Test that a clash with an existing ID is retried with the next one"""
+        business = models.Business(email="b@example.com", hashed_password="x", business_name="B")
+        customer = models.Customer(email="c@example.com", hashed_password="x", full_name="C")
+        async_db_session.add_all([business, customer])
+        await async_db_session.commit()
+        async_db_session.add(models.Appointment(
+            appointment_id="TAKEN00000", customer_id=customer.id, business_id=business.id,
+            appointment_date=date(2030, 1, 7), appointment_time=time(8, 0), status="confirmed"
+        ))
+        await async_db_session.commit()
+        queued = iter(["TAKEN00000", "FRESH00000"])
+        monkeypatch.setattr("routers.customer.appointment_ids.next", lambda: next(queued))
+
+        created = await create_appointment(
+            schemas.AppointmentCreate(
+                business_id=business.id, appointment_date=date(2030, 1, 7), appointment_time=time(9, 0)
+            ),
+            current_customer=customer,
+            db=async_db_session
+        )
+
+        assert created.appointment_id == "FRESH00000"
+        stored = await async_db_session.scalars(select(models.Appointment.appointment_id))
+        assert sorted(stored) == ["FRESH00000", "TAKEN00000"]
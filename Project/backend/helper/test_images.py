@@ -0,0 +1,147 @@
+"""
+Pytest tests for image variants in images.py
+"""
+import pytest
+from PIL import Image
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+import blobs
+import images
+import models
+from images import accepted_types, choose, render_variants
+from workers import WorkerPool
+
+ORIENTATION = 0x0112
+GPS_INFO = 0x8825
+
+
+def photo(path, size=(400, 200), orientation=1):
+    """A JPEG with an orientation tag and a GPS position"""
+    exif = Image.Exif()
+    exif[ORIENTATION] = orientation
+    exif[GPS_INFO] = {1: "N", 2: (52.0, 22.0, 0.0)}
+    Image.new("RGB", size, "red").save(path, "JPEG", exif=exif.tobytes())
+    return path
+
+
+def variant(content_type, width):
+    return models.ImageVariant(filename=f"v_{width}{content_type[6:]}", content_type=content_type, width=width)
+
+
+class TestRenderVariants:
+    """Test suite for render_variants"""
+
+    def test_variants_are_upright_and_stripped(self, tmp_path):
+        """Test that variants follow EXIF orientation and carry no EXIF themselves"""
+        source = photo(tmp_path / "business_1_cover_x.jpg", orientation=6)
+
+        rendered = render_variants(str(source), str(tmp_path), (50, 100))
+
+        assert {(content_type, width, height) for _, content_type, width, height, _ in rendered} >= {
+            ("image/webp", 50, 100), ("image/webp", 100, 200),
+            ("image/jpeg", 50, 100), ("image/jpeg", 100, 200),
+        }
+        for filename, content_type, width, height, size in rendered:
+            path = tmp_path / filename
+            assert path.stat().st_size == size
+            with Image.open(path) as image:
+                assert image.size == (width, height)
+                assert not image.getexif()
+        assert "business_1_cover_x_100w.webp" in {filename for filename, *_ in rendered}
+
+    def test_no_upscaling(self, tmp_path):
+        """Test that widths beyond the original collapse into one full-size variant"""
+        source = photo(tmp_path / "small.jpg", size=(80, 40))
+
+        rendered = render_variants(str(source), str(tmp_path), (50, 640, 1280))
+
+        assert sorted({width for _, _, width, _, _ in rendered}) == [50, 80]
+
+    def test_transparent_images_keep_alpha(self, tmp_path):
+        """Test that a transparent PNG falls back to PNG, not JPEG"""
+        source = tmp_path / "logo.png"
+        Image.new("RGBA", (120, 120), (0, 0, 0, 0)).save(source)
+
+        rendered = render_variants(str(source), str(tmp_path), (60,))
+
+        types = {content_type for _, content_type, _, _, _ in rendered}
+        assert "image/png" in types and "image/jpeg" not in types
+
+    def test_animated_images_are_skipped(self, tmp_path):
+        """Test that animations are left as uploaded"""
+        source = tmp_path / "anim.gif"
+        frames = [Image.new("RGB", (40, 40), color) for color in ("red", "blue")]
+        frames[0].save(source, save_all=True, append_images=frames[1:], duration=100)
+
+        assert render_variants(str(source), str(tmp_path), (20,)) == []
+        assert [path.name for path in tmp_path.iterdir()] == ["anim.gif"]
+
+
+class TestChoose:
+    """Test suite for Accept and width negotiation"""
+
+    def test_modern_formats_need_to_be_listed(self):
+        """Test that wildcards accept the fallback formats but not AVIF or WebP"""
+        assert accepted_types("*/*") == {"image/jpeg", "image/png"}
+        assert accepted_types(None) == {"image/jpeg", "image/png"}
+        assert accepted_types("image/avif,image/webp,image/*;q=0.8") == set(images.PREFERENCE)
+        assert accepted_types("image/webp;q=0, image/*") == {"image/jpeg", "image/png"}
+
+    def test_best_format_then_smallest_covering_width(self):
+        """Test that the preferred format is used at the smallest width at least w"""
+        variants = [variant(content_type, width) for content_type in ("image/webp", "image/jpeg")
+                    for width in (320, 640, 1280)]
+
+        assert choose(variants, 400, "image/webp,*/*").width == 640
+        assert choose(variants, 400, "image/webp,*/*").content_type == "image/webp"
+        assert choose(variants, 400, "*/*").content_type == "image/jpeg"
+        assert choose(variants, 5000, "*/*").width == 1280
+        assert choose(variants, None, "*/*").width == 1280
+        assert choose(variants, 320, "text/html") is None
+
+
+class TestGenerateVariants:
+    """Test suite for recording variants after an upload"""
+
+    @pytest.fixture
+    def sessions(self, tmp_path, async_db_engine, monkeypatch):
+        monkeypatch.setattr(blobs.blob_store, "backend", blobs.LocalBackend(tmp_path))
+        monkeypatch.setattr(images, "image_pool", WorkerPool(workers=0, max_pending=2))
+        monkeypatch.setattr(images, "VARIANT_WIDTHS", (100,))
+        return async_sessionmaker(async_db_engine, autoflush=False, expire_on_commit=False)
+
+    async def stored(self, sessions, filename, refcount):
+        async with sessions() as db:
+            db.add(models.StoredFile(filename=filename, refcount=refcount))
+            await db.commit()
+
+    async def variant_rows(self, sessions):
+        async with sessions() as db:
+            return (await db.scalars(select(models.ImageVariant))).all()
+
+    @pytest.mark.anyio
+    async def test_variants_are_recorded_once(self, tmp_path, sessions, monkeypatch):
+        """Test that an image in use gets its variants stored as rows, and only once"""
+        photo(tmp_path / "cover.jpg")
+        await self.stored(sessions, "cover.jpg", 1)
+
+        await images.generate_variants("cover.jpg", sessions)
+        rows = await self.variant_rows(sessions)
+        monkeypatch.setattr(images, "render_variants", None)
+        await images.generate_variants("cover.jpg", sessions)
+
+        assert rows and {row.source for row in rows} == {"cover.jpg"}
+        assert all((tmp_path / row.filename).exists() for row in rows)
+        assert sorted(path.name for path in tmp_path.iterdir()) == sorted(["cover.jpg"] + [row.filename for row in rows])
+        assert len(await self.variant_rows(sessions)) == len(rows)
+
+    @pytest.mark.anyio
+    async def test_released_image_is_not_recorded(self, tmp_path, sessions):
+        """Test that variants of an image released in the meantime get no rows"""
+        photo(tmp_path / "old.jpg")
+        await self.stored(sessions, "old.jpg", 0)
+
+        await images.generate_variants("old.jpg", sessions)
+
+        assert await self.variant_rows(sessions) == []
@@ -0,0 +1,72 @@
+"""
+Pytest tests for relationship loading on the appointment list endpoints
+"""
+import pytest
+from datetime import date, time
+
+import models
+import schemas
+from pagination import PageParams
+from routers.business import get_business_appointments
+from routers.customer import get_customer_appointments
+
+
+def seed(db, count):
+    """Create one business, one customer per appointment, and `count` appointments"""
+    business = models.Business(email="biz@example.com", hashed_password="x", business_name="Biz")
+    db.add(business)
+    db.flush()
+    regular = models.Customer(email="regular@example.com", hashed_password="x", full_name="Regular")
+    db.add(regular)
+    db.flush()
+    for i in range(count):
+        customer = regular if i % 2 else models.Customer(
+            email=f"c{i}@example.com", hashed_password="x", full_name=f"C{i}"
+        )
+        db.add(models.Appointment(
+            appointment_id=f"APT{i:05d}", customer=customer, business=business,
+            appointment_date=date(2025, 1, 6), appointment_time=time(9, 0),
+            duration_minutes=30, status="confirmed"
+        ))
+    db.commit()
+    business_id, regular_id = business.id, regular.id
+    # Start from an empty identity map, as a real request would
+    db.expunge_all()
+    return db.get(models.Business, business_id), db.get(models.Customer, regular_id)
+
+
+def serialise(page):
+    return [schemas.AppointmentDetail.model_validate(row) for row in page["items"]]
+
+
+class TestAppointmentDetailLoading:
+    """Test suite asserting a bounded query count for AppointmentDetail lists"""
+
+    @pytest.mark.anyio
+    @pytest.mark.parametrize("count", [1, 200])
+    async def test_business_appointments_single_query(self, async_db_engine, async_db_session, count_queries, count):
+        """Test that business appointments load customers and business in one query"""
+        business, _ = await async_db_session.run_sync(seed, count)
+
+        with count_queries(async_db_engine) as statements:
+            items = serialise(await get_business_appointments(
+                status=None, page=PageParams(cursor=None, limit=200), current_business=business, db=async_db_session
+            ))
+
+        assert len(items) == count
+        assert len(statements) == 1
+
+    @pytest.mark.anyio
+    @pytest.mark.parametrize("count", [2, 200])
+    async def test_customer_appointments_single_query(self, async_db_engine, async_db_session, count_queries, count):
+        """Test that customer appointments load the nested business in one query"""
+        _, customer = await async_db_session.run_sync(seed, count)
+
+        with count_queries(async_db_engine) as statements:
+            items = serialise(await get_customer_appointments(
+                page=PageParams(cursor=None, limit=200), current_customer=customer, db=async_db_session
+            ))
+
+        assert len(items) == count // 2
+        assert all(item.business.business_name == "Biz" for item in items)
+        assert len(statements) == 1
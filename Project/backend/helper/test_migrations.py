@@ -0,0 +1,99 @@
+"""
+Pytest tests for the schema upgrade in migrations.py
+"""
+import pytest
+import sqlite3
+from sqlalchemy import create_engine, inspect
+
+from migrations import upgrade
+
+
+def create_legacy_database(db_path):
+    """Create the original schema: no image columns and no composite indexes"""
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.executescript('''
+        CREATE TABLE customers (
+            id INTEGER PRIMARY KEY, email VARCHAR NOT NULL UNIQUE,
+            hashed_password VARCHAR NOT NULL, full_name VARCHAR NOT NULL,
+            phone VARCHAR, created_at DATETIME
+        );
+        CREATE TABLE businesses (
+            id INTEGER PRIMARY KEY, email VARCHAR NOT NULL UNIQUE,
+            hashed_password VARCHAR NOT NULL, business_name VARCHAR NOT NULL,
+            phone VARCHAR, address VARCHAR, specialty VARCHAR, description TEXT,
+            created_at DATETIME
+        );
+        CREATE TABLE appointments (
+            id INTEGER PRIMARY KEY, appointment_id VARCHAR NOT NULL UNIQUE,
+            customer_id INTEGER NOT NULL, business_id INTEGER NOT NULL,
+            appointment_date DATE NOT NULL, appointment_time TIME NOT NULL,
+            duration_minutes INTEGER, status VARCHAR, business_note TEXT,
+            created_at DATETIME
+        );
+        INSERT INTO businesses (email, hashed_password, business_name)
+        VALUES ('test@example.com', 'x', 'Test Business');
+    ''')
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    db_path = tmp_path / "legacy.db"
+    create_legacy_database(db_path)
+    engine = create_engine(f"sqlite:///{db_path}")
+    yield engine
+    engine.dispose()
+
+
+class TestUpgrade:
+    """Test suite for migrations.upgrade"""
+
+    def test_upgrade_adds_missing_columns_tables_and_indexes(self, legacy_engine):
+        """Test that an old database gains every column, table and index from the models"""
+        results = upgrade(legacy_engine)
+
+        assert ("column", "businesses.profile_image", "added") in results
+        assert ("column", "businesses.cover_image", "added") in results
+        assert ("table", "time_slots", "added") in results
+        assert ("index", "ix_appointments_business_date_status", "added") in results
+        assert ("index", "ix_appointments_customer", "added") in results
+
+        inspector = inspect(legacy_engine)
+        index_names = {idx["name"] for idx in inspector.get_indexes("appointments")}
+        assert {
+            "ix_appointments_business_date_status",
+            "ix_appointments_business_status",
+            "ix_appointments_customer",
+        } <= index_names
+        assert "ix_time_slots_business_active" in {
+            idx["name"] for idx in inspector.get_indexes("time_slots")
+        }
+
+    def test_upgrade_is_idempotent(self, legacy_engine):
+        """Test that a second run finds nothing to do"""
+        upgrade(legacy_engine)
+
+        assert upgrade(legacy_engine) == []
+
+    def test_upgrade_preserves_existing_rows(self, legacy_engine):
+        """Test that upgrading keeps data already in the tables"""
+        upgrade(legacy_engine)
+
+        with legacy_engine.connect() as conn:
+            row = conn.exec_driver_sql(
+                "SELECT email, business_name, profile_image FROM businesses"
+            ).fetchone()
+        assert tuple(row) == ("test@example.com", "Test Business", None)
+
+    def test_booked_slots_query_uses_composite_index(self, legacy_engine):
+        """Test that SQLite plans the booked-slots lookup through the new index"""
+        upgrade(legacy_engine)
+
+        with legacy_engine.connect() as conn:
+            plan = conn.exec_driver_sql(
+                "EXPLAIN QUERY PLAN SELECT appointment_time FROM appointments "
+                "WHERE business_id = 1 AND appointment_date = '2025-01-06' AND status != 'cancelled'"
+            ).fetchall()
+        assert "ix_appointments_business_date_status" in " ".join(str(row) for row in plan)
@@ -0,0 +1,128 @@
+"""
+Pytest tests for keyset pagination in pagination.py
+"""
+import pytest
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from sqlalchemy import select
+
+import models
+from pagination import PageParams, decode_cursor, encode_cursor, paginate, paginate_async
+
+
+def add_messages(db, count):
+    """Create an appointment thread whose messages share timestamps in pairs"""
+    business = models.Business(email="b@example.com", hashed_password="x", business_name="B")
+    customer = models.Customer(email="c@example.com", hashed_password="x", full_name="C")
+    appointment = models.Appointment(
+        appointment_id="APT1", customer=customer, business=business,
+        appointment_date=datetime(2025, 1, 6).date(), appointment_time=datetime(2025, 1, 6, 9).time()
+    )
+    db.add(appointment)
+    db.flush()
+    start = datetime(2025, 1, 1, 12, 0, 0)
+    for i in range(count):
+        db.add(models.Message(
+            appointment_id=appointment.id, sender_type="customer", sender_id=customer.id,
+            message=f"m{i}", created_at=start + timedelta(seconds=i // 2)
+        ))
+    db.commit()
+    return appointment.id
+
+
+class TestCursorEncoding:
+    """Test suite for cursor encoding"""
+
+    def test_round_trip_preserves_types(self):
+        """Test that datetimes and ints survive an encode/decode round trip"""
+        values = (datetime(2025, 1, 1, 12, 30), 42)
+        cursor = encode_cursor(values)
+
+        assert decode_cursor(cursor, [datetime, int]) == values
+        assert "2025" not in cursor  # opaque to clients
+
+    @pytest.mark.parametrize("cursor", ["not-base64!!", encode_cursor([1, 2, 3]), "e30"])
+    def test_invalid_cursor_raises_400(self, cursor):
+        """Test that malformed or mismatched cursors are rejected"""
+        with pytest.raises(HTTPException) as exc:
+            decode_cursor(cursor, [int])
+        assert exc.value.status_code == 400
+
+
+class TestPaginate:
+    """Test suite for paginate"""
+
+    def test_pages_cover_every_row_once(self, db_session):
+        """Test that following next_cursor visits every row exactly once, in order"""
+        appointment_id = add_messages(db_session, 25)
+        query = db_session.query(models.Message).filter(models.Message.appointment_id == appointment_id)
+        sort = [models.Message.created_at, models.Message.id]
+
+        seen, cursor, pages = [], None, 0
+        while True:
+            rows, cursor = paginate(query, sort, PageParams(cursor=cursor, limit=10))
+            seen.extend(row.message for row in rows)
+            pages += 1
+            if cursor is None:
+                break
+
+        assert pages == 3
+        assert seen == [f"m{i}" for i in range(25)]
+
+    def test_exact_multiple_has_no_empty_trailing_page(self, db_session):
+        """Test that a result set filling the last page exactly ends without a cursor"""
+        appointment_id = add_messages(db_session, 10)
+        query = db_session.query(models.Message).filter(models.Message.appointment_id == appointment_id)
+
+        rows, cursor = paginate(query, [models.Message.id], PageParams(cursor=None, limit=10))
+
+        assert len(rows) == 10
+        assert cursor is None
+
+    def test_rows_deleted_before_cursor_do_not_shift_pages(self, db_session):
+        """Test that keyset pages stay stable when earlier rows are deleted"""
+        appointment_id = add_messages(db_session, 6)
+        query = db_session.query(models.Message).filter(models.Message.appointment_id == appointment_id)
+        first, cursor = paginate(query, [models.Message.id], PageParams(cursor=None, limit=3))
+
+        db_session.delete(first[0])
+        db_session.commit()
+        second, _ = paginate(query, [models.Message.id], PageParams(cursor=cursor, limit=3))
+
+        assert [row.message for row in second] == ["m3", "m4", "m5"]
+
+
+class TestPaginateAsync:
+    """Test suite for paginate_async"""
+
+    @pytest.mark.anyio
+    async def test_pages_cover_every_row_once(self, async_db_session):
+        """Test that select() statements page the same way on an AsyncSession"""
+        appointment_id = await async_db_session.run_sync(add_messages, 25)
+        statement = select(models.Message).where(models.Message.appointment_id == appointment_id)
+        sort = [models.Message.created_at, models.Message.id]
+
+        seen, cursor = [], None
+        while True:
+            rows, cursor = await paginate_async(async_db_session, statement, sort, PageParams(cursor=cursor, limit=10))
+            seen.extend(row.message for row in rows)
+            if cursor is None:
+                break
+
+        assert seen == [f"m{i}" for i in range(25)]
+
+    @pytest.mark.anyio
+    async def test_extra_columns_come_back_as_rows(self, async_db_session):
+        """Test that a statement selecting more than one entity returns rows"""
+        appointment_id = await async_db_session.run_sync(add_messages, 3)
+        statement = select(models.Message, models.Message.sender_type).where(
+            models.Message.appointment_id == appointment_id
+        )
+
+        rows, cursor = await paginate_async(
+            async_db_session, statement, [models.Message.id], PageParams(cursor=None, limit=2),
+            key=lambda row: (row.Message.id,)
+        )
+
+        assert [row.Message.message for row in rows] == ["m0", "m1"]
+        assert cursor is not None
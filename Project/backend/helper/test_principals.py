@@ -0,0 +1,169 @@
+"""
+Pytest tests for the authenticated-user cache in principals.py
+"""
+import json
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm.exc import StaleDataError
+
+import models
+from auth import create_access_token, get_current_user
+from cache import init_cache
+from database import get_db
+from invalidation import InvalidationBus
+from principals import PrincipalCache
+
+
+@pytest.fixture
+def principals(monkeypatch):
+    cache = PrincipalCache()
+    monkeypatch.setattr("auth.principal_cache", cache)
+    monkeypatch.setattr("database.principal_cache", cache)
+    return cache
+
+
+def add_customer(db, email="c@example.com"):
+    customer = models.Customer(email=email, hashed_password="x", full_name="C")
+    db.add(customer)
+    db.commit()
+    return customer
+
+
+async def current_user(db, email="c@example.com", user_type="customer"):
+    token = create_access_token({"sub": email, "type": user_type})
+    return await get_current_user(token=token, db=db)
+
+
+class TestGetCurrentUser:
+    """Test suite for get_current_user with the principal cache"""
+
+    @pytest.mark.anyio
+    async def test_second_request_needs_no_query(self, async_db_engine, async_db_session, principals, count_queries):
+        """Test that a cached user is attached to the session without a query"""
+        customer_id = (await async_db_session.run_sync(add_customer)).id
+        async_db_session.expunge_all()
+
+        with count_queries(async_db_engine) as first:
+            await current_user(async_db_session)
+        async_db_session.expunge_all()
+        with count_queries(async_db_engine) as second:
+            user = await current_user(async_db_session)
+
+        assert len(first) == 1
+        assert len(second) == 0
+        assert user.id == customer_id
+        assert user.user_type == "customer"
+        assert user in async_db_session
+
+    @pytest.mark.anyio
+    async def test_cached_user_can_be_updated(self, async_db_session, principals):
+        """Test that routes can still modify and commit the cached user"""
+        await async_db_session.run_sync(add_customer)
+        await current_user(async_db_session)
+        async_db_session.expunge_all()
+
+        user = await current_user(async_db_session)
+        user.phone = "555"
+        await async_db_session.commit()
+        async_db_session.expunge_all()
+
+        assert (await async_db_session.scalar(select(models.Customer))).phone == "555"
+
+    @pytest.mark.anyio
+    async def test_invalidate_revokes_deleted_user(self, async_db_session, principals):
+        """Test that a deleted account is rejected as soon as it is invalidated"""
+        customer = await async_db_session.run_sync(add_customer)
+        await current_user(async_db_session)
+        await async_db_session.delete(customer)
+        await async_db_session.commit()
+        principals.invalidate("customer", "c@example.com")
+
+        with pytest.raises(HTTPException) as exc_info:
+            await current_user(async_db_session)
+        assert exc_info.value.status_code == 401
+
+    @pytest.mark.anyio
+    async def test_writing_a_user_deleted_elsewhere_is_unauthorized(
+        self, monkeypatch, async_db_engine, async_db_session, principals
+    ):
+        """Test that flushing a cached user deleted by another worker gives a 401, not a 500"""
+        monkeypatch.setattr(
+            "database.AsyncSessionLocal",
+            async_sessionmaker(async_db_engine, autoflush=False, expire_on_commit=False)
+        )
+        await async_db_session.run_sync(add_customer)
+        await current_user(async_db_session)
+        await async_db_session.execute(delete(models.Customer))
+        await async_db_session.commit()
+
+        session = get_db()
+        db = await session.__anext__()
+        user = await current_user(db)
+        user.phone = "555"
+        with pytest.raises(StaleDataError) as stale:
+            await db.commit()
+        with pytest.raises(HTTPException) as exc_info:
+            await session.athrow(stale.value)
+
+        assert exc_info.value.status_code == 401
+        assert principals.get("customer", "c@example.com") is None
+
+
+class TestInitCache:
+    """Test suite for the startup checks in init_cache"""
+
+    def test_several_workers_need_a_shared_cache(self):
+        """Test that more than one worker without CACHE_URL is refused"""
+        with pytest.raises(RuntimeError, match="CACHE_URL"):
+            init_cache(None, workers=4)
+
+    def test_one_worker_runs_without_a_shared_cache(self):
+        """Test that a single worker keeps the per-process caches"""
+        init_cache(None, workers=1)
+
+
+class TestPrincipalCache:
+    """Test suite for PrincipalCache"""
+
+    def test_entries_expire_after_ttl(self, db_session, clock):
+        """Test that an entry older than the TTL is a miss"""
+        cache = PrincipalCache(ttl_seconds=10, clock=clock)
+        cache.put("customer", "c@example.com", add_customer(db_session))
+
+        clock.now = 9.9
+        assert cache.get("customer", "c@example.com") is not None
+        clock.now = 10
+        assert cache.get("customer", "c@example.com") is None
+
+    def test_least_recently_used_is_evicted(self, db_session):
+        """Test that the cache holds at most max_entries users"""
+        cache = PrincipalCache(max_entries=2)
+        for email in ("a@example.com", "b@example.com", "c@example.com"):
+            cache.put("customer", email, add_customer(db_session, email))
+
+        assert cache.get("customer", "a@example.com") is None
+        assert cache.stats()["entries"] == 2
+
+    def test_stale_user_is_not_stored_after_invalidation(self, db_session):
+        """Test that a row read before an invalidation is discarded"""
+        cache = PrincipalCache()
+        generation = cache.generation
+        cache.invalidate("customer", "c@example.com")
+        cache.put("customer", "c@example.com", add_customer(db_session), generation)
+
+        assert cache.get("customer", "c@example.com") is None
+
+    def test_invalidation_is_replayed_from_other_workers(self, db_session):
+        """Test that an invalidation message from another worker drops the entry"""
+        bus = InvalidationBus()
+        cache = PrincipalCache(bus=bus)
+        cache.put("customer", "c@example.com", add_customer(db_session))
+
+        bus.deliver(json.dumps({
+            "origin": "other", "topic": "principal.invalidate", "args": ["customer", "c@example.com"]
+        }))
+
+        assert cache.get("customer", "c@example.com") is None
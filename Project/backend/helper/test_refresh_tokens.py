@@ -0,0 +1,177 @@
+"""
+Pytest tests for refresh token rotation and session revocation
+"""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select, update
+
+import auth
+import models
+import schemas
+from revocation import BloomFilter, RevocationList
+from routers import auth as auth_router
+from routers import customer as customer_router
+
+
+@pytest.fixture
+def revocations(monkeypatch):
+    revocation_list = RevocationList()
+    monkeypatch.setattr(auth, "revocation_list", revocation_list)
+    return revocation_list
+
+
+def add_customer(db):
+    customer = models.Customer(email="c@example.com", hashed_password="x", full_name="C")
+    db.add(customer)
+    db.commit()
+    return customer
+
+
+class TestRefreshTokens:
+    """Test suite for refresh token storage and rotation"""
+
+    @pytest.mark.anyio
+    async def test_token_is_stored_hashed(self, async_db_session):
+        """Test that only a hash of the refresh token reaches the database"""
+        token, family = await auth.create_refresh_token(async_db_session, "customer", 1, "c@example.com")
+        row = await async_db_session.scalar(select(models.RefreshToken))
+
+        assert row.token_hash != token
+        assert row.token_hash == auth.hash_refresh_token(token)
+        assert row.family == family
+
+    @pytest.mark.anyio
+    async def test_rotation_spends_token_once(self, async_db_session, revocations):
+        """Test that a refresh token can be exchanged exactly once"""
+        token, family = await auth.create_refresh_token(async_db_session, "customer", 1, "c@example.com")
+
+        row = await auth.rotate_refresh_token(async_db_session, token)
+        assert row.family == family and row.used_at is not None
+        next_token, next_family = await auth.create_refresh_token(async_db_session, "customer", 1, "c@example.com", row.family)
+        assert next_family == family
+
+        assert await auth.rotate_refresh_token(async_db_session, next_token) is not None
+
+    @pytest.mark.anyio
+    async def test_reuse_revokes_whole_session(self, async_db_session, revocations):
+        """Test that presenting a spent token ends the session and its successors"""
+        token, family = await auth.create_refresh_token(async_db_session, "customer", 1, "c@example.com")
+        await auth.rotate_refresh_token(async_db_session, token)
+        successor, _ = await auth.create_refresh_token(async_db_session, "customer", 1, "c@example.com", family)
+
+        assert await auth.rotate_refresh_token(async_db_session, token) is None
+        assert await auth.rotate_refresh_token(async_db_session, successor) is None
+        assert revocations.is_revoked(family)
+
+    @pytest.mark.anyio
+    async def test_expired_token_is_rejected(self, async_db_session):
+        """Test that an expired refresh token cannot be exchanged"""
+        token, _ = await auth.create_refresh_token(async_db_session, "customer", 1, "c@example.com")
+        await async_db_session.execute(update(models.RefreshToken).values(expires_at=datetime.utcnow()))
+        await async_db_session.commit()
+
+        assert await auth.rotate_refresh_token(async_db_session, token) is None
+
+    @pytest.mark.anyio
+    async def test_revoked_session_rejects_access_tokens(self, async_db_session, revocations, monkeypatch):
+        """Test that get_current_user refuses access tokens of a revoked session"""
+        monkeypatch.setattr("auth.principal_cache.get", lambda *args: None)
+        await async_db_session.run_sync(add_customer)
+        _, family = await auth.create_refresh_token(async_db_session, "customer", 1, "c@example.com")
+        token = auth.create_access_token({"sub": "c@example.com", "type": "customer", "sid": family})
+
+        assert (await auth.get_current_user(token=token, db=async_db_session)).email == "c@example.com"
+        await auth.revoke_session(async_db_session, family)
+        with pytest.raises(HTTPException) as exc_info:
+            await auth.get_current_user(token=token, db=async_db_session)
+        assert exc_info.value.status_code == 401
+
+    def test_recent_revocations_are_reloaded(self, db_engine, db_session, revocations):
+        """Test that startup restores revocations whose access tokens may be live"""
+        now = datetime.utcnow()
+        for family, revoked_at in (("recent", now), ("old", now - timedelta(days=1))):
+            db_session.add(models.RefreshToken(
+                token_hash=family, family=family, user_type="customer", user_id=1,
+                expires_at=now + timedelta(days=1), revoked_at=revoked_at
+            ))
+        db_session.commit()
+
+        auth.load_revocations(db_engine)
+
+        assert revocations.is_revoked("recent")
+        assert not revocations.is_revoked("old")
+
+
+class TestDeletedAccounts:
+    """Test suite for the sessions of deleted accounts"""
+
+    async def register(self, db, email):
+        customer = models.Customer(email=email, hashed_password="x", full_name=email)
+        db.add(customer)
+        await db.commit()
+        return customer, await auth_router.issue_tokens(db, customer, "customer")
+
+    async def refresh_status(self, db, tokens):
+        with pytest.raises(HTTPException) as exc_info:
+            await auth_router.refresh_tokens(schemas.RefreshRequest(refresh_token=tokens["refresh_token"]), db)
+        return exc_info.value.status_code
+
+    @pytest.mark.anyio
+    async def test_deleting_account_ends_its_sessions(self, async_db_session, revocations):
+        """Test that a deleted account's refresh token cannot log in the next account given its id"""
+        deleted, tokens = await self.register(async_db_session, "old@example.com")
+        deleted_id = deleted.id
+        await customer_router.delete_customer_account(deleted, async_db_session)
+        successor, _ = await self.register(async_db_session, "new@example.com")
+
+        # SQLite hands the highest freed INTEGER PRIMARY KEY out again
+        assert successor.id == deleted_id
+        assert await self.refresh_status(async_db_session, tokens) == 401
+        row = await async_db_session.scalar(select(models.RefreshToken).where(
+            models.RefreshToken.token_hash == auth.hash_refresh_token(tokens["refresh_token"])
+        ))
+        assert row.revoked_at is not None and revocations.is_revoked(row.family)
+
+    @pytest.mark.anyio
+    async def test_token_is_bound_to_the_email(self, async_db_session, revocations):
+        """Test that a token left behind by a deleted account is refused for a user with its id"""
+        deleted, tokens = await self.register(async_db_session, "old@example.com")
+        await async_db_session.delete(deleted)
+        await async_db_session.commit()
+        successor, _ = await self.register(async_db_session, "new@example.com")
+
+        assert successor.id == deleted.id
+        assert await self.refresh_status(async_db_session, tokens) == 401
+
+
+class TestRevocationList:
+    """Test suite for the Bloom filter backed revocation list"""
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        """Test that every added value is reported and few others are"""
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        for i in range(1000):
+            bloom.add(f"in-{i}")
+
+        assert all(f"in-{i}" in bloom for i in range(1000))
+        false_positives = sum(f"out-{i}" in bloom for i in range(10000))
+        assert false_positives < 300
+
+    def test_expired_entries_are_pruned(self):
+        """Test that a revocation is forgotten once its access tokens have expired"""
+        revocations = RevocationList(capacity=100)
+        revocations.add("old", datetime.utcnow() + timedelta(milliseconds=50))
+        revocations.add("current", datetime.utcnow() + timedelta(minutes=30))
+        revocations.add("stale", datetime.utcnow() - timedelta(seconds=1))
+
+        assert revocations.is_revoked("current")
+        assert not revocations.is_revoked("stale")
+        time.sleep(0.1)
+        revocations.prune()
+
+        assert not revocations.is_revoked("old")
+        assert revocations.is_revoked("current")
+        assert revocations.stats()["revoked_sessions"] == 1
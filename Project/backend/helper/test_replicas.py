@@ -0,0 +1,153 @@
+"""
+Pytest tests for read-replica routing in replicas.py
+"""
+import json
+
+import pytest
+from sqlalchemy import select, update
+from starlette.requests import Request
+
+import models
+import replicas
+from auth import create_access_token
+from connections import PoolMetrics
+from database import AsyncSessionLocal, create_request_engine
+from invalidation import InvalidationBus
+from replicas import ReadRouter, get_public_read_db, get_read_db
+
+CUSTOMER = ("customer", "c@example.com")
+
+
+def request_for(principal=None):
+    headers = []
+    if principal is not None:
+        token = create_access_token({"sub": principal[1], "type": principal[0]})
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    return Request({"type": "http", "headers": headers})
+
+
+async def read_names(dependency, request):
+    async for db in dependency(request):
+        return list(await db.scalars(select(models.Business.business_name)))
+
+
+@pytest.fixture
+async def databases(tmp_path, anyio_backend):
+    """A primary and a replica SQLite file whose business names differ"""
+    engines = []
+    for name in ("primary", "replica"):
+        engine = create_request_engine(f"sqlite:///{tmp_path / name}.db", PoolMetrics())
+        async with engine.begin() as conn:
+            await conn.run_sync(models.Base.metadata.create_all)
+            await conn.execute(models.Business.__table__.insert().values(
+                email="b@example.com", hashed_password="x", business_name=name
+            ))
+        engines.append(engine)
+    yield engines
+    for engine in engines:
+        await engine.dispose()
+
+
+@pytest.fixture
+def router(databases, monkeypatch, clock):
+    primary, replica = databases
+    router = ReadRouter(primary, [replica], lag_seconds=5, clock=clock)
+    monkeypatch.setattr(replicas, "read_router", router)
+    return router
+
+
+class TestReadRouter:
+    """Test suite for ReadRouter"""
+
+    def test_reads_rotate_over_replicas(self, clock):
+        """Test that reads are spread over the replicas in turn"""
+        router = ReadRouter("primary", ["r1", "r2"], clock=clock)
+
+        assert [router.engine_for(None, public=True) for _ in range(3)] == ["r1", "r2", "r1"]
+        assert router.stats()["replica_reads"] == 3
+
+    def test_without_replicas_reads_use_primary(self, clock):
+        """Test that the primary serves reads when no replica is configured"""
+        router = ReadRouter("primary", [], clock=clock)
+
+        assert router.engine_for(CUSTOMER, public=True) == "primary"
+
+    def test_writer_reads_primary_until_lag_passes(self, clock):
+        """Test that a user reads their own writes, and only for the lag window"""
+        router = ReadRouter("primary", ["replica"], lag_seconds=5, clock=clock)
+
+        router.wrote(CUSTOMER, public=False)
+
+        assert router.engine_for(CUSTOMER, public=False) == "primary"
+        assert router.engine_for(("customer", "other@example.com"), public=False) == "replica"
+        clock.now = 5.1
+        assert router.engine_for(CUSTOMER, public=False) == "replica"
+
+    def test_public_write_routes_public_reads_to_primary(self, clock):
+        """Test that a write to public tables keeps stale rows out of shared caches"""
+        router = ReadRouter("primary", ["replica"], lag_seconds=5, clock=clock)
+
+        router.wrote(None, public=True)
+
+        assert router.engine_for(None, public=True) == "primary"
+        assert router.engine_for(None, public=False) == "replica"
+        clock.now = 5.1
+        assert router.engine_for(None, public=True) == "replica"
+
+    def test_writes_are_replayed_from_other_workers(self, clock):
+        """Test that a write reported by another worker makes its user sticky here"""
+        bus = InvalidationBus()
+        router = ReadRouter("primary", ["replica"], clock=clock, bus=bus)
+
+        bus.deliver(json.dumps({
+            "origin": "other", "topic": "replica.wrote", "args": [*CUSTOMER, False]
+        }))
+
+        assert router.engine_for(CUSTOMER, public=False) == "primary"
+
+
+class TestRoutedSessions:
+    """Test suite for the read dependencies and the commit hooks"""
+
+    @pytest.mark.anyio
+    async def test_reads_use_replica(self, router):
+        """Test that read-only endpoints are served by the replica"""
+        assert await read_names(get_read_db, request_for(CUSTOMER)) == ["replica"]
+        assert await read_names(get_public_read_db, request_for()) == ["replica"]
+
+    @pytest.mark.anyio
+    async def test_own_write_is_read_back_from_primary(self, router, databases):
+        """Test that a committed change is visible to its author straight away"""
+        primary, _ = databases
+        async with AsyncSessionLocal(bind=primary) as db:
+            db.info["principal"] = CUSTOMER
+            db.add(models.Customer(email=CUSTOMER[1], hashed_password="x", full_name="C"))
+            await db.commit()
+
+        assert await read_names(get_read_db, request_for(CUSTOMER)) == ["primary"]
+        assert await read_names(get_read_db, request_for(("business", "b@example.com"))) == ["replica"]
+        # Customers are not a public table
+        assert await read_names(get_public_read_db, request_for()) == ["replica"]
+
+    @pytest.mark.anyio
+    async def test_bulk_update_of_public_table_is_tracked(self, router, databases):
+        """Test that an UPDATE statement, which skips the flush, is also tracked"""
+        primary, _ = databases
+        async with AsyncSessionLocal(bind=primary) as db:
+            await db.execute(update(models.Business).values(business_name="renamed"))
+            await db.commit()
+
+        assert await read_names(get_public_read_db, request_for()) == ["renamed"]
+
+    @pytest.mark.anyio
+    async def test_rolled_back_write_is_ignored(self, router, databases):
+        """Test that nothing is routed to the primary for a write that was undone"""
+        primary, _ = databases
+        async with AsyncSessionLocal(bind=primary) as db:
+            db.info["principal"] = CUSTOMER
+            db.add(models.Customer(email=CUSTOMER[1], hashed_password="x", full_name="C"))
+            await db.flush()
+            await db.rollback()
+            await db.commit()
+
+        assert await read_names(get_read_db, request_for(CUSTOMER)) == ["replica"]
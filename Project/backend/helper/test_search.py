@@ -0,0 +1,117 @@
+"""
+Pytest tests for the full-text search backends in search.py
+"""
+import pytest
+
+import models
+import search
+from pagination import PageParams, paginate
+
+
+@pytest.fixture
+def fts(db_engine):
+    """Initialise the SQLite FTS5 backend and restore the default afterwards"""
+    backend = search.init_search(db_engine)
+    if not isinstance(backend, search.SQLiteFTSSearch):
+        pytest.skip("SQLite build lacks FTS5")
+    yield backend
+    search.backend = search.LikeSearch()
+
+
+def add_business(db, email, name, specialty=None, description=None, address=None):
+    business = models.Business(
+        email=email, hashed_password="x", business_name=name,
+        specialty=specialty, description=description, address=address
+    )
+    db.add(business)
+    db.commit()
+    return business
+
+
+def run(db, backend, **filters):
+    query, rank = backend.filter(db.query(models.Business), **filters)
+    if rank is not None:
+        query = query.order_by(rank, models.Business.id)
+    return [business.business_name for business in query.all()]
+
+
+class TestSQLiteFTSSearch:
+    """Test suite for the FTS5 search backend"""
+
+    def test_name_match_outranks_description_match(self, db_session, fts):
+        """Test that bm25 column weights put name matches first"""
+        add_business(db_session, "a@x.com", "Bright Smiles", description="Dental care for families")
+        add_business(db_session, "b@x.com", "Dental Studio", description="Teeth cleaning")
+
+        assert run(db_session, fts, text="dental") == ["Dental Studio", "Bright Smiles"]
+
+    def test_words_match_as_prefixes(self, db_session, fts):
+        """Test that partial words find longer words"""
+        add_business(db_session, "a@x.com", "Downtown Barber", specialty="Barbershop")
+
+        assert run(db_session, fts, text="barb down") == ["Downtown Barber"]
+        assert run(db_session, fts, text="barb uptown") == []
+
+    def test_column_filters_only_match_their_column(self, db_session, fts):
+        """Test that specialty and location filters ignore other columns"""
+        add_business(db_session, "a@x.com", "Paris Nails", specialty="Nails", address="12 Rue de Lyon")
+        add_business(db_session, "b@x.com", "Lyon Nails", specialty="Nails", address="5 Paris Street")
+
+        assert run(db_session, fts, location="paris") == ["Lyon Nails"]
+        assert run(db_session, fts, specialty="nails", location="lyon") == ["Paris Nails"]
+
+    def test_index_follows_inserts_updates_and_deletes(self, db_session, fts):
+        """Test that triggers keep the index in sync with the businesses table"""
+        business = add_business(db_session, "a@x.com", "Old Name")
+        assert run(db_session, fts, text="old") == ["Old Name"]
+
+        business.business_name = "New Name"
+        db_session.commit()
+        assert run(db_session, fts, text="old") == []
+        assert run(db_session, fts, text="new") == ["New Name"]
+
+        db_session.delete(business)
+        db_session.commit()
+        assert run(db_session, fts, text="new") == []
+
+    def test_existing_rows_are_indexed_on_init(self, db_engine, db_session):
+        """Test that businesses created before init are searchable"""
+        add_business(db_session, "a@x.com", "Legacy Spa")
+
+        backend = search.init_search(db_engine)
+        try:
+            if not isinstance(backend, search.SQLiteFTSSearch):
+                pytest.skip("SQLite build lacks FTS5")
+            assert run(db_session, backend, text="spa") == ["Legacy Spa"]
+        finally:
+            search.backend = search.LikeSearch()
+
+    def test_keyset_pagination_over_ranked_results(self, db_session, fts):
+        """Test that ranked pages neither skip nor repeat businesses"""
+        for i in range(7):
+            add_business(db_session, f"{i}@x.com", f"Yoga {i}", description="yoga " * (i % 3))
+
+        query, rank = fts.filter(db_session.query(models.Business), text="yoga")
+        query = query.add_columns(rank)
+        key = lambda row: (row.search_rank, row.Business.id)
+        seen = []
+        cursor = None
+        while True:
+            rows, cursor = paginate(query, [rank, models.Business.id], PageParams(cursor=cursor, limit=3), key=key)
+            seen.extend(key(row) for row in rows)
+            if cursor is None:
+                break
+
+        assert len(seen) == 7
+        assert seen == sorted(seen)
+
+
+class TestLikeSearch:
+    """Test suite for the substring fallback"""
+
+    def test_every_word_must_match_some_column(self, db_session):
+        """Test that free text words are ANDed across columns"""
+        add_business(db_session, "a@x.com", "Downtown Barber", address="Main Street")
+        add_business(db_session, "b@x.com", "Uptown Barber")
+
+        assert run(db_session, search.LikeSearch(), text="barber main") == ["Downtown Barber"]
@@ -0,0 +1,222 @@
+"""
+Pytest tests for serving uploaded files (serving.py and GET /upload/files)
+"""
+import hashlib
+import os
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+
+import blobs
+import models
+import serving
+from blobs import IMMUTABLE
+from replicas import get_public_read_db
+from routers import upload as upload_router
+from serving import FileCache, StoredInfo
+
+VIDEO = b"\x00\x00\x00\x18ftypmp42" + bytes(range(256)) * 4
+VIDEO_NAME = f"{hashlib.sha256(VIDEO).hexdigest()}.mp4"
+IMAGE_NAME = f"{'cd' * 32}.png"
+
+
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    """Local storage in tmp_path and an empty file cache"""
+    monkeypatch.setattr(blobs.blob_store, "backend", blobs.LocalBackend(tmp_path))
+    cache = FileCache()
+    monkeypatch.setattr(upload_router, "file_cache", cache)
+    return cache
+
+
+@pytest.fixture
+async def client(async_db_engine, async_db_session):
+    app = FastAPI()
+    app.include_router(upload_router.router)
+    app.dependency_overrides[get_public_read_db] = lambda: async_db_session
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+async def store(db, directory, filename, content, content_type):
+    (directory / filename).write_bytes(content)
+    db.add(models.StoredFile(filename=filename, content_type=content_type, refcount=1, size=len(content)))
+    await db.commit()
+
+
+class TestFileCache:
+    """Test suite for the file metadata cache"""
+
+    def test_entries_expire_and_are_evicted(self, clock):
+        """Test that entries live for the TTL and the least recently used goes first"""
+        cache = FileCache(max_entries=2, ttl_seconds=10, clock=clock)
+        for name in ("a.png", "b.png", "c.png"):
+            cache.put_stored(name, StoredInfo("image/png", ()))
+
+        assert cache.stored("a.png") is None
+        assert cache.stored("c.png") == StoredInfo("image/png", ())
+        clock.now = 10
+        assert cache.stored("c.png") is None
+
+    def test_content_names(self):
+        """Test that hash names and their variants count as content-named, older names do not"""
+        assert serving.is_content_named(VIDEO_NAME)
+        assert serving.is_content_named(f"{'cd' * 32}_320w.webp")
+        assert not serving.is_content_named("business_1_cover_x.jpg")
+
+    def test_invalidate_forgets_every_entry_of_a_file(self, tmp_path):
+        """Test that invalidating a name drops its database and stat entries, and stale puts"""
+        cache = FileCache()
+        (tmp_path / "a.png").write_bytes(b"x")
+        cache.put_stored("a.png", StoredInfo("image/png", ()))
+        assert cache.stat("a.png", tmp_path / "a.png").st_size == 1
+        generation = cache.generation
+
+        cache.invalidate(["a.png"])
+        cache.put_stored("a.png", StoredInfo("image/png", ()), generation)
+
+        assert cache.stats()["entries"] == 0
+        assert cache.stat("missing.png", tmp_path / "missing.png") is None
+
+
+class TestServing:
+    """Test suite for GET /upload/files/{filename}"""
+
+    @pytest.mark.anyio
+    async def test_content_named_file_is_immutable(
+        self, tmp_path, files, client, async_db_session, async_db_engine, count_queries
+    ):
+        """Test that a video gets an immutable name-based ETag, 304s and no repeated lookups"""
+        await store(async_db_session, tmp_path, VIDEO_NAME, VIDEO, "video/mp4")
+
+        response = await client.get(f"/upload/files/{VIDEO_NAME}")
+        with count_queries(async_db_engine) as statements:
+            again = await client.get(f"/upload/files/{VIDEO_NAME}", headers={"If-None-Match": f'"{VIDEO_NAME}"'})
+
+        assert response.status_code == 200 and response.content == VIDEO
+        assert response.headers["content-type"] == "video/mp4"
+        assert response.headers["etag"] == f'"{VIDEO_NAME}"'
+        assert response.headers["cache-control"] == IMMUTABLE
+        assert again.status_code == 304 and again.headers["cache-control"] == IMMUTABLE
+        assert len(statements) == 0
+
+    @pytest.mark.anyio
+    async def test_range_requests(self, tmp_path, files, client, async_db_session):
+        """Test that a video player can fetch byte ranges, guarded by If-Range"""
+        await store(async_db_session, tmp_path, VIDEO_NAME, VIDEO, "video/mp4")
+
+        partial = await client.get(f"/upload/files/{VIDEO_NAME}", headers={"Range": "bytes=4-11"})
+        stale = await client.get(
+            f"/upload/files/{VIDEO_NAME}", headers={"Range": "bytes=4-11", "If-Range": '"other"'}
+        )
+        beyond = await client.get(f"/upload/files/{VIDEO_NAME}", headers={"Range": f"bytes={len(VIDEO)}-"})
+
+        assert partial.status_code == 206 and partial.content == VIDEO[4:12]
+        assert partial.headers["content-range"] == f"bytes 4-11/{len(VIDEO)}"
+        assert partial.headers["accept-ranges"] == "bytes"
+        assert stale.status_code == 200 and stale.content == VIDEO
+        assert beyond.status_code == 416
+
+    @pytest.mark.anyio
+    async def test_image_is_final_once_it_has_variants(self, tmp_path, files, client, async_db_session):
+        """Test that an image is revalidated until its variants exist, then cached for good"""
+        await store(async_db_session, tmp_path, IMAGE_NAME, b"\x89PNG\r\n\x1a\n", "image/png")
+
+        before = await client.get(f"/upload/files/{IMAGE_NAME}?w=320", headers={"Accept": "image/webp"})
+        variant = f"{'cd' * 32}_320w.webp"
+        (tmp_path / variant).write_bytes(b"RIFF")
+        async_db_session.add(models.ImageVariant(
+            source=IMAGE_NAME, filename=variant, content_type="image/webp", width=320, height=320, size=4
+        ))
+        await async_db_session.commit()
+        files.invalidate([IMAGE_NAME])
+        after = await client.get(
+            f"/upload/files/{IMAGE_NAME}?w=320", headers={"Accept": "image/webp", "If-None-Match": before.headers["etag"]}
+        )
+
+        assert before.headers["cache-control"] == "no-cache"
+        assert before.headers["vary"] == "Accept"
+        assert after.status_code == 200 and after.content == b"RIFF"
+        assert after.headers["etag"] == f'"{variant}"'
+        assert after.headers["cache-control"] == IMMUTABLE
+
+    @pytest.mark.anyio
+    async def test_older_uploads_are_revalidated(self, tmp_path, files, client, async_db_session):
+        """Test that a file stored before content naming gets a stat ETag and no-cache"""
+        await store(async_db_session, tmp_path, "business_1_video_x.mp4", VIDEO, None)
+
+        response = await client.get("/upload/files/business_1_video_x.mp4")
+        again = await client.get("/upload/files/business_1_video_x.mp4", headers={"If-None-Match": response.headers["etag"]})
+
+        assert response.headers["content-type"] == "video/mp4"
+        assert response.headers["cache-control"] == "no-cache"
+        assert response.headers["etag"] != '"business_1_video_x.mp4"'
+        assert again.status_code == 304
+
+    @pytest.mark.anyio
+    async def test_unknown_and_missing_files(self, tmp_path, files, client, async_db_session):
+        """Test that files without a row, or whose file is gone, are not found"""
+        async_db_session.add(models.StoredFile(filename=VIDEO_NAME, content_type="video/mp4", refcount=1))
+        await async_db_session.commit()
+
+        assert (await client.get("/upload/files/unknown.mp4")).status_code == 404
+        assert (await client.get(f"/upload/files/{VIDEO_NAME}")).status_code == 404
+
+
+def test_sweeper_invalidates_collected_files(tmp_path, db_engine, monkeypatch):
+    """Test that files the sweeper removes are dropped from the file cache"""
+    import storage
+
+    cache = FileCache()
+    monkeypatch.setattr(storage, "file_cache", cache)
+    cache.put_stored("gone.png", StoredInfo("image/png", ()))
+    (tmp_path / "gone.png").write_bytes(b"x")
+    os.utime(tmp_path / "gone.png", (0, 0))
+
+    storage.Sweeper(grace_seconds=60).sweep(db_engine, blobs.LocalBackend(tmp_path))
+
+    assert cache.stored("gone.png") is None
+
+
+class TestVideos:
+    """Test suite for serving transcoded videos and their status"""
+
+    @pytest.mark.anyio
+    async def test_transcode_is_served_once_done(self, tmp_path, files, client, async_db_session):
+        """Test that the original is revalidated while queued, then the transcode and poster are served"""
+        await store(async_db_session, tmp_path, VIDEO_NAME, VIDEO, "video/mp4")
+        job = models.TranscodeJob(source=VIDEO_NAME, status="queued")
+        async_db_session.add(job)
+        await async_db_session.commit()
+
+        queued = await client.get(f"/upload/files/{VIDEO_NAME}")
+        no_poster = await client.get(f"/upload/files/{VIDEO_NAME}?poster=true")
+        stem = VIDEO_NAME[:-4]
+        (tmp_path / f"{stem}_web.mp4").write_bytes(b"web")
+        (tmp_path / f"{stem}_poster.jpg").write_bytes(b"\xff\xd8")
+        job.status, job.output, job.poster, job.progress = "done", f"{stem}_web.mp4", f"{stem}_poster.jpg", 1.0
+        await async_db_session.commit()
+        files.invalidate([VIDEO_NAME])
+        done = await client.get(f"/upload/files/{VIDEO_NAME}")
+        poster = await client.get(f"/upload/files/{VIDEO_NAME}?poster=true")
+
+        assert queued.content == VIDEO and queued.headers["cache-control"] == "no-cache"
+        assert no_poster.status_code == 404
+        assert done.content == b"web" and done.headers["cache-control"] == IMMUTABLE
+        assert done.headers["content-type"] == "video/mp4"
+        assert poster.content == b"\xff\xd8" and poster.headers["content-type"] == "image/jpeg"
+
+    @pytest.mark.anyio
+    async def test_status(self, async_db_session):
+        """Test that the status endpoint reports progress, and the poster once done"""
+        async_db_session.add(models.TranscodeJob(source=VIDEO_NAME, status="running", progress=0.25, attempts=1))
+        await async_db_session.commit()
+
+        running = await upload_router.get_video_status(VIDEO_NAME, async_db_session)
+
+        assert (running.status, running.progress, running.poster_url) == ("running", 0.25, None)
+        assert running.url == f"/upload/files/{VIDEO_NAME}"
+        with pytest.raises(HTTPException) as error:
+            await upload_router.get_video_status("unknown.mp4", async_db_session)
+        assert error.value.status_code == 404
@@ -0,0 +1,127 @@
+"""
+Pytest tests for content-addressed upload storage in storage.py
+"""
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+import blobs
+import models
+import storage
+from blobs import LocalBackend
+from storage import Sweeper, init_storage
+from uploads import UploadedFile
+
+DIGEST = "ab" * 32
+
+
+def upload_in(directory, content=b"\x89PNG\r\n\x1a\n", digest=DIGEST):
+    temp_path = directory / f".upload-{time.monotonic_ns()}.part"
+    temp_path.write_bytes(content)
+    return UploadedFile(temp_path, len(content), "image/png", "a.png", digest)
+
+
+def age(path, seconds):
+    """Set a file's modification time ``seconds`` into the past"""
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+class TestReferences:
+    """Test suite for storing uploads and counting references"""
+
+    @pytest.mark.anyio
+    async def test_identical_uploads_share_a_file(self, tmp_path, async_db_session, monkeypatch):
+        """Test that the same content is stored once and counted per reference"""
+        monkeypatch.setattr(blobs.blob_store, "backend", LocalBackend(tmp_path))
+        upload = upload_in(tmp_path)
+        first = await storage.store(upload)
+        await storage.acquire(async_db_session, first, upload.content_type, upload.size)
+        second = await storage.store(upload_in(tmp_path))
+        await storage.acquire(async_db_session, second)
+        await async_db_session.commit()
+
+        assert first == second == f"{DIGEST}.png"
+        assert [path.name for path in tmp_path.iterdir()] == [first]
+        row = await async_db_session.scalar(select(models.StoredFile))
+        assert (row.refcount, row.size, row.content_type) == (2, 8, "image/png")
+
+    @pytest.mark.anyio
+    async def test_release_marks_the_time(self, async_db_session):
+        """Test that releasing lowers the count and records when, and acquiring clears it"""
+        await storage.acquire(async_db_session, "a.png")
+        await storage.release(async_db_session, "a.png")
+        await storage.release(async_db_session, None)
+        await async_db_session.commit()
+        row = await async_db_session.scalar(select(models.StoredFile))
+        assert row.refcount == 0 and row.released_at is not None
+
+        await storage.acquire(async_db_session, "a.png")
+        await async_db_session.commit()
+        await async_db_session.refresh(row)
+        assert row.refcount == 1 and row.released_at is None
+
+
+class TestSweeper:
+    """Test suite for the unreferenced upload sweeper"""
+
+    def test_only_unreferenced_old_files_are_removed(self, tmp_path, db_engine, db_session):
+        """Test that released files past the grace period go, with their variants and stray files"""
+        long_ago = datetime.utcnow() - timedelta(hours=2)
+        db_session.add_all([
+            models.StoredFile(filename="kept.png", refcount=1),
+            models.StoredFile(filename="released.png", refcount=0, released_at=long_ago),
+            models.StoredFile(filename="just_released.png", refcount=0, released_at=datetime.utcnow()),
+            models.ImageVariant(source="released.png", filename="released_320w.webp",
+                                content_type="image/webp", width=320, height=200, size=1),
+        ])
+        db_session.commit()
+        for name in ["kept.png", "released.png", "just_released.png", "released_320w.webp",
+                     ".upload-1.part", "failed_request.png", "new_upload.png"]:
+            (tmp_path / name).write_bytes(b"x")
+            if name != "new_upload.png":
+                age(tmp_path / name, 7200)
+
+        removed = Sweeper(grace_seconds=3600).sweep(db_engine, LocalBackend(tmp_path))
+
+        assert removed == 4
+        assert sorted(path.name for path in tmp_path.iterdir()) == [
+            "just_released.png", "kept.png", "new_upload.png"
+        ]
+        db_session.expire_all()
+        assert sorted(db_session.scalars(select(models.StoredFile.filename))) == ["just_released.png", "kept.png"]
+        assert db_session.scalars(select(models.ImageVariant)).all() == []
+
+    def test_reacquired_file_survives(self, tmp_path, db_engine, db_session):
+        """Test that a file referenced again after its release is not collected"""
+        db_session.add(models.StoredFile(
+            filename="back.png", refcount=1, released_at=datetime.utcnow() - timedelta(hours=2)
+        ))
+        db_session.commit()
+        (tmp_path / "back.png").write_bytes(b"x")
+        age(tmp_path / "back.png", 7200)
+
+        assert Sweeper(grace_seconds=3600).sweep(db_engine, LocalBackend(tmp_path)) == 0
+        assert (tmp_path / "back.png").exists()
+
+
+class TestInitStorage:
+    """Test suite for counting references to uploads stored before reference counts"""
+
+    def test_existing_images_are_counted(self, db_engine, db_session):
+        """Test that images named by businesses get rows with their reference counts"""
+        db_session.add_all([
+            models.Business(email="a@example.com", hashed_password="x", business_name="A",
+                            profile_image="logo.png", cover_image="shared.jpg"),
+            models.Business(email="b@example.com", hashed_password="x", business_name="B",
+                            cover_image="shared.jpg"),
+        ])
+        db_session.commit()
+
+        assert init_storage(db_engine) == 2
+        assert init_storage(db_engine) == 0
+        counts = dict(db_session.execute(select(models.StoredFile.filename, models.StoredFile.refcount)).all())
+        assert counts == {"logo.png": 1, "shared.jpg": 2}
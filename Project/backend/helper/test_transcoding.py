@@ -0,0 +1,165 @@
+"""
+Pytest tests for the video transcode queue in transcoding.py
+"""
+import shutil
+import subprocess
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import models
+import transcoding
+from blobs import LocalBackend
+from transcoding import DONE, FAILED, MAX_ATTEMPTS, QUEUED, RUNNING, Transcoded, Transcoder
+
+SOURCE = f"{'ef' * 32}.avi"
+
+
+def fake_transcode(source, output_dir, on_progress, timeout):
+    on_progress(0.5)
+    (output_dir / f"{source.stem}_web.mp4").write_bytes(b"mp4:" + source.read_bytes())
+    (output_dir / f"{source.stem}_poster.jpg").write_bytes(b"jpg")
+    return Transcoded(f"{source.stem}_web.mp4", f"{source.stem}_poster.jpg", 12.5)
+
+
+def failing_transcode(source, output_dir, on_progress, timeout):
+    raise transcoding.TranscodeError("ffmpeg exited with 1: Invalid data found")
+
+
+def add_job(db, source=SOURCE, **values):
+    job = models.TranscodeJob(source=source, **{"status": QUEUED, **values})
+    db.add(job)
+    db.commit()
+    return job
+
+
+def job_row(engine, source=SOURCE):
+    with Session(engine) as db:
+        return db.scalar(select(models.TranscodeJob).where(models.TranscodeJob.source == source))
+
+
+class TestQueue:
+    """Test suite for queueing transcodes"""
+
+    @pytest.mark.anyio
+    async def test_enqueue_once_per_video(self, async_db_session):
+        """Test that the same video uploaded twice gets one job"""
+        await transcoding.enqueue(async_db_session, SOURCE)
+        await async_db_session.commit()
+        await transcoding.enqueue(async_db_session, SOURCE)
+        await async_db_session.commit()
+
+        jobs = (await async_db_session.scalars(select(models.TranscodeJob))).all()
+        assert [(job.source, job.status, job.progress, job.attempts) for job in jobs] == [(SOURCE, QUEUED, 0.0, 0)]
+
+    def test_existing_videos_are_queued(self, db_engine, db_session):
+        """Test that referenced videos uploaded before transcoding get jobs"""
+        db_session.add_all([
+            models.StoredFile(filename="business_1_cover_x.mov", refcount=1),
+            models.StoredFile(filename="business_1_cover_y.jpg", refcount=1),
+            models.StoredFile(filename="released.mp4", refcount=0),
+        ])
+        db_session.commit()
+
+        assert transcoding.init_transcoding(db_engine) == 1
+        assert transcoding.init_transcoding(db_engine) == 0
+        assert job_row(db_engine, "business_1_cover_x.mov").status == QUEUED
+
+
+class TestTranscoder:
+    """Test suite for claiming and running transcode jobs"""
+
+    def test_job_runs_to_done(self, tmp_path, db_engine, db_session):
+        """Test that a claimed job reports progress, stores its outputs and is recorded as done"""
+        backend = LocalBackend(tmp_path)
+        (tmp_path / SOURCE).write_bytes(b"avi")
+        add_job(db_session)
+        seen = []
+
+        def transcode(source, output_dir, on_progress, timeout):
+            result = fake_transcode(source, output_dir, on_progress, timeout)
+            job = job_row(db_engine)
+            seen.append((job.status, job.progress, job.attempts))
+            return result
+
+        transcoder = Transcoder(run=transcode)
+        assert transcoder.run_once(db_engine, backend)
+        assert not transcoder.run_once(db_engine, backend)
+
+        job = job_row(db_engine)
+        assert seen == [(RUNNING, 0.5, 1)]
+        assert (job.status, job.progress, job.duration) == (DONE, 1.0, 12.5)
+        assert (tmp_path / job.output).read_bytes() == b"mp4:avi"
+        assert (tmp_path / job.poster).exists()
+        assert sorted(path.name for path in tmp_path.iterdir()) == sorted([SOURCE, job.output, job.poster])
+        assert transcoder.stats()["completed"] == 1
+
+    def test_failures_are_retried_then_given_up(self, tmp_path, db_engine, db_session):
+        """Test that a failing job is queued again until MAX_ATTEMPTS, then marked failed"""
+        (tmp_path / SOURCE).write_bytes(b"avi")
+        add_job(db_session)
+        transcoder = Transcoder(run=failing_transcode)
+
+        runs = 0
+        while transcoder.run_once(db_engine, LocalBackend(tmp_path)):
+            runs += 1
+
+        job = job_row(db_engine)
+        assert runs == MAX_ATTEMPTS
+        assert (job.status, job.attempts) == (FAILED, MAX_ATTEMPTS)
+        assert "Invalid data" in job.error
+        assert [path.name for path in tmp_path.iterdir()] == [SOURCE]
+
+    def test_stalled_jobs_are_claimed_again(self, db_engine, db_session):
+        """Test that a running job without a recent heartbeat is taken over, or given up"""
+        long_ago = datetime.utcnow() - timedelta(hours=1)
+        add_job(db_session, status=RUNNING, attempts=1, updated_at=long_ago)
+        add_job(db_session, source="busy.mp4", status=RUNNING, attempts=1, updated_at=datetime.utcnow())
+        add_job(db_session, source="dead.mp4", status=RUNNING, attempts=MAX_ATTEMPTS, updated_at=long_ago)
+        transcoder = Transcoder(stall_seconds=60)
+
+        job_id, source = transcoder.claim(db_engine)
+
+        assert source == SOURCE and job_row(db_engine).attempts == 2
+        assert transcoder.claim(db_engine) is None
+        assert job_row(db_engine, "dead.mp4").status == FAILED
+        assert job_row(db_engine, "busy.mp4").status == RUNNING
+
+    def test_sweeper_keeps_outputs_of_stored_videos(self, tmp_path, db_engine, db_session):
+        """Test that transcode outputs live as long as their source"""
+        import storage
+
+        db_session.add(models.StoredFile(filename=SOURCE, refcount=1))
+        add_job(db_session, status=DONE, output="out.mp4", poster="out.jpg")
+        add_job(db_session, source="gone.mp4", status=DONE, output="gone_web.mp4", poster="gone_poster.jpg")
+        for name in (SOURCE, "out.mp4", "out.jpg", "gone_web.mp4", "gone_poster.jpg"):
+            (tmp_path / name).write_bytes(b"x")
+
+        storage.Sweeper(grace_seconds=0).sweep(db_engine, LocalBackend(tmp_path))
+
+        assert sorted(path.name for path in tmp_path.iterdir()) == sorted([SOURCE, "out.jpg", "out.mp4"])
+        assert job_row(db_engine, "gone.mp4") is None
+
+
+@pytest.mark.skipif(shutil.which(transcoding.FFMPEG) is None, reason="ffmpeg is not installed")
+def test_ffmpeg_makes_a_faststart_mp4_and_poster(tmp_path):
+    """Test that a real video is transcoded with its index first, and a poster frame is taken"""
+    source = tmp_path / "clip.avi"
+    subprocess.run([
+        transcoding.FFMPEG, "-loglevel", "error", "-f", "lavfi", "-i", "testsrc=duration=2:size=320x240:rate=10",
+        "-c:v", "mpeg4", str(source)
+    ], check=True)
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    progress = []
+
+    result = transcoding.transcode(source, output_dir, progress.append)
+
+    head = (output_dir / result.output).read_bytes()[:4096]
+    # faststart: the index (moov) comes before the media data (mdat)
+    assert b"moov" in head and (b"mdat" not in head or head.index(b"moov") < head.index(b"mdat"))
+    assert (output_dir / result.poster).read_bytes()[:2] == b"\xff\xd8"
+    assert result.duration == pytest.approx(2, abs=0.2)
+    assert progress
@@ -0,0 +1,136 @@
+"""
+Pytest tests for streaming uploads in uploads.py
+"""
+import hashlib
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import uploads
+from uploads import receive_upload, sniff
+
+BOUNDARY = "----testboundary"
+PNG = bytes.fromhex("89504e470d0a1a0a0000000d49484452")
+ALLOWED = {"image/png", "image/jpeg", "video/mp4"}
+
+
+def multipart_body(content: bytes, content_type="image/png", field="file", filename="photo.png") -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="note"\r\n\r\n'
+        f"hello\r\n"
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def streaming_request(body: bytes, chunk_size=1000, content_length=True):
+    """Request whose body arrives in chunks; records how much was read"""
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    if content_length:
+        headers.append((b"content-length", str(len(body)).encode()))
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    received = []
+
+    async def receive():
+        chunk = chunks.pop(0) if chunks else b""
+        received.append(chunk)
+        return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+    request = Request({"type": "http", "method": "POST", "headers": headers}, receive)
+    return request, received
+
+
+class TestSniff:
+    """Test suite for content sniffing"""
+
+    def test_known_signatures(self):
+        """Test that types are recognised from their magic bytes"""
+        assert sniff(PNG) == "image/png"
+        assert sniff(b"\xff\xd8\xff\xe0" + bytes(8)) == "image/jpeg"
+        assert sniff(b"\x00\x00\x00\x18ftypisom") == "video/mp4"
+        assert sniff(b"\x00\x00\x00\x14ftypqt  ") == "video/quicktime"
+        assert sniff(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+
+    def test_unknown_content(self):
+        """Test that text and look-alikes are not recognised"""
+        assert sniff(b"<html><body>") is None
+        assert sniff(b"XXXX\x00\x00\x00\x00WEBPVP8 ") is None
+
+
+class TestReceiveUpload:
+    """Test suite for receive_upload"""
+
+    @pytest.mark.anyio
+    async def test_file_is_streamed_to_a_temp_file(self, tmp_path, monkeypatch):
+        """Test that a chunked upload is written in pieces and typed by its content"""
+        monkeypatch.setattr(uploads, "WRITE_BUFFER_BYTES", 4096)
+        content = PNG + bytes(range(256)) * 100
+        request, _ = streaming_request(multipart_body(content, content_type="image/jpeg"), chunk_size=777)
+
+        upload = await receive_upload(request, tmp_path, 1024 * 1024, ALLOWED)
+
+        assert upload.size == len(content)
+        assert upload.content_type == "image/png"
+        assert upload.extension == ".png"
+        assert upload.filename == "photo.png"
+        assert upload.temp_path.read_bytes() == content
+        assert upload.digest == hashlib.sha256(content).hexdigest()
+        assert list(tmp_path.iterdir()) == [upload.temp_path]
+
+    @pytest.mark.anyio
+    async def test_declared_length_over_limit_is_rejected_unread(self, tmp_path):
+        """Test that a too-large Content-Length is refused before reading the body"""
+        request, received = streaming_request(multipart_body(PNG + bytes(200_000)))
+
+        with pytest.raises(HTTPException) as error:
+            await receive_upload(request, tmp_path, 100_000, ALLOWED)
+
+        assert error.value.status_code == 413
+        assert received == []
+
+    @pytest.mark.anyio
+    async def test_stream_over_limit_stops_early(self, tmp_path):
+        """Test that a body without a length is cut off once it passes the limit"""
+        body = multipart_body(PNG + bytes(500_000))
+        request, received = streaming_request(body, chunk_size=10_000, content_length=False)
+
+        with pytest.raises(HTTPException) as error:
+            await receive_upload(request, tmp_path, 100_000, ALLOWED)
+
+        assert error.value.status_code == 413
+        assert sum(map(len, received)) < 120_000
+        assert list(tmp_path.iterdir()) == []
+
+    @pytest.mark.anyio
+    async def test_disguised_file_is_rejected(self, tmp_path):
+        """Test that content not matching an allowed type is refused whatever it claims to be"""
+        request, _ = streaming_request(multipart_body(b"<script>alert(1)</script>", content_type="image/png"))
+
+        with pytest.raises(HTTPException) as error:
+            await receive_upload(request, tmp_path, 100_000, ALLOWED)
+
+        assert error.value.status_code == 415
+        assert list(tmp_path.iterdir()) == []
+
+    @pytest.mark.anyio
+    async def test_disallowed_declared_type_is_rejected(self, tmp_path):
+        """Test that a declared type outside the allowed set is refused"""
+        request, _ = streaming_request(multipart_body(PNG, content_type="application/pdf"))
+
+        with pytest.raises(HTTPException) as error:
+            await receive_upload(request, tmp_path, 100_000, ALLOWED)
+
+        assert error.value.status_code == 415
+
+    @pytest.mark.anyio
+    async def test_missing_field(self, tmp_path):
+        """Test that a form without the file field is a 422"""
+        request, _ = streaming_request(multipart_body(PNG, field="other"))
+
+        with pytest.raises(HTTPException) as error:
+            await receive_upload(request, tmp_path, 100_000, ALLOWED)
+
+        assert error.value.status_code == 422
@@ -0,0 +1,64 @@
+"""
+Short, time-ordered appointment IDs.
+
+An ID is 10 Crockford base32 characters. The alphabet is digits and capitals
+without I, L, O and U, so an ID reads back unambiguously over the phone.
+
+- 7 characters: seconds since 2024-01-01 UTC (enough for a thousand years)
+- 3 characters: a sequence that restarts at a random value every second,
+  in each process
+
+No lookup is needed before the insert. A process repeats an ID only if it
+makes more than 32768 in one second. Two workers collide only when their
+sequences meet in the same second. The unique index on
+appointments.appointment_id catches that, and `create_appointment` retries
+with a fresh ID.
+
+IDs sort by creation time, because the alphabet is in ASCII order. New rows
+therefore land at the right-hand edge of the unique index's B-tree instead
+of on a random leaf page.
+"""
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+
+TIME_CHARS = 7
+SEQUENCE_CHARS = 3
+SEQUENCE_SIZE = len(ALPHABET) ** SEQUENCE_CHARS
+
+
+def encode(value: int, width: int) -> str:
+    """``value`` as ``width`` base32 characters, most significant first"""
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+class AppointmentIds:
+    """Generator of time-ordered appointment IDs for one process"""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._second: Optional[int] = None
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> str:
+        with self._lock:
+            second = int(self.clock() - EPOCH)
+            if second != self._second:
+                self._second = second
+                self._sequence = secrets.randbelow(SEQUENCE_SIZE)
+            sequence = self._sequence
+            self._sequence = (sequence + 1) % SEQUENCE_SIZE
+        return encode(second, TIME_CHARS) + encode(sequence, SEQUENCE_CHARS)
+
+
+appointment_ids = AppointmentIds()
@@ -0,0 +1,238 @@
+"""
+Resized, re-encoded variants of uploaded business images.
+
+Profile and cover images are stored as uploaded, up to 25 MB each. A
+business card needs a few hundred pixels of one, so serving the original
+wastes bandwidth and client decode time.
+
+After an image upload, `generate_variants` runs as a background task:
+
+- `render_variants` runs in a pool of worker processes (IMAGE_WORKERS). It
+  decodes a local copy of the original once, with JPEG DCT scaling when
+  only a smaller size is needed, and writes each of VARIANT_WIDTHS (never
+  wider than the original) in AVIF (if Pillow was built with it), WebP and
+  a JPEG or PNG fallback. The files then go to the blob backend (blobs.py).
+- EXIF orientation is applied to the pixels. EXIF, XMP and comments
+  (camera, GPS position) are dropped; the ICC colour profile is kept.
+- The variants are recorded as `ImageVariant` rows if the image is still
+  referenced (see storage.py). Until then the original is served. An image
+  uploaded again, by anyone, reuses its variants.
+
+`choose` picks the variant to serve for a `?w=` width and an Accept header:
+the most compact format the client lists (AVIF, then WebP, then the
+fallback, which a wildcard also accepts), at the smallest width covering
+the request. Animated images and images over MAX_PIXELS get no variants.
+"""
+import asyncio
+import io
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from PIL import Image, ImageOps, features
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+from blobs import blob_store
+from database import AsyncSessionLocal
+from serving import file_cache
+from workers import PoolBusy, WorkerPool
+
+logger = logging.getLogger(__name__)
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(os.cpu_count() or 1)))
+IMAGE_MAX_PENDING = int(os.getenv("IMAGE_MAX_PENDING", str(16 * max(IMAGE_WORKERS, 1))))
+VARIANT_WIDTHS = tuple(sorted(
+    int(width) for width in os.getenv("IMAGE_VARIANT_WIDTHS", "320,640,1280,1920").split(",") if width.strip()
+))
+
+# Larger images are left as uploaded rather than decoded
+MAX_PIXELS = 50_000_000
+
+# Uploaded types that get variants
+IMAGE_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+
+# Served in this order of preference when the client accepts them
+PREFERENCE = ["image/avif", "image/webp", "image/jpeg", "image/png"]
+
+# Only sent to clients that list them; */* and image/* do not count
+MODERN_TYPES = {"image/avif", "image/webp"}
+
+# (content type, extension, Pillow format, save options)
+ENCODINGS = {
+    "image/avif": (".avif", "AVIF", {"quality": 60, "speed": 8}),
+    "image/webp": (".webp", "WEBP", {"quality": 80, "method": 4}),
+    "image/jpeg": (".jpg", "JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+    "image/png": (".png", "PNG", {"optimize": True}),
+}
+
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+# (filename, content type, width, height, size in bytes)
+Rendered = Tuple[str, str, int, int, int]
+
+
+def _encodings(has_alpha: bool) -> List[str]:
+    types = ["image/avif"] if features.check("avif") else []
+    return types + ["image/webp", "image/png" if has_alpha else "image/jpeg"]
+
+
+def render_variants(source: str, output_dir: str, widths: Sequence[int] = VARIANT_WIDTHS) -> List[Rendered]:
+    """
+    Write the variants of the image at ``source`` to ``output_dir``, named
+    ``<stem>_<width>w<ext>``. Runs in a worker process.
+    """
+    path = Path(source)
+    rendered: List[Rendered] = []
+    with Image.open(path) as image:
+        if getattr(image, "is_animated", False) or image.width * image.height > MAX_PIXELS:
+            return []
+
+        orientation = image.getexif().get(0x0112, 1)
+        width, height = image.size
+        if orientation in TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+        targets = sorted({min(target, width) for target in widths})
+        if not targets:
+            return []
+
+        # Decode a JPEG at 1/2, 1/4 or 1/8 scale when the largest variant fits
+        largest = max(targets)
+        draft_size = (largest, max(1, largest * height // width))
+        if orientation in TRANSPOSED_ORIENTATIONS:
+            draft_size = draft_size[::-1]
+        image.draft("RGB", draft_size)
+
+        icc_profile = image.info.get("icc_profile")
+        upright = ImageOps.exif_transpose(image)
+        has_alpha = upright.mode in ("RGBA", "LA", "PA") or "transparency" in upright.info
+        upright = upright.convert("RGBA" if has_alpha else "RGB")
+        # Copies made from here on carry no EXIF, XMP or comments to save
+        upright.info = {}
+
+    for target in reversed(targets):
+        scaled_height = max(1, round(upright.height * target / upright.width))
+        resized = upright.resize((target, scaled_height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        for content_type in _encodings(has_alpha):
+            extension, image_format, options = ENCODINGS[content_type]
+            buffer = io.BytesIO()
+            if icc_profile:
+                options = dict(options, icc_profile=icc_profile)
+            resized.save(buffer, image_format, **options)
+            filename = f"{path.stem}_{target}w{extension}"
+            (Path(output_dir) / filename).write_bytes(buffer.getvalue())
+            rendered.append((filename, content_type, target, scaled_height, buffer.tell()))
+    return rendered
+
+
+image_pool = WorkerPool(IMAGE_WORKERS, IMAGE_MAX_PENDING, average_seconds=1.0)
+
+
+async def generate_variants(
+    source: str,
+    session_factory: Callable[[], AsyncSession] = AsyncSessionLocal
+):
+    """
+    Render and record the variants of the stored image ``source``, unless it
+    has them already. Background task: failures are logged and the original
+    keeps being served.
+    """
+    async with session_factory() as db:
+        if await db.scalar(select(models.ImageVariant.id).where(models.ImageVariant.source == source).limit(1)):
+            return
+    output_dir = Path(await asyncio.to_thread(tempfile.mkdtemp, "", ".variants-", blob_store.spool_dir))
+    try:
+        async with blob_store.local_copy(source) as path:
+            rendered = await image_pool.run_async(
+                render_variants, str(path.resolve()), str(output_dir.resolve()), VARIANT_WIDTHS
+            )
+        for filename, content_type, *_ in rendered:
+            await blob_store.put(output_dir / filename, filename, content_type)
+    except PoolBusy:
+        logger.warning("Image processor busy; %s is served without variants", source)
+        return
+    except Exception:
+        logger.exception("Could not make variants of %s", source)
+        return
+    finally:
+        await asyncio.to_thread(shutil.rmtree, output_dir, True)
+
+    # Files of an image released in the meantime are left to the storage sweeper
+    async with session_factory() as db:
+        in_use = await db.scalar(select(models.StoredFile.id).where(
+            models.StoredFile.filename == source,
+            models.StoredFile.refcount > 0
+        ))
+        if in_use is None:
+            return
+        db.add_all(
+            models.ImageVariant(
+                source=source, filename=filename, content_type=content_type,
+                width=width, height=height, size=size
+            )
+            for filename, content_type, width, height, size in rendered
+        )
+        try:
+            await db.commit()
+        except IntegrityError:
+            # The same image, uploaded twice at once, was recorded by the other upload
+            await db.rollback()
+            return
+    file_cache.invalidate([source])
+
+
+def accepted_types(accept: Optional[str]) -> Set[str]:
+    """The image types of PREFERENCE that an Accept header allows"""
+    ranges: Dict[str, float] = {}
+    for item in (accept or "*/*").split(","):
+        media_range, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_range:
+            ranges[media_range.lower()] = quality
+
+    accepted = set()
+    for content_type in PREFERENCE:
+        if content_type in ranges:
+            if ranges[content_type] > 0:
+                accepted.add(content_type)
+        elif content_type not in MODERN_TYPES and max(ranges.get("image/*", 0), ranges.get("*/*", 0)) > 0:
+            accepted.add(content_type)
+    return accepted
+
+
+def choose(
+    variants: Sequence[models.ImageVariant],
+    width: Optional[int],
+    accept: Optional[str]
+) -> Optional[models.ImageVariant]:
+    """
+    The variant to serve for a requested ``width`` (None: the largest) and
+    Accept header, or None when the client accepts none of them.
+    """
+    accepted = accepted_types(accept)
+    available = {variant.content_type for variant in variants} & accepted
+    if not available:
+        return None
+    content_type = min(available, key=PREFERENCE.index)
+    candidates = sorted(
+        (variant for variant in variants if variant.content_type == content_type),
+        key=lambda variant: variant.width
+    )
+    if width is not None:
+        for variant in candidates:
+            if variant.width >= width:
+                return variant
+    return candidates[-1]
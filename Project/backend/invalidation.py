@@ -0,0 +1,176 @@
+"""
+Cross-worker invalidation messages.
+
+Every uvicorn worker keeps some state in its own process: calendar bitmaps,
+the spatial index and (with the memory backend) cached responses. A worker
+that changes data updates its own copy and then calls `bus.publish`. Every
+other worker receives the message and applies the same change to its copy.
+
+Until `connect` is called there are no other workers to tell, so `publish`
+does nothing. `cache.init_cache` connects the bus to Redis pub/sub through a
+`redis.asyncio` client when CACHE_URL is set, and the app's lifespan (see
+main.py) starts it on the server's event loop.
+
+`publish` is called from async handlers and from background threads (the
+storage sweeper, the transcoder), so it never touches the network itself: it
+queues the message for a sender task on the event loop. Received messages are
+applied by a listener task on the same loop.
+"""
+import asyncio
+import json
+import logging
+import threading
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "appointments:invalidation"
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class InvalidationBus:
+    """Topic-based fan-out of invalidation messages to other workers"""
+
+    def __init__(self, channel: str = CHANNEL):
+        self.channel = channel
+        # Lets a worker ignore its own messages when they come back
+        self.origin = uuid.uuid4().hex
+        self._handlers: Dict[str, List[Callable[..., Any]]] = {}
+        self._client = None
+        self._listen = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._outbox: Optional[asyncio.Queue] = None
+        # Messages published after connect but before start
+        self._pending: List[str] = []
+        self._lock = threading.Lock()
+        self._tasks: List[asyncio.Task] = []
+        self.sent = 0
+        self.dropped = 0
+        self.received = 0
+
+    def subscribe(self, topic: str, handler: Callable[..., Any]):
+        """Call ``handler(*args)`` for every message on ``topic`` from another worker"""
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def publish(self, topic: str, *args):
+        """
+        Tell other workers about a change; args must be JSON-serialisable.
+
+        Safe to call from any thread. The message is sent in the background;
+        await `flush` to wait for it.
+        """
+        if self._client is None:
+            return
+        message = json.dumps({"origin": self.origin, "topic": topic, "args": list(args)})
+        with self._lock:
+            if self._loop is None:
+                self._pending.append(message)
+                return
+            loop, outbox = self._loop, self._outbox
+        try:
+            if _running_loop() is loop:
+                outbox.put_nowait(message)
+            else:
+                loop.call_soon_threadsafe(outbox.put_nowait, message)
+        except RuntimeError:
+            # The loop has shut down
+            self.dropped += 1
+
+    def deliver(self, raw) -> bool:
+        """Apply a raw message from the channel; returns False for our own messages"""
+        message = json.loads(raw)
+        if message["origin"] == self.origin:
+            return False
+        self.received += 1
+        for handler in self._handlers.get(message["topic"], ()):
+            try:
+                handler(*message["args"])
+            except Exception:
+                logger.exception("Invalidation handler for %s failed", message["topic"])
+        return True
+
+    def connect(self, client, listen: bool = True):
+        """Publish (and, with ``listen``, receive) through a `redis.asyncio` client once started"""
+        self._client = client
+        self._listen = listen
+
+    async def start(self):
+        """Start the sender and listener tasks on the running loop; returns once subscribed"""
+        if self._client is None or self._loop is not None:
+            return
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._outbox = asyncio.Queue()
+            for message in self._pending:
+                self._outbox.put_nowait(message)
+            self._pending = []
+        self._tasks.append(asyncio.create_task(self._send()))
+        if self._listen:
+            pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+            await pubsub.subscribe(self.channel)
+            self._tasks.append(asyncio.create_task(self._receive(pubsub)))
+
+    async def _send(self):
+        while True:
+            message = await self._outbox.get()
+            try:
+                await self._client.publish(self.channel, message)
+                self.sent += 1
+            except Exception:
+                self.dropped += 1
+                logger.exception("Could not publish an invalidation message")
+            finally:
+                self._outbox.task_done()
+
+    async def _receive(self, pubsub):
+        try:
+            while True:
+                try:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    logger.exception("Invalidation listener lost its connection; retrying")
+                    await asyncio.sleep(1)
+                    continue
+                if message is not None:
+                    self.deliver(message["data"])
+        finally:
+            await pubsub.aclose()
+
+    async def flush(self):
+        """Wait until every message published so far has been sent"""
+        if self._outbox is not None:
+            # Let messages handed over by other threads reach the queue first
+            await asyncio.sleep(0)
+            await self._outbox.join()
+
+    async def close(self):
+        """Send what is queued, then stop the background tasks"""
+        await self.flush()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        with self._lock:
+            self._loop = None
+            self._outbox = None
+            self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connected": self._client is not None,
+            "sent": self.sent,
+            "received": self.received,
+            "dropped": self.dropped,
+        }
+
+
+bus = InvalidationBus()
@@ -1,15 +1,54 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-from database import engine
+from database import engine, pool_metrics, replica_pool_metrics
 import models
+import migrations
+import booking
+import storage
+import transcoding
+import blobs
+import search
+import geo
+import cache
+from cache import response_cache
+from invalidation import bus
+from hashing import password_hasher
+from images import image_pool
+from blobs import blob_store
+from serving import file_cache
+from principals import principal_cache
+from revocation import revocation_list
+from replicas import read_router
+from auth import load_revocations
 from routers import auth, customer, business, public, messages, upload
 
-# Create database tables
+# Create database tables and add columns/indexes missing from older databases
 models.Base.metadata.create_all(bind=engine)
+migrations.upgrade(engine)
+search.init_search(engine)
+geo.init_geo(engine)
+cache.init_cache()
+load_revocations(engine)
+booking.init_claims(engine)
+blobs.init_blobs()
+storage.init_storage(engine)
+storage.sweeper.start(engine, blob_store.backend)
+transcoding.init_transcoding(engine)
+transcoding.transcoder.start(engine, blob_store.backend)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Cross-worker messages are sent and received on the server's event loop
+    await bus.start()
+    yield
+    await bus.close()
 
 # Initialize FastAPI app
 app = FastAPI(
+    lifespan=lifespan,
     title="Appointment Booking System",
     description="""
     A comprehensive appointment booking system with dual portal access for customers and businesses.
@@ -52,6 +91,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "X-Cache"],
 )
 
 # Include routers
@@ -74,6 +114,29 @@ def root():
         "redoc": "/redoc"
     }
 
+@app.get("/metrics", tags=["Root"])
+async def metrics():
+    """
+    Cache, password hashing, image processing, database pool and read routing
+    counters - useful for tuning the cache budgets and TTLs, the worker pool
+    sizes and the connection pools.
+    """
+    return {
+        "database_pool": pool_metrics.stats(),
+        "replica_pools": [metrics.stats() for metrics in replica_pool_metrics],
+        "read_routing": read_router.stats(),
+        "response_cache": await response_cache.stats(),
+        "invalidation": bus.stats(),
+        "principal_cache": principal_cache.stats(),
+        "revocation_list": revocation_list.stats(),
+        "password_hasher": password_hasher.stats(),
+        "image_processor": image_pool.stats(),
+        "video_transcoder": transcoding.transcoder.stats(),
+        "upload_storage": storage.sweeper.stats(),
+        "upload_backend": blob_store.stats(),
+        "file_cache": file_cache.stats(),
+    }
+
 @app.get("/health", tags=["Root"])
 def health_check():
     """
@@ -0,0 +1,78 @@
+"""
+Idempotent schema upgrades for existing databases.
+
+`Base.metadata.create_all` only creates missing tables; it never adds columns
+or indexes to tables that already exist. `upgrade` compares the live schema
+with the models and adds whatever is missing, using SQLAlchemy DDL so the same
+code path works on SQLite and PostgreSQL. It is safe to run on every startup.
+
+Run manually with:
+
+    python migrations.py
+"""
+from typing import List, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateIndex
+
+import models
+
+
+def _add_column_sql(engine: Engine, table_name: str, column) -> str:
+    column_type = column.type.compile(dialect=engine.dialect)
+    return f'ALTER TABLE {table_name} ADD COLUMN {column.name} {column_type}'
+
+
+def upgrade(engine: Engine) -> List[Tuple[str, str, str]]:
+    """
+    Bring an existing database up to the current models.
+
+    Adds missing nullable columns and missing indexes. Returns a list of
+    (kind, name, action) tuples describing what was done, where action is
+    "added" or "skipped" (a NOT NULL column without a default, which needs a
+    hand-written migration).
+    """
+    results: List[Tuple[str, str, str]] = []
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as conn:
+        for table in models.Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                table.create(bind=conn)
+                results.append(("table", table.name, "added"))
+                continue
+
+            existing_columns = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    results.append(("column", f"{table.name}.{column.name}", "skipped"))
+                    continue
+                conn.exec_driver_sql(_add_column_sql(engine, table.name, column))
+                results.append(("column", f"{table.name}.{column.name}", "added"))
+
+            existing_indexes = {idx["name"] for idx in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                conn.execute(CreateIndex(index))
+                results.append(("index", index.name, "added"))
+
+    if results:
+        # Pooled SQLite connections that ran the DDL keep planning queries
+        # without the new indexes, so start from fresh connections
+        engine.dispose()
+    return results
+
+
+if __name__ == "__main__":
+    from database import engine
+
+    changes = upgrade(engine)
+    for kind, name, action in changes:
+        print(f"{'✅' if action == 'added' else '⚠️ '} {action} {kind} {name}")
+    if not changes:
+        print("✅ Schema is already up to date")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Date, Time, Text, Float
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Date, Time, Text, Float, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -28,7 +28,10 @@ class Business(Base):
     description = Column(Text)
     profile_image = Column(String)  # Path to profile image file
     cover_image = Column(String)   # Path to cover/backdrop image file
+    latitude = Column(Float)   # Geocoded from address; see geo.py
+    longitude = Column(Float)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     appointments = relationship('Appointment', back_populates='business')
     time_slots = relationship('TimeSlot', back_populates='business', cascade='all, delete-orphan')
@@ -45,8 +48,13 @@ class Service(Base):
     duration_minutes = Column(Integer, default=30)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     business = relationship('Business', back_populates='services')
+    
+    __table_args__ = (
+        Index('ix_services_business_active', 'business_id', 'is_active'),
+    )
 
 class TimeSlot(Base):
     __tablename__ = 'time_slots'
@@ -58,8 +66,13 @@ class TimeSlot(Base):
     end_time = Column(Time, nullable=False)
     slot_duration_minutes = Column(Integer, default=30)
     is_active = Column(Boolean, default=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     business = relationship('Business', back_populates='time_slots')
+    
+    __table_args__ = (
+        Index('ix_time_slots_business_active', 'business_id', 'is_active'),
+    )
 
 class Appointment(Base):
     __tablename__ = 'appointments'
@@ -78,6 +91,15 @@ class Appointment(Base):
     customer = relationship('Customer', back_populates='appointments')
     business = relationship('Business', back_populates='appointments')
     messages = relationship('Message', back_populates='appointment', cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        # Booked-slot and availability lookups for one business and day
+        Index('ix_appointments_business_date_status', 'business_id', 'appointment_date', 'status'),
+        # Business dashboard, optionally filtered by status
+        Index('ix_appointments_business_status', 'business_id', 'status'),
+        # Customer dashboard
+        Index('ix_appointments_customer', 'customer_id'),
+    )
 
 class Message(Base):
     __tablename__ = 'messages'
@@ -90,3 +112,87 @@ class Message(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     appointment = relationship('Appointment', back_populates='messages')
+    
+    __table_args__ = (
+        Index('ix_messages_appointment_created', 'appointment_id', 'created_at'),
+    )
+
+class SlotClaim(Base):
+    __tablename__ = 'slot_claims'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    appointment_id = Column(Integer, ForeignKey('appointments.id', ondelete='CASCADE'), nullable=False, index=True)
+    business_id = Column(Integer, ForeignKey('businesses.id'), nullable=False)
+    claim_date = Column(Date, nullable=False)
+    tick = Column(Integer, nullable=False)  # TICK_MINUTES step of the day (see availability.py)
+    
+    appointment = relationship('Appointment')
+    
+    __table_args__ = (
+        # One live appointment per business per tick: overlapping bookings fail to insert
+        UniqueConstraint('business_id', 'claim_date', 'tick', name='uq_slot_claims_tick'),
+    )
+
+class StoredFile(Base):
+    __tablename__ = 'stored_files'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    filename = Column(String, nullable=False, unique=True)  # <sha256><ext> (uploads before hashing keep their name)
+    content_type = Column(String)
+    size = Column(Integer)  # bytes
+    refcount = Column(Integer, nullable=False, default=0)  # business image columns naming the file
+    released_at = Column(DateTime)  # last time a reference was dropped; the sweeper waits a grace period after it
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # The sweeper's scan for files nobody references
+        Index('ix_stored_files_unreferenced', 'refcount', 'released_at'),
+    )
+
+class ImageVariant(Base):
+    __tablename__ = 'image_variants'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String, nullable=False, index=True)  # stored file the variant was made from
+    filename = Column(String, nullable=False, unique=True)
+    content_type = Column(String, nullable=False)  # image/avif, image/webp, image/jpeg or image/png
+    width = Column(Integer, nullable=False)
+    height = Column(Integer, nullable=False)
+    size = Column(Integer, nullable=False)  # bytes
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class TranscodeJob(Base):
+    __tablename__ = 'transcode_jobs'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String, nullable=False, unique=True)  # stored video to transcode
+    status = Column(String, nullable=False, default='queued')  # 'queued', 'running', 'done' or 'failed'
+    progress = Column(Float, nullable=False, default=0.0)  # 0 to 1
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text)
+    output = Column(String)  # web-streamable MP4, once done
+    poster = Column(String)  # JPEG frame of the output, once done
+    duration = Column(Float)  # seconds
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # heartbeat while running
+    finished_at = Column(DateTime)
+    
+    __table_args__ = (
+        # The workers' scan for the next job
+        Index('ix_transcode_jobs_status', 'status', 'id'),
+    )
+
+class RefreshToken(Base):
+    __tablename__ = 'refresh_tokens'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    token_hash = Column(String, unique=True, nullable=False, index=True)  # SHA-256 of the token
+    family = Column(String, nullable=False, index=True)  # shared by every rotation of one login
+    user_type = Column(String, nullable=False)  # 'customer' or 'business'
+    user_id = Column(Integer, nullable=False)
+    email = Column(String)  # of the user at login; ids of deleted users are reused
+    expires_at = Column(DateTime, nullable=False)
+    used_at = Column(DateTime)
+    revoked_at = Column(DateTime)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,110 @@
+import base64
+import json
+from datetime import date, datetime, time
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Query
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Page size limits shared by every list endpoint
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class PageParams:
+    """Query parameters for a keyset-paginated list endpoint"""
+
+    def __init__(
+        self,
+        cursor: Optional[str] = Query(None, description="Opaque cursor from a previous page's next_cursor"),
+        limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT, description="Maximum number of items to return")
+    ):
+        self.cursor = cursor
+        self.limit = limit
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+
+def _from_json(value: Any, python_type: type) -> Any:
+    if value is not None and python_type in (datetime, date, time):
+        return python_type.fromisoformat(value)
+    return value
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the sort key of the last row on a page as an opaque cursor"""
+    raw = json.dumps([_to_json(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, python_types: Sequence[type]) -> Tuple[Any, ...]:
+    """Decode a cursor back into sort key values, or raise HTTP 400"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(python_types):
+            raise ValueError("cursor shape mismatch")
+        return tuple(_from_json(v, t) for v, t in zip(values, python_types))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(
+    query,
+    sort_columns: Sequence,
+    page: PageParams,
+    key: Optional[Callable[[Any], Sequence[Any]]] = None
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Apply keyset pagination to a query.
+
+    Rows are ordered by ``sort_columns`` (which must end with a unique column
+    such as the primary key) and the page starts strictly after the cursor's
+    sort key. ``key`` extracts the sort key from a row and defaults to reading
+    each column's attribute. Returns (rows, next_cursor); next_cursor is None
+    on the last page.
+    """
+    rows = _keyset(query, sort_columns, page).all()
+    return _page(rows, sort_columns, page, key)
+
+
+async def paginate_async(
+    db: AsyncSession,
+    statement,
+    sort_columns: Sequence,
+    page: PageParams,
+    key: Optional[Callable[[Any], Sequence[Any]]] = None
+) -> Tuple[List[Any], Optional[str]]:
+    """`paginate` for a ``select()`` statement run on an AsyncSession"""
+    result = await db.execute(_keyset(statement, sort_columns, page))
+    # One selected entity comes back as objects; anything else as rows
+    rows = result.scalars().all() if len(statement.column_descriptions) == 1 else result.all()
+    return _page(rows, sort_columns, page, key)
+
+
+def _keyset(query, sort_columns: Sequence, page: PageParams):
+    # Query and Select share filter / order_by / limit
+    if page.cursor:
+        python_types = [column.type.python_type for column in sort_columns]
+        after = decode_cursor(page.cursor, python_types)
+        query = query.filter(tuple_(*sort_columns) > tuple_(*after))
+    return query.order_by(*sort_columns).limit(page.limit + 1)
+
+
+def _page(rows: List[Any], sort_columns: Sequence, page: PageParams, key) -> Tuple[List[Any], Optional[str]]:
+    if len(rows) <= page.limit:
+        return rows, None
+
+    rows = rows[:page.limit]
+    last = rows[-1]
+    if key is None:
+        values = [getattr(last, column.key) for column in sort_columns]
+    else:
+        values = key(last)
+    next_cursor = encode_cursor(values)
+    return rows, next_cursor
@@ -0,0 +1,128 @@
+"""
+Cache of authenticated users for `auth.get_current_user`.
+
+Every authenticated request names its user by (user type, email) in the JWT.
+Looking that up costs a query per request. Instead, the row's columns are
+kept here as a detached copy. On a hit, `Session.merge(..., load=False)`
+attaches a copy to the request's session without touching the database, so
+routes can still update, refresh and delete the user as usual.
+
+Entries live for a short TTL in a bounded LRU. Write paths that change a
+user's row (profile updates, email changes, image changes, account
+deletion) call `invalidate`. The invalidation is also sent to other workers
+over the invalidation bus, which is why several workers need CACHE_URL (see
+`cache.init_cache`). A cached user deleted by another worker before this one
+flushes a change to it raises StaleDataError; `database.get_db` turns that
+into a 401.
+
+Configure with PRINCIPAL_CACHE_SIZE and PRINCIPAL_CACHE_TTL_SECONDS.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from invalidation import InvalidationBus, bus
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+DEFAULT_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+
+Key = Tuple[str, str]
+
+
+def snapshot(user: Any) -> Any:
+    """Detached copy of a loaded user's columns, safe to share between sessions"""
+    mapper = inspect(type(user))
+    copy = type(user)(**{attr.key: getattr(user, attr.key) for attr in mapper.column_attrs})
+    make_transient_to_detached(copy)
+    return copy
+
+
+class PrincipalCache:
+    """Thread-safe TTL + LRU map of (user type, email) to detached user rows"""
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+        bus: Optional[InvalidationBus] = None
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.bus = bus
+        # key -> (user, expires_at)
+        self._entries: "OrderedDict[Key, Tuple[Any, float]]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if bus is not None:
+            bus.subscribe("principal.invalidate", self._invalidate)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, user_type: str, email: str) -> Optional[Any]:
+        """Return the detached user, or None; merge it into a session before use"""
+        key = (user_type, email)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, user_type: str, email: str, user: Any, generation: Optional[int] = None):
+        """
+        Remember a user loaded from the database.
+
+        When ``generation`` is given and an invalidation happened since it was
+        read, the row may already be stale and is not stored.
+        """
+        copy = snapshot(user)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[(user_type, email)] = (copy, self.clock() + self.ttl_seconds)
+            self._entries.move_to_end((user_type, email))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _invalidate(self, user_type: str, email: str):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop((user_type, email), None)
+
+    def invalidate(self, user_type: str, email: str):
+        """Forget a user in this and every other worker"""
+        self._invalidate(user_type, email)
+        if self.bus is not None:
+            self.bus.publish("principal.invalidate", user_type, email)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache(bus=bus)
@@ -0,0 +1,182 @@
+"""
+Read-replica routing for the read-only endpoints.
+
+The public router and the GET list endpoints of the customer and business
+portals take their session from `get_public_read_db` / `get_read_db`
+instead of `database.get_db`. Those sessions are bound to one of the
+DATABASE_REPLICA_URLS, in turn. Everything else, and every write, uses the
+primary.
+
+A replica lags the primary by up to REPLICA_LAG_SECONDS. Two rules keep
+that lag from being visible:
+
+- Read-your-writes: once a user commits a change, that user's reads go to
+  the primary for the lag window. The user is taken from the request's
+  bearer token. `auth.get_current_user` tags the primary session with the
+  same user, so the commit hook knows whose write it was.
+- Shared state: the public endpoints fill the response cache, which every
+  client then sees. After any commit that touches public tables, public
+  reads go to the primary for the lag window. Otherwise a lagging replica
+  could put a stale row into the cache right after the write invalidated it.
+  The in-process calendars have no TTL, so `/availability` always loads
+  them from the primary.
+
+Both are also sent to other workers over the invalidation bus. With no
+replicas configured, every read uses the primary.
+
+Configure with DATABASE_REPLICA_URLS (comma-separated, sync driver URLs)
+and REPLICA_LAG_SECONDS.
+"""
+import itertools
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from jose import JWTError, jwt
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from auth import ALGORITHM, SECRET_KEY
+from database import AsyncSessionLocal, RequestSession, async_engine, replica_engines
+from invalidation import InvalidationBus, bus
+
+REPLICA_LAG_SECONDS = float(os.getenv("REPLICA_LAG_SECONDS", "5"))
+
+# Tables behind the public endpoints, the response cache and the calendars
+PUBLIC_TABLES = frozenset({"businesses", "services", "time_slots", "appointments", "stored_files"})
+
+Principal = Tuple[str, str]
+
+
+class ReadRouter:
+    """Chooses the primary or a replica for each read-only request"""
+
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replicas: List[AsyncEngine],
+        lag_seconds: float = REPLICA_LAG_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+        bus: Optional[InvalidationBus] = None
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.lag_seconds = lag_seconds
+        self.clock = clock
+        self.bus = bus
+        self._next_replica = itertools.cycle(replicas)
+        # principal -> monotonic time until which it reads from the primary
+        self._sticky: Dict[Principal, float] = {}
+        self._public_until = 0.0
+        self._lock = threading.Lock()
+        self.primary_reads = 0
+        self.replica_reads = 0
+        if bus is not None:
+            bus.subscribe("replica.wrote", self._wrote)
+
+    def _wrote(self, user_type: Optional[str], email: Optional[str], public: bool):
+        until = self.clock() + self.lag_seconds
+        with self._lock:
+            if user_type is not None:
+                self._sticky[(user_type, email)] = until
+            if public:
+                self._public_until = until
+            if len(self._sticky) > 1000:
+                now = self.clock()
+                self._sticky = {key: value for key, value in self._sticky.items() if value > now}
+
+    def wrote(self, principal: Optional[Principal], public: bool):
+        """Record a committed write, in this and every other worker"""
+        user_type, email = principal or (None, None)
+        self._wrote(user_type, email, public)
+        if self.bus is not None:
+            self.bus.publish("replica.wrote", user_type, email, public)
+
+    def engine_for(self, principal: Optional[Principal], public: bool) -> AsyncEngine:
+        """The engine a read-only request should use"""
+        now = self.clock()
+        with self._lock:
+            use_primary = (
+                not self.replicas
+                or self._sticky.get(principal, 0.0) > now
+                or (public and self._public_until > now)
+            )
+            if use_primary:
+                self.primary_reads += 1
+                return self.primary
+            self.replica_reads += 1
+            return next(self._next_replica)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "replicas": len(self.replicas),
+                "primary_reads": self.primary_reads,
+                "replica_reads": self.replica_reads,
+                "sticky_users": sum(1 for until in self._sticky.values() if until > self.clock()),
+            }
+
+
+read_router = ReadRouter(async_engine, replica_engines, bus=bus)
+
+
+def request_principal(request: Request) -> Optional[Principal]:
+    """(user type, email) from the request's bearer token, or None"""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("type") is None or payload.get("sub") is None:
+        return None
+    return payload["type"], payload["sub"]
+
+
+async def get_read_db(request: Request):
+    """Session for a read-only endpoint: a replica unless the caller just wrote"""
+    engine = read_router.engine_for(request_principal(request), public=False)
+    async with AsyncSessionLocal(bind=engine) as db:
+        yield db
+
+
+async def get_public_read_db(request: Request):
+    """`get_read_db` for endpoints whose results are cached for everyone"""
+    engine = read_router.engine_for(request_principal(request), public=True)
+    async with AsyncSessionLocal(bind=engine) as db:
+        yield db
+
+
+# ---- Write tracking on the primary's sessions ----
+
+def _written(session) -> set:
+    return session.info.setdefault("written_tables", set())
+
+
+@event.listens_for(RequestSession, "after_flush")
+def _track_flush(session, flush_context):
+    _written(session).update(
+        obj.__table__.name for obj in itertools.chain(session.new, session.dirty, session.deleted)
+    )
+
+
+@event.listens_for(RequestSession, "do_orm_execute")
+def _track_bulk_write(state):
+    # Bulk INSERT / UPDATE / DELETE statements bypass the flush
+    if (state.is_insert or state.is_update or state.is_delete) and state.bind_mapper is not None:
+        _written(state.session).add(state.bind_mapper.local_table.name)
+
+
+@event.listens_for(RequestSession, "after_commit")
+def _report_commit(session):
+    tables = session.info.pop("written_tables", None)
+    if tables:
+        read_router.wrote(session.info.get("principal"), public=not tables.isdisjoint(PUBLIC_TABLES))
+
+
+@event.listens_for(RequestSession, "after_rollback")
+def _forget_writes(session):
+    session.info.pop("written_tables", None)
@@ -0,0 +1,124 @@
+"""
+In-memory list of revoked login sessions.
+
+Every access token carries the id of the login session (refresh token
+family) it came from, in its `sid` claim. Logging out, or reusing an
+already rotated refresh token, revokes the whole session. Its access tokens
+must then stop working before they expire. `auth.get_current_user` checks
+every request against this list, so a lookup has to be cheap.
+
+A Bloom filter answers "definitely not revoked" for almost every request
+with a few bit tests. Only the rare filter hits fall through to the exact
+set, which removes false positives. Entries are kept until the last access
+token of the session expires, and then pruned. Because a Bloom filter
+cannot delete, it is rebuilt from the exact set on each prune.
+
+Revocations are sent to other workers over the invalidation bus, and
+`auth.load_revocations` reloads recent ones from the database at startup.
+"""
+import hashlib
+import math
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional
+
+from invalidation import InvalidationBus, bus
+
+DEFAULT_CAPACITY = 100_000
+DEFAULT_ERROR_RATE = 0.01
+PRUNE_INTERVAL = timedelta(seconds=60)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter of strings"""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, error_rate: float = DEFAULT_ERROR_RATE):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str) -> Iterable[int]:
+        # Double hashing: two 64-bit halves of one digest give every position
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, value: str):
+        for position in self._positions(value):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class RevocationList:
+    """Revoked session ids with the time after which each can be forgotten"""
+
+    def __init__(
+        self,
+        capacity: int = DEFAULT_CAPACITY,
+        error_rate: float = DEFAULT_ERROR_RATE,
+        bus: Optional[InvalidationBus] = None
+    ):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bus = bus
+        self._revoked: Dict[str, datetime] = {}
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._lock = threading.Lock()
+        self._next_prune = datetime.min
+        self.filter_hits = 0
+        if bus is not None:
+            bus.subscribe("session.revoke", self._revoke_remote)
+
+    def is_revoked(self, session_id: str) -> bool:
+        """Constant-time check; safe to call without the lock"""
+        if session_id not in self._bloom:
+            return False
+        self.filter_hits += 1
+        return session_id in self._revoked
+
+    def add(self, session_id: str, until: datetime):
+        """Record a revocation in this worker only"""
+        now = datetime.utcnow()
+        with self._lock:
+            if until <= now:
+                return
+            self._revoked[session_id] = max(until, self._revoked.get(session_id, until))
+            self._bloom.add(session_id)
+            if now >= self._next_prune:
+                self._prune_locked(now)
+
+    def _revoke_remote(self, session_id: str, until: str):
+        self.add(session_id, datetime.fromisoformat(until))
+
+    def revoke(self, session_id: str, until: datetime):
+        """Reject the session's access tokens until ``until`` (UTC), in every worker"""
+        self.add(session_id, until)
+        if self.bus is not None:
+            self.bus.publish("session.revoke", session_id, until.isoformat())
+
+    def _prune_locked(self, now: datetime):
+        self._revoked = {sid: until for sid, until in self._revoked.items() if until > now}
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        for session_id in self._revoked:
+            bloom.add(session_id)
+        # Swap in whole so lock-free readers see the old or new filter, never a partial one
+        self._bloom = bloom
+        self._next_prune = now + PRUNE_INTERVAL
+
+    def prune(self):
+        with self._lock:
+            self._prune_locked(datetime.utcnow())
+
+    def stats(self) -> Dict[str, Any]:
+        return {"revoked_sessions": len(self._revoked), "filter_hits": self.filter_hits}
+
+    def clear(self):
+        with self._lock:
+            self._revoked = {}
+            self._bloom = BloomFilter(self.capacity, self.error_rate)
+
+
+revocation_list = RevocationList(bus=bus)
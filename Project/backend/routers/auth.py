@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
 from database import get_db
@@ -9,17 +10,39 @@ from auth import (
     authenticate_customer,
     authenticate_business,
     create_access_token,
+    create_refresh_token,
     get_password_hash,
+    hash_refresh_token,
+    revoke_session,
+    rotate_refresh_token,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
+from geo import assign_coordinates, geo_index
+from cache import response_cache, SEARCH_TAG
 
 router = APIRouter(
     prefix="/auth",
     tags=["Authentication"]
 )
 
+async def issue_tokens(db: AsyncSession, user, user_type: str, family: str = None) -> dict:
+    """Access token plus a refresh token in the given (or a new) session"""
+    refresh_token, family = await create_refresh_token(db, user_type, user.id, user.email, family)
+    access_token = create_access_token(
+        data={"sub": user.email, "type": user_type, "sid": family},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "user_type": user_type,
+        "user_id": user.id,
+        "refresh_token": refresh_token,
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    }
+
 @router.post("/customer/register", response_model=schemas.Customer, summary="Register a new customer")
-def register_customer(customer: schemas.CustomerCreate, db: Session = Depends(get_db)):
+async def register_customer(customer: schemas.CustomerCreate, db: AsyncSession = Depends(get_db)):
     """
     Register a new customer account.
     
@@ -28,11 +51,11 @@ def register_customer(customer: schemas.CustomerCreate, db: Session = Depends(ge
     - **full_name**: Customer's full name
     - **phone**: Optional phone number
     """
-    db_customer = db.query(models.Customer).filter(models.Customer.email == customer.email).first()
+    db_customer = await db.scalar(select(models.Customer).where(models.Customer.email == customer.email))
     if db_customer:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = get_password_hash(customer.password)
+    hashed_password = await get_password_hash(customer.password)
     db_customer = models.Customer(
         email=customer.email,
         hashed_password=hashed_password,
@@ -40,39 +63,30 @@ def register_customer(customer: schemas.CustomerCreate, db: Session = Depends(ge
         phone=customer.phone
     )
     db.add(db_customer)
-    db.commit()
-    db.refresh(db_customer)
+    await db.commit()
+    await db.refresh(db_customer)
     return db_customer
 
 @router.post("/customer/login", response_model=schemas.Token, summary="Customer login")
-def login_customer(customer: schemas.CustomerLogin, db: Session = Depends(get_db)):
+async def login_customer(customer: schemas.CustomerLogin, db: AsyncSession = Depends(get_db)):
     """
     Authenticate a customer and receive an access token.
     
     Returns a JWT token that should be included in the Authorization header
-    for subsequent requests as: Bearer {token}
+    for subsequent requests as: Bearer {token}, and a refresh token that
+    exchanges for a new pair at /auth/refresh when it expires.
     """
-    user = authenticate_customer(db, customer.email, customer.password)
+    user = await authenticate_customer(db, customer.email, customer.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
     
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email, "type": "customer"},
-        expires_delta=access_token_expires
-    )
-    return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "user_type": "customer",
-        "user_id": user.id
-    }
+    return await issue_tokens(db, user, "customer")
 
 @router.post("/business/register", response_model=schemas.Business, summary="Register a new business")
-def register_business(business: schemas.BusinessCreate, db: Session = Depends(get_db)):
+async def register_business(business: schemas.BusinessCreate, db: AsyncSession = Depends(get_db)):
     """
     Register a new business account.
     
@@ -83,12 +97,13 @@ def register_business(business: schemas.BusinessCreate, db: Session = Depends(ge
     - **address**: Optional business address
     - **specialty**: Optional specialty (e.g., "Hair Salon", "Dental")
     - **description**: Optional business description
+    - **latitude** / **longitude**: Optional coordinates; geocoded from the address when omitted
     """
-    db_business = db.query(models.Business).filter(models.Business.email == business.email).first()
+    db_business = await db.scalar(select(models.Business).where(models.Business.email == business.email))
     if db_business:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = get_password_hash(business.password)
+    hashed_password = await get_password_hash(business.password)
     db_business = models.Business(
         email=business.email,
         hashed_password=hashed_password,
@@ -98,34 +113,64 @@ def register_business(business: schemas.BusinessCreate, db: Session = Depends(ge
         specialty=business.specialty,
         description=business.description
     )
+    assign_coordinates(db_business, business.latitude, business.longitude)
     db.add(db_business)
-    db.commit()
-    db.refresh(db_business)
+    await db.commit()
+    await db.refresh(db_business)
+    geo_index.put(db_business.id, db_business.latitude, db_business.longitude)
+    await response_cache.invalidate(SEARCH_TAG)
     return db_business
 
 @router.post("/business/login", response_model=schemas.Token, summary="Business login")
-def login_business(business: schemas.BusinessLogin, db: Session = Depends(get_db)):
+async def login_business(business: schemas.BusinessLogin, db: AsyncSession = Depends(get_db)):
     """
     Authenticate a business and receive an access token.
     
     Returns a JWT token that should be included in the Authorization header
-    for subsequent requests as: Bearer {token}
+    for subsequent requests as: Bearer {token}, and a refresh token that
+    exchanges for a new pair at /auth/refresh when it expires.
     """
-    user = authenticate_business(db, business.email, business.password)
+    user = await authenticate_business(db, business.email, business.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
     
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email, "type": "business"},
-        expires_delta=access_token_expires
+    return await issue_tokens(db, user, "business")
+
+@router.post("/refresh", response_model=schemas.Token, summary="Refresh access token")
+async def refresh_tokens(body: schemas.RefreshRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Exchange a refresh token for a new access token and refresh token.
+
+    Each refresh token works once. Reusing one that was already exchanged
+    ends the whole session, including its access tokens. A token only works
+    for the account that logged in: not after its email changed, nor for a
+    new account that was given a deleted account's id.
+    """
+    invalid = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or expired refresh token"
     )
-    return {
-        "access_token": access_token,
-        "token_type": "bearer",
-        "user_type": "business",
-        "user_id": user.id
-    }
+    row = await rotate_refresh_token(db, body.refresh_token)
+    if row is None:
+        raise invalid
+    model = models.Customer if row.user_type == "customer" else models.Business
+    user = await db.get(model, row.user_id)
+    if user is None or user.email != row.email:
+        raise invalid
+    return await issue_tokens(db, user, row.user_type, row.family)
+
+@router.post("/logout", summary="Log out")
+async def logout(body: schemas.RefreshRequest, db: AsyncSession = Depends(get_db)):
+    """
+    End the session of a refresh token. Its access tokens stop working
+    immediately.
+    """
+    row = await db.scalar(select(models.RefreshToken).where(
+        models.RefreshToken.token_hash == hash_refresh_token(body.refresh_token)
+    ))
+    if row is not None:
+        await revoke_session(db, row.family)
+    return {"message": "Logged out successfully"}
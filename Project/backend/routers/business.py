@@ -1,11 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
+import conditional
 import schemas
 import models
-from auth import get_current_business
+import booking
+import storage
+from auth import get_current_business, reject_sessions, revoke_user_sessions
+from availability import calendar_store
+from cache import response_cache, profile_tags, services_tag, timeslots_tag, all_business_tags
+from geo import assign_coordinates, geo_index
+from principals import principal_cache
+from replicas import get_read_db
+from routers import loading
+from pagination import PageParams, paginate_async
 
 router = APIRouter(
     prefix="/business",
@@ -13,65 +24,81 @@ router = APIRouter(
     dependencies=[Depends(get_current_business)]
 )
 
+VALID_STATUSES = ['pending', 'confirmed', 'completed', 'cancelled', 'rejected', 'no_show']
+
 @router.get("/me", response_model=schemas.Business, summary="Get business profile")
-def get_business_profile(current_business: models.Business = Depends(get_current_business)):
+async def get_business_profile(
+    request: Request,
+    response: Response,
+    current_business: models.Business = Depends(get_current_business)
+):
     """
     Get the current logged-in business's profile information.
     
-    Requires authentication token.
+    Requires authentication token. Supports If-None-Match / If-Modified-Since.
     """
+    unchanged = conditional.check(request, response, [current_business], private=True)
+    if unchanged:
+        return unchanged
     return current_business
 
 @router.put("/me", response_model=schemas.Business, summary="Update business profile")
-def update_business_profile(
+async def update_business_profile(
     business_update: schemas.BusinessBase,
     current_business: models.Business = Depends(get_current_business),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Update the business profile information.
     
     All fields can be updated except email (which is used for authentication).
+    Coordinates are geocoded from the address unless latitude and longitude are given.
     """
     current_business.business_name = business_update.business_name
     current_business.phone = business_update.phone
     current_business.address = business_update.address
     current_business.specialty = business_update.specialty
     current_business.description = business_update.description
-    db.commit()
-    db.refresh(current_business)
+    assign_coordinates(current_business, business_update.latitude, business_update.longitude)
+    await db.commit()
+    await db.refresh(current_business)
+    principal_cache.invalidate("business", current_business.email)
+    geo_index.put(current_business.id, current_business.latitude, current_business.longitude)
+    await response_cache.invalidate(*profile_tags(current_business.id))
     return current_business
 
-@router.get("/appointments", response_model=List[schemas.AppointmentDetail], summary="Get business appointments")
-def get_business_appointments(
+@router.get("/appointments", response_model=schemas.Page[schemas.AppointmentDetail], summary="Get business appointments")
+async def get_business_appointments(
     status: str = None,
+    page: PageParams = Depends(),
     current_business: models.Business = Depends(get_current_business),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get all appointments for the current business.
     
     - **status**: Optional filter by status (pending, confirmed, completed, cancelled, rejected, no_show)
     
-    Returns a list of appointments with full customer details.
+    Returns a page of appointments with full customer details.
+    Pass `next_cursor` back as `cursor` to fetch the following page.
     """
-    query = db.query(models.Appointment).filter(
+    statement = select(models.Appointment).options(*loading.APPOINTMENT_DETAIL).where(
         models.Appointment.business_id == current_business.id
     )
     
     if status:
-        query = query.filter(models.Appointment.status == status)
+        statement = statement.where(models.Appointment.status == status)
     
-    appointments = query.all()
-    return appointments
+    appointments, next_cursor = await paginate_async(db, statement, [models.Appointment.id], page)
+    return {"items": appointments, "next_cursor": next_cursor}
 
 @router.put("/appointments/{appointment_id}/status", response_model=schemas.Appointment, summary="Update appointment status")
 @router.patch("/appointments/{appointment_id}/status", response_model=schemas.Appointment, summary="Update appointment status")
-def update_appointment_status(
+async def update_appointment_status(
     appointment_id: int,
     update: schemas.AppointmentUpdate,
     current_business: models.Business = Depends(get_current_business),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Update the status of an appointment and optionally add a note.
@@ -80,32 +107,141 @@ def update_appointment_status(
     - **business_note**: Optional note from business (e.g., reason for rejection)
     
     This allows businesses to approve/reject bookings and mark appointments as completed or no-show.
+    Reopening a cancelled or rejected appointment returns 409 if its time has been booked since.
     """
-    appointment = db.query(models.Appointment).filter(
+    appointment = await db.scalar(select(models.Appointment).where(
         models.Appointment.id == appointment_id,
         models.Appointment.business_id == current_business.id
-    ).first()
+    ))
     
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
-    valid_statuses = ['pending', 'confirmed', 'completed', 'cancelled', 'rejected', 'no_show']
-    if update.status not in valid_statuses:
-        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {valid_statuses}")
+    if update.status not in VALID_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {VALID_STATUSES}")
     
+    holds_time = booking.blocks(appointment.status)
     appointment.status = update.status
     if update.business_note:
         appointment.business_note = update.business_note
     
-    db.commit()
-    db.refresh(appointment)
+    # Claims only change when the appointment starts or stops holding its time
+    await booking.commit_booking(db, appointment if booking.blocks(appointment.status) != holds_time else None)
+    await db.refresh(appointment)
+    await calendar_store.release(appointment.business_id, appointment.appointment_date)
     return appointment
 
+@router.patch("/appointments/status", response_model=schemas.BatchResult, summary="Update the status of many appointments")
+async def update_appointment_statuses(
+    batch: schemas.AppointmentStatusBatch,
+    current_business: models.Business = Depends(get_current_business),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Apply up to 100 status changes in a single transaction.
+    
+    - **updates**: List of `{id, status, business_note}`, as for the single-appointment endpoint
+    
+    Returns one result per update, in request order, with the status code the
+    single endpoint would have answered: 200 with the updated appointment, 400
+    for an invalid status or a repeated id, 404 for an unknown appointment, or
+    409 when reopening an appointment whose time has been booked since.
+    Failed items are skipped and the others are applied together.
+    """
+    updates = batch.updates
+    business_id = current_business.id
+    
+    def slot(index):
+        row = current[updates[index].id]
+        return booking.Slot(business_id, row.appointment_date, row.appointment_time, row.duration_minutes, row.id)
+    
+    for attempt in range(booking.BATCH_ATTEMPTS):
+        async with booking.writer(db):
+            # Read the rows on every attempt, locked where the database can:
+            # claims are added or dropped by comparing with the current status,
+            # so a status another request just changed must not be missed
+            current = {row.id: row for row in await db.execute(select(
+                models.Appointment.id,
+                models.Appointment.status,
+                models.Appointment.appointment_date,
+                models.Appointment.appointment_time,
+                models.Appointment.duration_minutes
+            ).where(
+                models.Appointment.id.in_({item.id for item in updates}),
+                models.Appointment.business_id == business_id
+            ).with_for_update())}
+            
+            # Validate the whole batch in one pass
+            failed = {}
+            seen = set()
+            for index, item in enumerate(updates):
+                if item.status not in VALID_STATUSES:
+                    failed[index] = (400, f"Invalid status. Must be one of: {VALID_STATUSES}")
+                elif item.id in seen:
+                    failed[index] = (400, "Appointment appears more than once in the batch")
+                elif item.id not in current:
+                    failed[index] = (404, "Appointment not found")
+                seen.add(item.id)
+            
+            # Claims only change when an appointment starts or stops holding its time
+            valid = [index for index in range(len(updates)) if index not in failed]
+            reopened = [
+                index for index in valid
+                if booking.blocks(updates[index].status) and not booking.blocks(current[updates[index].id].status)
+            ]
+            for position in await booking.conflicts(db, [slot(index) for index in reopened]):
+                failed[reopened[position]] = (409, booking.SLOT_TAKEN)
+            applied = [index for index in valid if index not in failed]
+            released = [
+                updates[index].id for index in applied
+                if booking.blocks(current[updates[index].id].status) and not booking.blocks(updates[index].status)
+            ]
+            claims = [row for index in reopened if index not in failed for row in booking.claim_rows(slot(index), updates[index].id)]
+            
+            try:
+                if released:
+                    await db.execute(delete(models.SlotClaim).where(models.SlotClaim.appointment_id.in_(released)))
+                if claims:
+                    await db.execute(insert(models.SlotClaim), claims)
+                if applied:
+                    await db.execute(update(models.Appointment), [
+                        {"id": updates[index].id, "status": updates[index].status}
+                        | ({"business_note": updates[index].business_note} if updates[index].business_note else {})
+                        for index in applied
+                    ])
+                await db.commit()
+                break
+            except IntegrityError as error:
+                await db.rollback()
+                if not booking.is_conflict(error):
+                    raise
+                # Another worker claimed some of the time after the check;
+                # check again so only the reopened appointments that clash fail
+                if attempt == booking.BATCH_ATTEMPTS - 1:
+                    raise HTTPException(status_code=409, detail=booking.SLOT_TAKEN)
+    
+    appointments = {appointment.id: appointment for appointment in await db.scalars(
+        select(models.Appointment).options(*loading.FLAT).where(
+            models.Appointment.id.in_([updates[index].id for index in applied])
+        )
+    )}
+    for day in {appointment.appointment_date for appointment in appointments.values()}:
+        await calendar_store.release(business_id, day)
+    
+    results = []
+    for index, item in enumerate(updates):
+        if index in failed:
+            status_code, detail = failed[index]
+            results.append({"index": index, "status_code": status_code, "detail": detail})
+        else:
+            results.append({"index": index, "status_code": 200, "appointment": appointments[item.id]})
+    return {"results": results}
+
 @router.post("/timeslots", response_model=schemas.TimeSlot, summary="Create time slot")
-def create_time_slot(
+async def create_time_slot(
     timeslot: schemas.TimeSlotCreate,
     current_business: models.Business = Depends(get_current_business),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Create a new availability time slot.
@@ -123,55 +259,67 @@ def create_time_slot(
         **timeslot.dict()
     )
     db.add(db_timeslot)
-    db.commit()
-    db.refresh(db_timeslot)
+    await db.commit()
+    await db.refresh(db_timeslot)
+    await calendar_store.invalidate(current_business.id)
+    await response_cache.invalidate(timeslots_tag(current_business.id))
     return db_timeslot
 
-@router.get("/timeslots", response_model=List[schemas.TimeSlot], summary="Get business time slots")
-def get_business_time_slots(
+@router.get("/timeslots", response_model=schemas.Page[schemas.TimeSlot], summary="Get business time slots")
+async def get_business_time_slots(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
     current_business: models.Business = Depends(get_current_business),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get all time slots for the current business.
     
-    Returns all availability slots (both active and inactive).
+    Returns a page of availability slots (both active and inactive).
+    Pass `next_cursor` back as `cursor` to fetch the following page.
     """
-    timeslots = db.query(models.TimeSlot).filter(
+    statement = select(models.TimeSlot).options(*loading.FLAT).where(
         models.TimeSlot.business_id == current_business.id
-    ).all()
-    return timeslots
+    )
+    timeslots, next_cursor = await paginate_async(db, statement, [models.TimeSlot.id], page)
+    unchanged = conditional.check(request, response, timeslots, next_cursor, private=True)
+    if unchanged:
+        return unchanged
+    return {"items": timeslots, "next_cursor": next_cursor}
 
 @router.delete("/timeslots/{timeslot_id}", summary="Delete time slot")
-def delete_time_slot(
+async def delete_time_slot(
     timeslot_id: int,
     current_business: models.Business = Depends(get_current_business),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Delete a time slot.
     
     This removes the availability slot completely.
     """
-    timeslot = db.query(models.TimeSlot).filter(
+    timeslot = await db.scalar(select(models.TimeSlot).where(
         models.TimeSlot.id == timeslot_id,
         models.TimeSlot.business_id == current_business.id
-    ).first()
+    ))
     
     if not timeslot:
         raise HTTPException(status_code=404, detail="Time slot not found")
     
-    db.delete(timeslot)
-    db.commit()
+    await db.delete(timeslot)
+    await db.commit()
+    await calendar_store.invalidate(current_business.id)
+    await response_cache.invalidate(timeslots_tag(current_business.id))
     return {"message": "Time slot deleted successfully"}
 
 # ==================== Service Routes ====================
 
 @router.post("/services", response_model=schemas.Service, summary="Create service")
-def create_service(
+async def create_service(
     service: schemas.ServiceCreate,
     current_business: models.Business = Depends(get_current_business),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Create a new service offering.
@@ -189,60 +337,74 @@ def create_service(
         **service.dict()
     )
     db.add(db_service)
-    db.commit()
-    db.refresh(db_service)
+    await db.commit()
+    await db.refresh(db_service)
+    await response_cache.invalidate(services_tag(current_business.id))
     return db_service
 
-@router.get("/services", response_model=List[schemas.Service], summary="Get business services")
-def get_business_services(
+@router.get("/services", response_model=schemas.Page[schemas.Service], summary="Get business services")
+async def get_business_services(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
     current_business: models.Business = Depends(get_current_business),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get all services for the current business.
     
-    Returns all services (both active and inactive).
+    Returns a page of services (both active and inactive).
+    Pass `next_cursor` back as `cursor` to fetch the following page.
     """
-    services = db.query(models.Service).filter(
+    statement = select(models.Service).options(*loading.FLAT).where(
         models.Service.business_id == current_business.id
-    ).all()
-    return services
+    )
+    services, next_cursor = await paginate_async(db, statement, [models.Service.id], page)
+    unchanged = conditional.check(request, response, services, next_cursor, private=True)
+    if unchanged:
+        return unchanged
+    return {"items": services, "next_cursor": next_cursor}
 
 @router.get("/services/{service_id}", response_model=schemas.Service, summary="Get service details")
-def get_service(
+async def get_service(
     service_id: int,
+    request: Request,
+    response: Response,
     current_business: models.Business = Depends(get_current_business),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Get details of a specific service.
     """
-    service = db.query(models.Service).filter(
+    service = await db.scalar(select(models.Service).where(
         models.Service.id == service_id,
         models.Service.business_id == current_business.id
-    ).first()
+    ))
     
     if not service:
         raise HTTPException(status_code=404, detail="Service not found")
     
+    unchanged = conditional.check(request, response, [service], private=True)
+    if unchanged:
+        return unchanged
     return service
 
 @router.put("/services/{service_id}", response_model=schemas.Service, summary="Update service")
-def update_service(
+async def update_service(
     service_id: int,
     service_update: schemas.ServiceUpdate,
     current_business: models.Business = Depends(get_current_business),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Update an existing service.
     
     All fields are optional. Only provided fields will be updated.
     """
-    service = db.query(models.Service).filter(
+    service = await db.scalar(select(models.Service).where(
         models.Service.id == service_id,
         models.Service.business_id == current_business.id
-    ).first()
+    ))
     
     if not service:
         raise HTTPException(status_code=404, detail="Service not found")
@@ -251,50 +413,53 @@ def update_service(
     for field, value in update_data.items():
         setattr(service, field, value)
     
-    db.commit()
-    db.refresh(service)
+    await db.commit()
+    await db.refresh(service)
+    await response_cache.invalidate(services_tag(current_business.id))
     return service
 
 @router.delete("/services/{service_id}", summary="Delete service")
-def delete_service(
+async def delete_service(
     service_id: int,
     current_business: models.Business = Depends(get_current_business),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Delete a service.
     
     This removes the service completely.
     """
-    service = db.query(models.Service).filter(
+    service = await db.scalar(select(models.Service).where(
         models.Service.id == service_id,
         models.Service.business_id == current_business.id
-    ).first()
+    ))
     
     if not service:
         raise HTTPException(status_code=404, detail="Service not found")
     
-    db.delete(service)
-    db.commit()
+    await db.delete(service)
+    await db.commit()
+    await response_cache.invalidate(services_tag(current_business.id))
     return {"message": "Service deleted successfully"}
 
 @router.put("/profile", response_model=schemas.Business, summary="Update business profile")
-def update_business_profile(
+async def update_business_profile(
     profile_update: schemas.BusinessUpdate,
     current_business: models.Business = Depends(get_current_business),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Update the current business's profile information.
     """
+    old_email = current_business.email
     if profile_update.name is not None:
         current_business.name = profile_update.name
     if profile_update.email is not None:
         # Check if email already exists
-        existing = db.query(models.Business).filter(
+        existing = await db.scalar(select(models.Business).where(
             models.Business.email == profile_update.email,
             models.Business.id != current_business.id
-        ).first()
+        ))
         if existing:
             raise HTTPException(status_code=400, detail="Email already registered")
         current_business.email = profile_update.email
@@ -302,33 +467,44 @@ def update_business_profile(
         current_business.phone = profile_update.phone
     if profile_update.address is not None:
         current_business.address = profile_update.address
+        assign_coordinates(current_business)
     if profile_update.description is not None:
         current_business.description = profile_update.description
     if profile_update.category is not None:
         current_business.category = profile_update.category
     
-    db.commit()
-    db.refresh(current_business)
+    await db.commit()
+    principal_cache.invalidate("business", old_email)
+    await db.refresh(current_business)
+    geo_index.put(current_business.id, current_business.latitude, current_business.longitude)
+    await response_cache.invalidate(*profile_tags(current_business.id))
     return current_business
 
-@router.get("/timeslots", response_model=List[schemas.TimeSlot], summary="Get business time slots")
-def get_business_timeslots(
+@router.get("/timeslots", response_model=schemas.Page[schemas.TimeSlot], summary="Get business time slots")
+async def get_business_timeslots(
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(),
     current_business: models.Business = Depends(get_current_business),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
-    Get all time slots for the current business.
+    Get a page of time slots for the current business.
     """
-    timeslots = db.query(models.TimeSlot).filter(
+    statement = select(models.TimeSlot).options(*loading.FLAT).where(
         models.TimeSlot.business_id == current_business.id
-    ).all()
-    return timeslots
+    )
+    timeslots, next_cursor = await paginate_async(db, statement, [models.TimeSlot.id], page)
+    unchanged = conditional.check(request, response, timeslots, next_cursor, private=True)
+    if unchanged:
+        return unchanged
+    return {"items": timeslots, "next_cursor": next_cursor}
 
 @router.post("/timeslots", response_model=schemas.TimeSlot, summary="Create time slot")
-def create_timeslot(
+async def create_timeslot(
     timeslot: schemas.TimeSlotCreate,
     current_business: models.Business = Depends(get_current_business),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Create a new time slot for the business.
@@ -338,24 +514,26 @@ def create_timeslot(
         **timeslot.dict()
     )
     db.add(db_timeslot)
-    db.commit()
-    db.refresh(db_timeslot)
+    await db.commit()
+    await db.refresh(db_timeslot)
+    await calendar_store.invalidate(current_business.id)
+    await response_cache.invalidate(timeslots_tag(current_business.id))
     return db_timeslot
 
 @router.put("/timeslots/{timeslot_id}", response_model=schemas.TimeSlot, summary="Update time slot")
-def update_timeslot(
+async def update_timeslot(
     timeslot_id: int,
     timeslot_update: schemas.TimeSlotUpdate,
     current_business: models.Business = Depends(get_current_business),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Update an existing time slot.
     """
-    timeslot = db.query(models.TimeSlot).filter(
+    timeslot = await db.scalar(select(models.TimeSlot).where(
         models.TimeSlot.id == timeslot_id,
         models.TimeSlot.business_id == current_business.id
-    ).first()
+    ))
     
     if not timeslot:
         raise HTTPException(status_code=404, detail="Time slot not found")
@@ -364,56 +542,82 @@ def update_timeslot(
     for field, value in update_data.items():
         setattr(timeslot, field, value)
     
-    db.commit()
-    db.refresh(timeslot)
+    await db.commit()
+    await db.refresh(timeslot)
+    await calendar_store.invalidate(current_business.id)
+    await response_cache.invalidate(timeslots_tag(current_business.id))
     return timeslot
 
 @router.delete("/timeslots/{timeslot_id}", summary="Delete time slot")
-def delete_timeslot(
+async def delete_timeslot(
     timeslot_id: int,
     current_business: models.Business = Depends(get_current_business),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Delete a time slot.
     """
-    timeslot = db.query(models.TimeSlot).filter(
+    timeslot = await db.scalar(select(models.TimeSlot).where(
         models.TimeSlot.id == timeslot_id,
         models.TimeSlot.business_id == current_business.id
-    ).first()
+    ))
     
     if not timeslot:
         raise HTTPException(status_code=404, detail="Time slot not found")
     
-    db.delete(timeslot)
-    db.commit()
+    await db.delete(timeslot)
+    await db.commit()
+    await calendar_store.invalidate(current_business.id)
+    await response_cache.invalidate(timeslots_tag(current_business.id))
     return {"message": "Time slot deleted successfully"}
 
 @router.delete("/account", summary="Delete business account")
-def delete_business_account(
+async def delete_business_account(
     current_business: models.Business = Depends(get_current_business),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Delete the current business's account and all associated data.
     """
-    # Delete all appointments
-    db.query(models.Appointment).filter(
+    # Delete all appointments, after their messages and slot claims (foreign keys are enforced)
+    await db.execute(delete(models.Message).where(
+        models.Message.appointment_id.in_(
+            select(models.Appointment.id).where(models.Appointment.business_id == current_business.id)
+        )
+    ))
+    await db.execute(delete(models.SlotClaim).where(
+        models.SlotClaim.business_id == current_business.id
+    ))
+    await db.execute(delete(models.Appointment).where(
         models.Appointment.business_id == current_business.id
-    ).delete()
+    ))
     
     # Delete all time slots
-    db.query(models.TimeSlot).filter(
+    await db.execute(delete(models.TimeSlot).where(
         models.TimeSlot.business_id == current_business.id
-    ).delete()
+    ))
     
     # Delete all services
-    db.query(models.Service).filter(
+    await db.execute(delete(models.Service).where(
         models.Service.business_id == current_business.id
-    ).delete()
+    ))
+    
+    # Release the images; the upload sweeper deletes unreferenced files
+    await storage.release(db, current_business.profile_image)
+    await storage.release(db, current_business.cover_image)
+    
+    # End every session with the account, so no refresh token outlives it
+    families = await revoke_user_sessions(db, "business", current_business.id)
     
     # Delete the business
-    db.delete(current_business)
-    db.commit()
+    business_id = current_business.id
+    email = current_business.email
+    await db.delete(current_business)
+    await db.commit()
+    reject_sessions(families)
+    principal_cache.invalidate("business", email)
+    await calendar_store.invalidate(business_id)
+    geo_index.remove(business_id)
+    await response_cache.invalidate(*all_business_tags(business_id))
     return {"message": "Account deleted successfully"}
 
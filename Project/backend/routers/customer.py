@@ -1,13 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-import secrets
-import string
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
 import schemas
 import models
-from auth import get_current_customer
+import booking
+from auth import get_current_customer, reject_sessions, revoke_user_sessions
+from availability import calendar_store
+from ids import appointment_ids
+from principals import principal_cache
+from replicas import get_read_db
+from routers import loading
+from pagination import PageParams, paginate_async
 
 router = APIRouter(
     prefix="/customer",
@@ -15,13 +21,8 @@ router = APIRouter(
     dependencies=[Depends(get_current_customer)]
 )
 
-def generate_appointment_id():
-    """Generate a unique 8-character appointment ID"""
-    chars = string.ascii_uppercase + string.digits
-    return ''.join(secrets.choice(chars) for _ in range(8))
-
 @router.get("/me", response_model=schemas.Customer, summary="Get customer profile")
-def get_customer_profile(current_customer: models.Customer = Depends(get_current_customer)):
+async def get_customer_profile(current_customer: models.Customer = Depends(get_current_customer)):
     """
     Get the current logged-in customer's profile information.
     
@@ -29,26 +30,29 @@ def get_customer_profile(current_customer: models.Customer = Depends(get_current
     """
     return current_customer
 
-@router.get("/appointments", response_model=List[schemas.AppointmentDetail], summary="Get customer appointments")
-def get_customer_appointments(
+@router.get("/appointments", response_model=schemas.Page[schemas.AppointmentDetail], summary="Get customer appointments")
+async def get_customer_appointments(
+    page: PageParams = Depends(),
     current_customer: models.Customer = Depends(get_current_customer),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
-    Get all appointments for the current customer.
+    Get the current customer's appointments, one page at a time.
     
-    Returns a list of appointments with full business details.
+    Returns a page of appointments with full business details.
+    Pass `next_cursor` back as `cursor` to fetch the following page.
     """
-    appointments = db.query(models.Appointment).filter(
+    statement = select(models.Appointment).options(*loading.APPOINTMENT_DETAIL).where(
         models.Appointment.customer_id == current_customer.id
-    ).all()
-    return appointments
+    )
+    appointments, next_cursor = await paginate_async(db, statement, [models.Appointment.id], page)
+    return {"items": appointments, "next_cursor": next_cursor}
 
 @router.post("/appointments", response_model=schemas.Appointment, summary="Create new appointment")
-def create_appointment(
+async def create_appointment(
     appointment: schemas.AppointmentCreate,
     current_customer: models.Customer = Depends(get_current_customer),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Create a new appointment booking.
@@ -58,38 +62,137 @@ def create_appointment(
     - **appointment_time**: Time of the appointment
     - **duration_minutes**: Duration in minutes (default: 30)
     
-    Returns the created appointment with a unique appointment ID.
+    Returns the created appointment with a unique appointment ID, or 409 if
+    the time overlaps another booking.
     """
     # Check if business exists
-    business = db.query(models.Business).filter(models.Business.id == appointment.business_id).first()
+    business = await db.get(models.Business, appointment.business_id)
     if not business:
         raise HTTPException(status_code=404, detail="Business not found")
     
-    # Generate unique appointment ID
-    appointment_id = generate_appointment_id()
-    while db.query(models.Appointment).filter(models.Appointment.appointment_id == appointment_id).first():
-        appointment_id = generate_appointment_id()
-    
-    db_appointment = models.Appointment(
-        appointment_id=appointment_id,
-        customer_id=current_customer.id,
-        business_id=appointment.business_id,
-        appointment_date=appointment.appointment_date,
-        appointment_time=appointment.appointment_time,
-        duration_minutes=appointment.duration_minutes,
-        status='confirmed'  # Auto-confirm appointments, business can cancel if needed
+    # Insert optimistically: the slot claims reject an overlapping booking,
+    # and the rare clash of generated IDs between workers is retried
+    customer_id = current_customer.id
+    for attempt in range(booking.ID_ATTEMPTS):
+        db_appointment = models.Appointment(
+            appointment_id=appointment_ids.next(),
+            customer_id=customer_id,
+            business_id=appointment.business_id,
+            appointment_date=appointment.appointment_date,
+            appointment_time=appointment.appointment_time,
+            duration_minutes=appointment.duration_minutes,
+            status='confirmed'  # Auto-confirm appointments, business can cancel if needed
+        )
+        db.add(db_appointment)
+        try:
+            await booking.commit_booking(db, db_appointment)
+            break
+        except IntegrityError:
+            if attempt == booking.ID_ATTEMPTS - 1:
+                raise
+    await db.refresh(db_appointment)
+    await calendar_store.book(
+        db_appointment.business_id,
+        db_appointment.appointment_date,
+        db_appointment.appointment_time,
+        db_appointment.duration_minutes
     )
-    db.add(db_appointment)
-    db.commit()
-    db.refresh(db_appointment)
     return db_appointment
 
+@router.post("/appointments/batch", response_model=schemas.BatchResult, summary="Create many appointments")
+async def create_appointments(
+    batch: schemas.AppointmentCreateBatch,
+    current_customer: models.Customer = Depends(get_current_customer),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Book up to 100 appointments in a single transaction.
+    
+    - **appointments**: List of bookings, as for `POST /customer/appointments`
+    
+    Returns one result per booking, in request order, with the status code
+    the single endpoint would have answered: 200 with the created appointment,
+    404 for an unknown business, or 409 if the time overlaps an existing
+    booking or an earlier one in the batch. Failed bookings are skipped and
+    the others are created together.
+    """
+    items = batch.appointments
+    customer_id = current_customer.id
+    businesses = set(await db.scalars(select(models.Business.id).where(
+        models.Business.id.in_({item.business_id for item in items})
+    )))
+    slots = [
+        booking.Slot(item.business_id, item.appointment_date, item.appointment_time, item.duration_minutes)
+        for item in items
+    ]
+    
+    id_clashes = lost_races = 0
+    while True:
+        failed = {index: (404, "Business not found") for index, item in enumerate(items) if item.business_id not in businesses}
+        async with booking.writer(db):
+            candidates = [index for index in range(len(items)) if index not in failed]
+            for position in await booking.conflicts(db, [slots[index] for index in candidates]):
+                failed[candidates[position]] = (409, booking.SLOT_TAKEN)
+            booked = [index for index in candidates if index not in failed]
+            try:
+                created = []
+                if booked:
+                    created = list(await db.scalars(
+                        insert(models.Appointment).returning(models.Appointment, sort_by_parameter_order=True),
+                        [{
+                            "appointment_id": appointment_ids.next(),
+                            "customer_id": customer_id,
+                            "business_id": items[index].business_id,
+                            "appointment_date": items[index].appointment_date,
+                            "appointment_time": items[index].appointment_time,
+                            "duration_minutes": items[index].duration_minutes,
+                            "status": "confirmed"
+                        } for index in booked]
+                    ))
+                    claims = [
+                        row for index, db_appointment in zip(booked, created)
+                        for row in booking.claim_rows(slots[index], db_appointment.id)
+                    ]
+                    if claims:
+                        await db.execute(insert(models.SlotClaim), claims)
+                await db.commit()
+                break
+            except IntegrityError as error:
+                await db.rollback()
+                if booking.is_conflict(error):
+                    # Another worker claimed some of the time after the check;
+                    # check again so only the bookings that clash fail
+                    lost_races += 1
+                    if lost_races == booking.BATCH_ATTEMPTS:
+                        raise HTTPException(status_code=409, detail=booking.SLOT_TAKEN)
+                else:
+                    id_clashes += 1
+                    if id_clashes == booking.ID_ATTEMPTS:
+                        raise
+    
+    for db_appointment in created:
+        await calendar_store.book(
+            db_appointment.business_id,
+            db_appointment.appointment_date,
+            db_appointment.appointment_time,
+            db_appointment.duration_minutes
+        )
+    created_by_index = dict(zip(booked, created))
+    results = []
+    for index in range(len(items)):
+        if index in failed:
+            status_code, detail = failed[index]
+            results.append({"index": index, "status_code": status_code, "detail": detail})
+        else:
+            results.append({"index": index, "status_code": 200, "appointment": created_by_index[index]})
+    return {"results": results}
+
 @router.put("/appointments/{appointment_id}/reschedule", response_model=schemas.Appointment, summary="Reschedule appointment")
-def reschedule_appointment(
+async def reschedule_appointment(
     appointment_id: int,
     reschedule_data: schemas.AppointmentReschedule,
     current_customer: models.Customer = Depends(get_current_customer),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Reschedule an existing appointment.
@@ -98,11 +201,12 @@ def reschedule_appointment(
     - **appointment_time**: New time for the appointment
     
     The appointment status will be reset to 'pending' after rescheduling.
+    Returns 409 if the new time overlaps another booking.
     """
-    appointment = db.query(models.Appointment).filter(
+    appointment = await db.scalar(select(models.Appointment).where(
         models.Appointment.id == appointment_id,
         models.Appointment.customer_id == current_customer.id
-    ).first()
+    ))
     
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
@@ -110,77 +214,107 @@ def reschedule_appointment(
     if appointment.status in ['completed', 'cancelled']:
         raise HTTPException(status_code=400, detail="Cannot reschedule completed or cancelled appointment")
     
+    old_date = appointment.appointment_date
     appointment.appointment_date = reschedule_data.appointment_date
     appointment.appointment_time = reschedule_data.appointment_time
     appointment.status = 'pending'
-    db.commit()
-    db.refresh(appointment)
+    await booking.commit_booking(db, appointment)
+    await db.refresh(appointment)
+    await calendar_store.release(appointment.business_id, old_date)
+    await calendar_store.book(
+        appointment.business_id,
+        appointment.appointment_date,
+        appointment.appointment_time,
+        appointment.duration_minutes
+    )
     return appointment
 
 @router.delete("/appointments/{appointment_id}", summary="Cancel appointment")
-def cancel_appointment(
+async def cancel_appointment(
     appointment_id: int,
     current_customer: models.Customer = Depends(get_current_customer),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Cancel an appointment.
     
     Sets the appointment status to 'cancelled'.
     """
-    appointment = db.query(models.Appointment).filter(
+    appointment = await db.scalar(select(models.Appointment).where(
         models.Appointment.id == appointment_id,
         models.Appointment.customer_id == current_customer.id
-    ).first()
+    ))
     
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
     appointment.status = 'cancelled'
-    db.commit()
+    await booking.commit_booking(db, appointment)
+    await calendar_store.release(appointment.business_id, appointment.appointment_date)
     return {"message": "Appointment cancelled successfully"}
 
 @router.put("/profile", response_model=schemas.Customer, summary="Update customer profile")
-def update_customer_profile(
+async def update_customer_profile(
     profile_update: schemas.CustomerUpdate,
     current_customer: models.Customer = Depends(get_current_customer),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Update the current customer's profile information.
     """
+    old_email = current_customer.email
     if profile_update.name is not None:
         current_customer.name = profile_update.name
     if profile_update.email is not None:
         # Check if email already exists
-        existing = db.query(models.Customer).filter(
+        existing = await db.scalar(select(models.Customer).where(
             models.Customer.email == profile_update.email,
             models.Customer.id != current_customer.id
-        ).first()
+        ))
         if existing:
             raise HTTPException(status_code=400, detail="Email already registered")
         current_customer.email = profile_update.email
     if profile_update.phone is not None:
         current_customer.phone = profile_update.phone
     
-    db.commit()
-    db.refresh(current_customer)
+    await db.commit()
+    principal_cache.invalidate("customer", old_email)
+    await db.refresh(current_customer)
     return current_customer
 
 @router.delete("/account", summary="Delete customer account")
-def delete_customer_account(
+async def delete_customer_account(
     current_customer: models.Customer = Depends(get_current_customer),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Delete the current customer's account and all associated data.
     """
-    # Delete all appointments first
-    db.query(models.Appointment).filter(
+    # Remember which calendar days the appointments occupied
+    booked_days = (await db.execute(select(
+        models.Appointment.business_id,
+        models.Appointment.appointment_date
+    ).where(
         models.Appointment.customer_id == current_customer.id
-    ).delete()
+    ).distinct())).all()
+    
+    # Delete all appointments first, after their messages and slot claims (foreign keys are enforced)
+    customer_appointments = select(models.Appointment.id).where(models.Appointment.customer_id == current_customer.id)
+    await db.execute(delete(models.Message).where(models.Message.appointment_id.in_(customer_appointments)))
+    await db.execute(delete(models.SlotClaim).where(models.SlotClaim.appointment_id.in_(customer_appointments)))
+    await db.execute(delete(models.Appointment).where(
+        models.Appointment.customer_id == current_customer.id
+    ))
+    
+    # End every session with the account, so no refresh token outlives it
+    families = await revoke_user_sessions(db, "customer", current_customer.id)
     
     # Delete the customer
-    db.delete(current_customer)
-    db.commit()
+    email = current_customer.email
+    await db.delete(current_customer)
+    await db.commit()
+    reject_sessions(families)
+    principal_cache.invalidate("customer", email)
+    for business_id, appointment_date in booked_days:
+        await calendar_store.release(business_id, appointment_date)
     return {"message": "Account deleted successfully"}
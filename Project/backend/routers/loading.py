@@ -0,0 +1,22 @@
+"""
+Relationship loading strategies shared by the list endpoints.
+
+Every list query declares how its relationships are loaded so serialising a
+page of results never falls back to one lazy load per row.
+"""
+from sqlalchemy.orm import joinedload, raiseload
+
+import models
+
+# schemas.AppointmentDetail nests both sides of the appointment
+APPOINTMENT_DETAIL = (
+    joinedload(models.Appointment.customer),
+    joinedload(models.Appointment.business),
+    raiseload('*'),
+)
+
+# Flat schemas (Appointment, Business, Service, TimeSlot, Message) read only
+# columns; any relationship access is a bug and raises instead of querying
+FLAT = (
+    raiseload('*'),
+)
@@ -1,11 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import get_db
 import schemas
 import models
 from auth import get_current_user
+from routers import loading
+from pagination import PageParams, paginate_async
 
 router = APIRouter(
     prefix="/appointments",
@@ -13,11 +15,11 @@ router = APIRouter(
 )
 
 @router.post("/{appointment_id}/messages", response_model=schemas.Message, summary="Send message")
-def send_message(
+async def send_message(
     appointment_id: int,
     message_data: schemas.MessageCreate,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Send a message in an appointment thread.
@@ -25,7 +27,7 @@ def send_message(
     Both customers and businesses can send messages for appointments they're part of.
     This enables communication before the appointment.
     """
-    appointment = db.query(models.Appointment).filter(models.Appointment.id == appointment_id).first()
+    appointment = await db.get(models.Appointment, appointment_id)
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
@@ -48,23 +50,25 @@ def send_message(
         message=message_data.message
     )
     db.add(db_message)
-    db.commit()
-    db.refresh(db_message)
+    await db.commit()
+    await db.refresh(db_message)
     return db_message
 
-@router.get("/{appointment_id}/messages", response_model=List[schemas.Message], summary="Get appointment messages")
-def get_messages(
+@router.get("/{appointment_id}/messages", response_model=schemas.Page[schemas.Message], summary="Get appointment messages")
+async def get_messages(
     appointment_id: int,
+    page: PageParams = Depends(),
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get all messages for an appointment.
     
-    Returns messages in chronological order.
+    Returns a page of messages in chronological order.
+    Pass `next_cursor` back as `cursor` to fetch the following page.
     Both customers and businesses can view messages for appointments they're part of.
     """
-    appointment = db.query(models.Appointment).filter(models.Appointment.id == appointment_id).first()
+    appointment = await db.get(models.Appointment, appointment_id)
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
@@ -77,7 +81,8 @@ def get_messages(
     else:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    messages = db.query(models.Message).filter(
+    statement = select(models.Message).options(*loading.FLAT).where(
         models.Message.appointment_id == appointment_id
-    ).order_by(models.Message.created_at).all()
-    return messages
+    )
+    messages, next_cursor = await paginate_async(db, statement, [models.Message.created_at, models.Message.id], page)
+    return {"items": messages, "next_cursor": next_cursor}
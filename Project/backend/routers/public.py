@@ -1,8 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List
+from datetime import datetime
 
 from database import get_db
+from replicas import get_public_read_db
+from availability import compute_availability, calendar_store, MAX_RANGE_DAYS, TICK_MINUTES
+from routers import loading
+from pagination import PageParams, paginate
+from conditional import validators
+from cache import response_cache, availability_tag, business_tag, services_tag, timeslots_tag, SEARCH_TAG
+from geo import geo_index, geocode, paginate_nearest, DEFAULT_RADIUS_KM, MAX_RADIUS_KM
+import search
 import schemas
 import models
 
@@ -11,114 +22,195 @@ router = APIRouter(
     tags=["Public"]
 )
 
-@router.get("/businesses", response_model=List[schemas.Business], summary="Search businesses")
-def search_businesses(
+@router.get("/businesses", response_model=schemas.Page[schemas.Business], summary="Search businesses")
+async def search_businesses(
+    request: Request,
+    q: str = None,
     specialty: str = None,
     location: str = None,
-    db: Session = Depends(get_db)
+    lat: float = Query(None, ge=-90, le=90, description="Latitude to search around"),
+    lng: float = Query(None, ge=-180, le=180, description="Longitude to search around"),
+    radius_km: float = Query(DEFAULT_RADIUS_KM, gt=0, le=MAX_RADIUS_KM, description="Search radius for location searches"),
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_public_read_db)
 ):
     """
-    Search for businesses by specialty and/or location.
+    Search for businesses by keyword, specialty and/or location.
     
+    - **q**: Optional free text matched against name, specialty, description and address
     - **specialty**: Optional filter by specialty (e.g., "Hair Salon", "Dental")
-    - **location**: Optional filter by location (searches in address field)
+    - **location**: Optional place ("Dallas, TX", a ZIP code, or an address)
+    - **lat** / **lng**: Optional coordinates, e.g. from the browser's geolocation
+    - **radius_km**: Radius around lat/lng or the location (default 25 km)
     
-    Returns a list of businesses matching the search criteria.
-    If no filters provided, returns all businesses.
+    With coordinates, or a location the offline gazetteer recognises, results
+    are businesses within the radius sorted nearest first, each with
+    `distance_km`. An unrecognised location falls back to matching the address.
+    Every word matches as a prefix ("den" finds "Dental"). Otherwise, with any
+    filter, results are ordered by relevance, and with none they are paged by ID.
+    Pass `next_cursor` back as `cursor` to fetch the following page.
     """
-    query = db.query(models.Business)
+    if (lat is None) != (lng is None):
+        raise HTTPException(status_code=400, detail="lat and lng must be given together")
     
-    if specialty:
-        query = query.filter(models.Business.specialty.ilike(f"%{specialty}%"))
+    key = ("search", q, specialty, location, lat, lng, radius_km, page.cursor, page.limit)
+    async def produce():
+        # The search backends and geo index build ORM queries on a sync Session
+        return await db.run_sync(_search, q, specialty, location, lat, lng, radius_km, page)
     
-    if location:
-        query = query.filter(models.Business.address.ilike(f"%{location}%"))
+    return await response_cache.respond(
+        key,
+        schemas.Page[schemas.Business],
+        produce,
+        tags=[SEARCH_TAG],
+        request=request,
+        validate=lambda result: validators(result["items"], result["next_cursor"])
+    )
+
+def _search(db: Session, q, specialty, location, lat, lng, radius_km, page: PageParams):
+    center = (lat, lng) if lat is not None else geocode(location)
+    
+    query = db.query(models.Business).options(*loading.FLAT)
+    if center is not None:
+        query, _ = search.backend.filter(query, text=q, specialty=specialty)
+        geo_index.ensure_loaded(db)
+        businesses, next_cursor = paginate_nearest(query, geo_index, *center, radius_km, page)
+        return {"items": businesses, "next_cursor": next_cursor}
     
-    businesses = query.all()
-    return businesses
+    query, rank = search.backend.filter(query, text=q, specialty=specialty, location=location)
+    if rank is None:
+        businesses, next_cursor = paginate(query, [models.Business.id], page)
+    else:
+        rows, next_cursor = paginate(
+            query.add_columns(rank),
+            [rank, models.Business.id],
+            page,
+            key=lambda row: (row.search_rank, row.Business.id)
+        )
+        businesses = [row.Business for row in rows]
+    return {"items": businesses, "next_cursor": next_cursor}
+
+async def _get_business_or_404(db: AsyncSession, business_id: int) -> models.Business:
+    business = await db.scalar(select(models.Business).options(*loading.FLAT).where(models.Business.id == business_id))
+    if not business:
+        raise HTTPException(status_code=404, detail="Business not found")
+    return business
 
 @router.get("/businesses/{business_id}", response_model=schemas.Business, summary="Get business details")
-def get_business_detail(business_id: int, db: Session = Depends(get_db)):
+async def get_business_detail(business_id: int, request: Request, db: AsyncSession = Depends(get_public_read_db)):
     """
     Get detailed information about a specific business.
     
     Returns business profile including name, specialty, description, and contact info.
     """
-    business = db.query(models.Business).filter(models.Business.id == business_id).first()
-    if not business:
-        raise HTTPException(status_code=404, detail="Business not found")
-    return business
+    return await response_cache.respond(
+        ("business", business_id),
+        schemas.Business,
+        lambda: _get_business_or_404(db, business_id),
+        tags=[business_tag(business_id)],
+        request=request,
+        validate=lambda business: validators([business])
+    )
 
 @router.get("/businesses/{business_id}/timeslots", response_model=List[schemas.TimeSlot], summary="Get available time slots")
-def get_business_available_slots(business_id: int, db: Session = Depends(get_db)):
+async def get_business_available_slots(business_id: int, request: Request, db: AsyncSession = Depends(get_public_read_db)):
     """
     Get all active time slots for a business.
     
     Returns only active time slots that customers can book.
     This helps customers see the business's availability before booking.
     """
-    business = db.query(models.Business).filter(models.Business.id == business_id).first()
-    if not business:
-        raise HTTPException(status_code=404, detail="Business not found")
+    async def produce():
+        await _get_business_or_404(db, business_id)
+        return (await db.scalars(select(models.TimeSlot).options(*loading.FLAT).where(
+            models.TimeSlot.business_id == business_id,
+            models.TimeSlot.is_active == True
+        ))).all()
     
-    timeslots = db.query(models.TimeSlot).filter(
-        models.TimeSlot.business_id == business_id,
-        models.TimeSlot.is_active == True
-    ).all()
-    return timeslots
+    return await response_cache.respond(
+        ("timeslots", business_id),
+        List[schemas.TimeSlot],
+        produce,
+        tags=[timeslots_tag(business_id)],
+        request=request,
+        validate=validators
+    )
 
-@router.get("/businesses/{business_id}/slots", response_model=List[schemas.TimeSlot], summary="Get available time slots by date")
-def get_business_slots_by_date(business_id: int, date: str = None, db: Session = Depends(get_db)):
+@router.get("/businesses/{business_id}/slots", response_model=List[schemas.DayAvailability], summary="Get available time slots by date")
+async def get_business_slots_by_date(
+    business_id: int,
+    date: str = None,
+    end_date: str = None,
+    duration_minutes: int = Query(None, gt=0),
+    db: AsyncSession = Depends(get_public_read_db)
+):
     """
-    Get available time slots for a business, optionally filtered by date.
+    Get the bookable start times for a business on a date or date range.
     
-    - **date**: Optional date filter in YYYY-MM-DD format
+    - **date**: First date in YYYY-MM-DD format (default: today)
+    - **end_date**: Optional last date in YYYY-MM-DD format (default: same as date)
+    - **duration_minutes**: Optional appointment length; only start times where
+      the whole appointment fits are returned (default: each slot's duration)
     
-    Returns only active time slots that customers can book.
+    Time slot windows are expanded for each requested day and times already
+    taken by non-cancelled appointments are removed.
     """
-    business = db.query(models.Business).filter(models.Business.id == business_id).first()
-    if not business:
-        raise HTTPException(status_code=404, detail="Business not found")
+    try:
+        start = datetime.strptime(date, '%Y-%m-%d').date() if date else datetime.now().date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else start
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    
+    if end < start:
+        raise HTTPException(status_code=400, detail="end_date must not be before date")
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range cannot exceed {MAX_RANGE_DAYS} days")
     
-    timeslots = db.query(models.TimeSlot).filter(
-        models.TimeSlot.business_id == business_id,
-        models.TimeSlot.is_active == True
-    ).all()
+    async def produce():
+        await _get_business_or_404(db, business_id)
+        availability = await db.run_sync(compute_availability, business_id, start, end, duration_minutes)
+        return [{"day": day, "slots": slots} for day, slots in availability.items()]
     
-    # Note: For now returning all slots. In a production app, you would filter by:
-    # 1. The day of week from the date parameter
-    # 2. Check existing appointments to show only truly available slots
-    return timeslots
+    return await response_cache.respond(
+        ("slots", business_id, start, end, duration_minutes),
+        List[schemas.DayAvailability],
+        produce,
+        tags=[availability_tag(business_id)]
+    )
 
 @router.get("/businesses/{business_id}/services", response_model=List[schemas.Service], summary="Get business services")
-def get_business_services_public(business_id: int, db: Session = Depends(get_db)):
+async def get_business_services_public(business_id: int, request: Request, db: AsyncSession = Depends(get_public_read_db)):
     """
     Get all active services offered by a business.
     
     Returns only active services with pricing information.
     Customers can view services before booking an appointment.
     """
-    business = db.query(models.Business).filter(models.Business.id == business_id).first()
-    if not business:
-        raise HTTPException(status_code=404, detail="Business not found")
+    async def produce():
+        await _get_business_or_404(db, business_id)
+        return (await db.scalars(select(models.Service).options(*loading.FLAT).where(
+            models.Service.business_id == business_id,
+            models.Service.is_active == True
+        ))).all()
     
-    services = db.query(models.Service).filter(
-        models.Service.business_id == business_id,
-        models.Service.is_active == True
-    ).all()
-    return services
+    return await response_cache.respond(
+        ("services", business_id),
+        List[schemas.Service],
+        produce,
+        tags=[services_tag(business_id)],
+        request=request,
+        validate=validators
+    )
 
 @router.get("/businesses/{business_id}/booked-slots", summary="Get booked time slots for a date")
-def get_booked_slots(business_id: int, date: str, db: Session = Depends(get_db)):
+async def get_booked_slots(business_id: int, date: str, db: AsyncSession = Depends(get_public_read_db)):
     """
     Get all booked appointment times for a specific business and date.
     
     Returns a list of appointment times that are already booked.
     Frontend can use this to disable those time slots.
     """
-    from datetime import datetime
-    
-    business = db.query(models.Business).filter(models.Business.id == business_id).first()
+    business = await db.get(models.Business, business_id)
     if not business:
         raise HTTPException(status_code=404, detail="Business not found")
     
@@ -128,13 +220,56 @@ def get_booked_slots(business_id: int, date: str, db: Session = Depends(get_db))
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
     
     # Get all appointments for this business and date that are not cancelled
-    appointments = db.query(models.Appointment).filter(
+    appointments = (await db.scalars(select(models.Appointment).where(
         models.Appointment.business_id == business_id,
         models.Appointment.appointment_date == target_date,
         models.Appointment.status != 'cancelled'
-    ).all()
+    ))).all()
     
     # Return list of booked time slots (in HH:MM:SS format)
     booked_times = [apt.appointment_time.strftime('%H:%M:%S') if hasattr(apt.appointment_time, 'strftime') else str(apt.appointment_time) for apt in appointments]
     return {"booked_slots": booked_times}
 
+
+@router.get("/businesses/{business_id}/availability", response_model=schemas.AvailabilityCalendar, summary="Get availability for a range of days")
+async def get_availability_range(
+    business_id: int,
+    start: str = None,
+    days: int = Query(30, ge=1, le=MAX_RANGE_DAYS),
+    duration_minutes: int = Query(None, gt=0),
+    # Loaded days stay in the process-wide calendars until a write changes
+    # them, so they must not come from a lagging replica
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Get bookable start times for many days in one response.
+    
+    - **start**: First date in YYYY-MM-DD format (default: today)
+    - **days**: Number of days to return (default: 30, max: 92)
+    - **duration_minutes**: Optional appointment length (default: each slot's duration)
+    
+    Each entry in `days` is a hex bitmask of 5-minute ticks; bit n set means an
+    appointment can start at n * tick_minutes after midnight. "0" means the day
+    is closed or fully booked.
+    """
+    try:
+        start_date = datetime.strptime(start, '%Y-%m-%d').date() if start else datetime.now().date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    
+    async def produce():
+        if business_id not in calendar_store:
+            await _get_business_or_404(db, business_id)
+        masks = await db.run_sync(calendar_store.free_masks, business_id, start_date, days, duration_minutes)
+        return {
+            "start": start_date,
+            "tick_minutes": TICK_MINUTES,
+            "days": [format(mask, 'x') for mask in masks]
+        }
+    
+    return await response_cache.respond(
+        ("availability", business_id, start_date, days, duration_minutes),
+        schemas.AvailabilityCalendar,
+        produce,
+        tags=[availability_tag(business_id)]
+    )
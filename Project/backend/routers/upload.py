@@ -1,20 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
-import uuid
-from pathlib import Path
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, status
+from fastapi.responses import FileResponse, RedirectResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, Optional
 import mimetypes
 
+import images
+import schemas
+import storage
+import transcoding
+from blobs import blob_store
 from database import get_db
-from models import Business
-from auth import get_current_user
+from models import Business, ImageVariant, StoredFile, TranscodeJob
+from serving import StoredInfo, Transcode, Variant, cache_headers, etag_for, file_cache, last_modified, not_modified
+from auth import get_current_user, get_current_business
+from replicas import get_public_read_db
+from cache import response_cache, profile_tags
+from principals import principal_cache
+from uploads import EXTENSIONS, SNIFF_BYTES, receive_upload, sniff, too_large
 
 router = APIRouter(prefix="/upload", tags=["upload"])
 
-# Create uploads directory if it doesn't exist
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
-
 # Maximum file size: 25 MB
 MAX_FILE_SIZE = 25 * 1024 * 1024  # 25 MB in bytes
 
@@ -27,27 +33,123 @@ ALLOWED_VIDEO_TYPES = {
 }
 ALLOWED_TYPES = ALLOWED_IMAGE_TYPES | ALLOWED_VIDEO_TYPES
 
+# The body is streamed by uploads.receive_upload rather than parsed by
+# FastAPI, so describe the form for the interactive docs here
+FILE_UPLOAD_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
 
-def validate_file(file: UploadFile) -> tuple[bool, str]:
-    """Validate file type and size"""
-    # Check file type
-    content_type = file.content_type
-    if content_type not in ALLOWED_TYPES:
-        return False, f"File type {content_type} not allowed. Allowed types: images (JPEG, PNG, GIF, WebP) and videos (MP4, MPEG, QuickTime, AVI)"
+# Business column for each kind of image
+IMAGE_FIELDS = {"profile": "profile_image", "cover": "cover_image"}
+
+
+async def attach_image(
+    db: AsyncSession,
+    business: Business,
+    kind: str,
+    filename: str,
+    content_type: str,
+    size: int,
+    background_tasks: BackgroundTasks
+) -> Dict[str, str]:
+    """Point the business's ``kind`` image at a stored file"""
+    field = IMAGE_FIELDS[kind]
+    # The old image is collected once nothing references it
+    await storage.acquire(db, filename, content_type, size)
+    await storage.release(db, getattr(business, field))
+    setattr(business, field, filename)
+    is_video = content_type in transcoding.VIDEO_TYPES
+    if is_video:
+        await transcoding.enqueue(db, filename)
+    await db.commit()
+    await response_cache.invalidate(*profile_tags(business.id))
+    principal_cache.invalidate("business", business.email)
     
-    return True, ""
+    # Make the resized variants of an image after the response is sent
+    if content_type in images.IMAGE_TYPES:
+        background_tasks.add_task(images.generate_variants, filename)
+    
+    response = {
+        "message": f"{kind.capitalize()} image uploaded successfully",
+        "filename": filename,
+        "url": f"/upload/files/{filename}"
+    }
+    if is_video:
+        transcoding.transcoder.wake()
+        response["status_url"] = f"/upload/videos/{filename}"
+    return response
 
 
-def get_file_extension(filename: str) -> str:
-    """Get file extension from filename"""
-    return Path(filename).suffix.lower()
+async def stored_info(db: AsyncSession, filename: str) -> Optional[StoredInfo]:
+    """Content type, variants and transcode of a stored file (see serving.py), or None if not stored"""
+    info = file_cache.stored(filename)
+    if info is not None:
+        return info
+    
+    generation = file_cache.generation
+    row = (await db.execute(select(StoredFile.content_type).where(StoredFile.filename == filename))).first()
+    if row is None:
+        return None
+    content_type = row.content_type or mimetypes.guess_type(filename)[0]
+    variants = ()
+    if content_type in images.IMAGE_TYPES:
+        variants = tuple(Variant(*variant) for variant in await db.execute(
+            select(ImageVariant.filename, ImageVariant.content_type, ImageVariant.width)
+            .where(ImageVariant.source == filename)
+        ))
+    transcode = None
+    if content_type in transcoding.VIDEO_TYPES:
+        job = (await db.execute(
+            select(TranscodeJob.status, TranscodeJob.output, TranscodeJob.poster).where(TranscodeJob.source == filename)
+        )).first()
+        transcode = Transcode(*job) if job is not None else None
+    info = StoredInfo(content_type, variants, transcode)
+    file_cache.put_stored(filename, info, generation)
+    return info
+
+
+def blob_response(request: Request, filename: str, media_type: Optional[str], final: bool, vary: bool):
+    """
+    Send a stored file from disk, or redirect to it in object storage.
+    ``final`` and ``vary`` are as for `serving.cache_headers`.
+    """
+    backend = blob_store.backend
+    path = backend.local_path(filename)
+    if path is None:
+        headers = {"Vary": "Accept"} if vary else {}
+        return RedirectResponse(backend.download_url(filename), status_code=status.HTTP_307_TEMPORARY_REDIRECT, headers=headers)
+    
+    stat_result = file_cache.stat(filename, path)
+    if stat_result is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+    headers = cache_headers(filename, etag_for(filename, stat_result), final, vary)
+    modified = last_modified(stat_result)
+    unchanged = not_modified(request, headers, modified)
+    if unchanged:
+        return unchanged
+    return FileResponse(
+        path=path, media_type=media_type, filename=filename, headers=headers, stat_result=stat_result
+    )
 
 
-@router.post("/business/profile-image")
+@router.post("/business/profile-image", openapi_extra=FILE_UPLOAD_BODY)
 async def upload_business_profile_image(
-    file: UploadFile = File(...),
+    request: Request,
+    background_tasks: BackgroundTasks,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Upload profile image for business"""
     if not hasattr(current_user, 'user_type') or current_user.user_type != "business":
@@ -56,58 +158,25 @@ async def upload_business_profile_image(
             detail="Only businesses can upload business profile images"
         )
     
-    # Validate file
-    is_valid, error_msg = validate_file(file)
-    if not is_valid:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error_msg)
-    
-    # Read file content
-    content = await file.read()
-    file_size = len(content)
-    
-    # Check file size
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File too large. Maximum size is 25 MB. Your file is {file_size / (1024*1024):.2f} MB"
-        )
-    
     # current_user is the Business object
     business = current_user
     if not business:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Business not found")
     
-    # Delete old profile image if exists
-    if business.profile_image:
-        old_file_path = UPLOAD_DIR / business.profile_image
-        if old_file_path.exists():
-            old_file_path.unlink()
-    
-    # Generate unique filename
-    file_extension = get_file_extension(file.filename)
-    unique_filename = f"business_{business.id}_profile_{uuid.uuid4()}{file_extension}"
-    file_path = UPLOAD_DIR / unique_filename
-    
-    # Save file
-    with open(file_path, "wb") as f:
-        f.write(content)
+    # Stream the file to disk; too large or of the wrong type is rejected early
+    upload = await receive_upload(request, blob_store.spool_dir, MAX_FILE_SIZE, ALLOWED_TYPES)
+    filename = await storage.store(upload)
     
     # Update business record
-    business.profile_image = unique_filename
-    db.commit()
-    
-    return {
-        "message": "Profile image uploaded successfully",
-        "filename": unique_filename,
-        "url": f"/upload/files/{unique_filename}"
-    }
+    return await attach_image(db, business, "profile", filename, upload.content_type, upload.size, background_tasks)
 
 
-@router.post("/business/cover-image")
+@router.post("/business/cover-image", openapi_extra=FILE_UPLOAD_BODY)
 async def upload_business_cover_image(
-    file: UploadFile = File(...),
+    request: Request,
+    background_tasks: BackgroundTasks,
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Upload cover/backdrop image for business"""
     if not hasattr(current_user, 'user_type') or current_user.user_type != "business":
@@ -116,57 +185,23 @@ async def upload_business_cover_image(
             detail="Only businesses can upload business cover images"
         )
     
-    # Validate file
-    is_valid, error_msg = validate_file(file)
-    if not is_valid:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=error_msg)
-    
-    # Read file content
-    content = await file.read()
-    file_size = len(content)
-    
-    # Check file size
-    if file_size > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File too large. Maximum size is 25 MB. Your file is {file_size / (1024*1024):.2f} MB"
-        )
-    
     # current_user is the Business object
     business = current_user
     if not business:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Business not found")
     
-    # Delete old cover image if exists
-    if business.cover_image:
-        old_file_path = UPLOAD_DIR / business.cover_image
-        if old_file_path.exists():
-            old_file_path.unlink()
-    
-    # Generate unique filename
-    file_extension = get_file_extension(file.filename)
-    unique_filename = f"business_{business.id}_cover_{uuid.uuid4()}{file_extension}"
-    file_path = UPLOAD_DIR / unique_filename
-    
-    # Save file
-    with open(file_path, "wb") as f:
-        f.write(content)
+    # Stream the file to disk; too large or of the wrong type is rejected early
+    upload = await receive_upload(request, blob_store.spool_dir, MAX_FILE_SIZE, ALLOWED_TYPES)
+    filename = await storage.store(upload)
     
     # Update business record
-    business.cover_image = unique_filename
-    db.commit()
-    
-    return {
-        "message": "Cover image uploaded successfully",
-        "filename": unique_filename,
-        "url": f"/upload/files/{unique_filename}"
-    }
+    return await attach_image(db, business, "cover", filename, upload.content_type, upload.size, background_tasks)
 
 
 @router.delete("/business/profile-image")
 async def delete_business_profile_image(
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete profile image for business"""
     if not hasattr(current_user, 'user_type') or current_user.user_type != "business":
@@ -180,13 +215,13 @@ async def delete_business_profile_image(
     if not business:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Business not found")
     
-    # Delete file if exists
+    # Drop the reference; the sweeper deletes the file once nothing references it
     if business.profile_image:
-        file_path = UPLOAD_DIR / business.profile_image
-        if file_path.exists():
-            file_path.unlink()
+        await storage.release(db, business.profile_image)
         business.profile_image = None
-        db.commit()
+        await db.commit()
+        await response_cache.invalidate(*profile_tags(business.id))
+        principal_cache.invalidate("business", business.email)
         return {"message": "Profile image deleted successfully"}
     
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No profile image found")
@@ -195,7 +230,7 @@ async def delete_business_profile_image(
 @router.delete("/business/cover-image")
 async def delete_business_cover_image(
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Delete cover image for business"""
     if not hasattr(current_user, 'user_type') or current_user.user_type != "business":
@@ -209,31 +244,153 @@ async def delete_business_cover_image(
     if not business:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Business not found")
     
-    # Delete file if exists
+    # Drop the reference; the sweeper deletes the file once nothing references it
     if business.cover_image:
-        file_path = UPLOAD_DIR / business.cover_image
-        if file_path.exists():
-            file_path.unlink()
+        await storage.release(db, business.cover_image)
         business.cover_image = None
-        db.commit()
+        await db.commit()
+        await response_cache.invalidate(*profile_tags(business.id))
+        principal_cache.invalidate("business", business.email)
         return {"message": "Cover image deleted successfully"}
     
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No cover image found")
 
 
 @router.get("/files/{filename}")
-async def get_uploaded_file(filename: str):
-    """Get uploaded file"""
-    file_path = UPLOAD_DIR / filename
+async def get_uploaded_file(
+    filename: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=4096, description="Display width in pixels, for images"),
+    poster: bool = Query(False, description="For videos: a still frame instead of the video"),
+    db: AsyncSession = Depends(get_public_read_db)
+):
+    """
+    Get uploaded file.
     
-    if not file_path.exists():
+    Images are served as the best resized variant for the Accept header
+    and `w`, once the variants have been made (see images.py). Videos are
+    served as their web-streamable transcode once it is done, and `poster`
+    then gives a still frame (see transcoding.py). With object
+    storage the response redirects to a short-lived URL of the file.
+    
+    Files are sent with an ETag and answer If-None-Match with 304, and Range
+    requests with 206. Content-named files are cacheable for a year once
+    the response is final (see serving.py).
+    """
+    info = await stored_info(db, filename)
+    if info is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
     
-    # Determine media type
-    media_type, _ = mimetypes.guess_type(str(file_path))
+    if info.content_type in transcoding.VIDEO_TYPES:
+        job = info.transcode
+        if job is not None and job.status == transcoding.DONE:
+            if poster:
+                return blob_response(request, job.poster, "image/jpeg", final=True, vary=False)
+            return blob_response(request, job.output, "video/mp4", final=True, vary=False)
+        if poster:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Poster not available")
+        # Until the transcode is done, the same URL will get a different file later
+        pending = job is not None and job.status != transcoding.FAILED
+        return blob_response(request, filename, info.content_type, final=not pending, vary=False)
     
-    return FileResponse(
-        path=file_path,
-        media_type=media_type,
-        filename=filename
+    if info.content_type not in images.IMAGE_TYPES:
+        return blob_response(request, filename, info.content_type, final=True, vary=False)
+    
+    # Until the variants are made, the same URL will get a smaller file later
+    media_type = info.content_type
+    variant = images.choose(info.variants, w, request.headers.get("accept"))
+    if variant is not None:
+        filename, media_type = variant.filename, variant.content_type
+    
+    return blob_response(request, filename, media_type, final=bool(info.variants), vary=True)
+
+
+@router.get("/videos/{filename}", response_model=schemas.TranscodeStatus)
+async def get_video_status(filename: str, db: AsyncSession = Depends(get_db)):
+    """
+    Get the state of an uploaded video's transcode to a web-streamable MP4:
+    `queued`, `running` (with `progress` from 0 to 1), `done` or `failed`.
+    """
+    job = await db.scalar(select(TranscodeJob).where(TranscodeJob.source == filename))
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No transcode for this file")
+    return schemas.TranscodeStatus(
+        filename=filename,
+        status=job.status,
+        progress=job.progress,
+        attempts=job.attempts,
+        error=job.error,
+        duration=job.duration,
+        url=f"/upload/files/{filename}",
+        poster_url=f"/upload/files/{filename}?poster=true" if job.status == transcoding.DONE else None,
+        created_at=job.created_at,
+        finished_at=job.finished_at
+    )
+
+
+@router.post("/business/direct", response_model=schemas.DirectUpload)
+async def create_direct_upload(
+    direct_upload: schemas.DirectUploadRequest,
+    current_business: Business = Depends(get_current_business)
+):
+    """
+    Get a presigned URL to upload a profile or cover image (or video)
+    straight to object storage, then call `/upload/business/direct/complete`.
+    
+    The URL only accepts a file of the declared type, size and SHA-256.
+    Answers 501 when files are stored on the API servers' disk.
+    """
+    if not blob_store.backend.supports_direct_upload:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Direct uploads need object storage; upload through the API instead"
+        )
+    if direct_upload.size > MAX_FILE_SIZE:
+        raise too_large(MAX_FILE_SIZE)
+    content_type = direct_upload.content_type.lower()
+    if content_type not in ALLOWED_TYPES or content_type not in EXTENSIONS:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"File type {direct_upload.content_type} not allowed"
+        )
+    
+    filename = f"{direct_upload.sha256}{EXTENSIONS[content_type]}"
+    url, headers = blob_store.backend.upload_url(filename, content_type, direct_upload.size, direct_upload.sha256)
+    return schemas.DirectUpload(
+        filename=filename, url=url, headers=headers, expires_in=blob_store.backend.expires_seconds
     )
+
+
+@router.post("/business/direct/complete")
+async def complete_direct_upload(
+    completion: schemas.DirectUploadComplete,
+    background_tasks: BackgroundTasks,
+    current_business: Business = Depends(get_current_business),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Use a file uploaded through `/upload/business/direct` as the business's
+    profile or cover image. The stored file is checked like a file uploaded
+    through the API: size, content type and, unless storage verified it, hash.
+    """
+    filename = completion.filename
+    info = await blob_store.stat(filename)
+    if info is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    # A rejected file has no reference, so the storage sweeper removes it
+    if info.size > MAX_FILE_SIZE:
+        raise too_large(MAX_FILE_SIZE)
+    content_type = sniff(await blob_store.read(filename, SNIFF_BYTES))
+    if content_type not in ALLOWED_TYPES or not filename.endswith(EXTENSIONS[content_type]):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="File content is not an allowed image or video type"
+        )
+    digest = info.sha256 or await blob_store.sha256(filename)
+    if not filename.startswith(digest):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="File content does not match its SHA-256"
+        )
+    
+    return await attach_image(db, current_business, completion.kind, filename, content_type, info.size, background_tasks)
@@ -1,6 +1,13 @@
 from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime, date, time
-from typing import Optional, List
+from typing import Optional, List, Dict, Generic, Literal, TypeVar
+
+T = TypeVar('T')
+
+# Pagination
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None
 
 # Auth Schemas
 class Token(BaseModel):
@@ -8,6 +15,11 @@ class Token(BaseModel):
     token_type: str
     user_type: str
     user_id: int
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     email: Optional[str] = None
@@ -46,6 +58,9 @@ class BusinessBase(BaseModel):
     address: Optional[str] = None
     specialty: Optional[str] = None
     description: Optional[str] = None
+    # Geocoded from address when omitted
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
 
 class BusinessCreate(BusinessBase):
     password: str
@@ -57,8 +72,11 @@ class BusinessLogin(BaseModel):
 class Business(BusinessBase):
     id: int
     created_at: datetime
+    updated_at: Optional[datetime] = None
     profile_image: Optional[str] = None
     cover_image: Optional[str] = None
+    # Only set on results of a location search
+    distance_km: Optional[float] = None
     
     class Config:
         from_attributes = True
@@ -92,10 +110,21 @@ class TimeSlotUpdate(BaseModel):
 class TimeSlot(TimeSlotBase):
     id: int
     business_id: int
+    updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
 
+class DayAvailability(BaseModel):
+    day: date
+    slots: List[time]
+
+class AvailabilityCalendar(BaseModel):
+    start: date
+    tick_minutes: int
+    # One hex bitmask per day; bit n set means a booking can start at n * tick_minutes
+    days: List[str]
+
 # Service Schemas
 class ServiceBase(BaseModel):
     name: str
@@ -118,6 +147,7 @@ class Service(ServiceBase):
     id: int
     business_id: int
     created_at: datetime
+    updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -155,6 +185,27 @@ class AppointmentDetail(Appointment):
     customer: Customer
     business: Business
 
+# Batch Schemas
+MAX_BATCH_ITEMS = 100
+
+class AppointmentStatusChange(AppointmentUpdate):
+    id: int
+
+class AppointmentStatusBatch(BaseModel):
+    updates: List[AppointmentStatusChange] = Field(..., min_length=1, max_length=MAX_BATCH_ITEMS)
+
+class AppointmentCreateBatch(BaseModel):
+    appointments: List[AppointmentCreate] = Field(..., min_length=1, max_length=MAX_BATCH_ITEMS)
+
+class BatchItemResult(BaseModel):
+    index: int  # position of the item in the request
+    status_code: int  # what the single-item endpoint would have answered
+    detail: Optional[str] = None
+    appointment: Optional[Appointment] = None
+
+class BatchResult(BaseModel):
+    results: List[BatchItemResult]
+
 # Message Schemas
 class MessageCreate(BaseModel):
     message: str
@@ -170,6 +221,38 @@ class Message(BaseModel):
     class Config:
         from_attributes = True
 
+# Upload Schemas
+ImageKind = Literal["profile", "cover"]
+
+class DirectUploadRequest(BaseModel):
+    kind: ImageKind
+    content_type: str
+    size: int = Field(..., gt=0)
+    sha256: str = Field(..., pattern="^[0-9a-f]{64}$")  # hex digest of the file
+
+class DirectUpload(BaseModel):
+    filename: str  # content-addressed name to pass to the complete call
+    url: str
+    method: str = "PUT"
+    headers: Dict[str, str]  # must be sent with the request to url
+    expires_in: int
+
+class DirectUploadComplete(BaseModel):
+    kind: ImageKind
+    filename: str = Field(..., pattern="^[0-9a-f]{64}\\.[a-z0-9]+$")
+
+class TranscodeStatus(BaseModel):
+    filename: str  # the uploaded video
+    status: Literal["queued", "running", "done", "failed"]
+    progress: float  # 0 to 1
+    attempts: int
+    error: Optional[str] = None
+    duration: Optional[float] = None  # seconds
+    url: str  # serves the transcoded video once done, the original until then
+    poster_url: Optional[str] = None  # once done
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
 # Search Schema
 class BusinessSearch(BaseModel):
     specialty: Optional[str] = None
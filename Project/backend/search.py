@@ -0,0 +1,185 @@
+"""
+Full-text search over businesses.
+
+SQLite uses an FTS5 external-content table kept in sync with `businesses` by
+triggers. PostgreSQL uses a GIN index over a weighted tsvector expression.
+Any other database, or a SQLite build without FTS5, falls back to substring
+matching. Call `init_search(engine)` once at startup to pick a backend.
+
+All backends accept the same three filters:
+
+- **text**: free text matched against name, specialty, description and address
+- **specialty**: matched against the specialty column only
+- **location**: matched against the address column only
+
+Every word is matched as a prefix, so "den" finds "Dental".
+"""
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Column, Float, Integer, MetaData, Table, func, literal_column, or_
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+import models
+
+SEARCH_COLUMNS = ('business_name', 'specialty', 'description', 'address')
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(value: Optional[str]) -> List[str]:
+    """Split user input into lowercase word tokens"""
+    return _TOKEN_RE.findall(value.lower()) if value else []
+
+
+class LikeSearch:
+    """Substring matching; no index, no ranking"""
+
+    name = "like"
+
+    def init(self, engine: Engine):
+        pass
+
+    def filter(self, query, text: str = None, specialty: str = None, location: str = None):
+        """Return (filtered query, rank expression or None)"""
+        if specialty:
+            query = query.filter(models.Business.specialty.ilike(f"%{specialty}%"))
+        if location:
+            query = query.filter(models.Business.address.ilike(f"%{location}%"))
+        for token in tokenize(text):
+            query = query.filter(or_(*[
+                getattr(models.Business, column).ilike(f"%{token}%") for column in SEARCH_COLUMNS
+            ]))
+        return query, None
+
+
+class SQLiteFTSSearch:
+    """SQLite FTS5 external-content index ranked with bm25"""
+
+    name = "sqlite-fts5"
+
+    # bm25 column weights: a name match counts most, description least
+    WEIGHTS = (10.0, 5.0, 1.0, 2.0)
+
+    fts = Table(
+        'businesses_fts', MetaData(),
+        Column('rowid', Integer),
+        *[Column(column) for column in SEARCH_COLUMNS]
+    )
+
+    def init(self, engine: Engine):
+        columns = ", ".join(SEARCH_COLUMNS)
+        new_values = ", ".join(f"new.{column}" for column in SEARCH_COLUMNS)
+        old_values = ", ".join(f"old.{column}" for column in SEARCH_COLUMNS)
+        with engine.begin() as conn:
+            exists = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'businesses_fts'"
+            ).first()
+            conn.exec_driver_sql(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS businesses_fts USING fts5("
+                f"{columns}, content='businesses', content_rowid='id', tokenize='unicode61')"
+            )
+            conn.exec_driver_sql(f"""
+                CREATE TRIGGER IF NOT EXISTS businesses_fts_ai AFTER INSERT ON businesses BEGIN
+                    INSERT INTO businesses_fts(rowid, {columns}) VALUES (new.id, {new_values});
+                END
+            """)
+            conn.exec_driver_sql(f"""
+                CREATE TRIGGER IF NOT EXISTS businesses_fts_ad AFTER DELETE ON businesses BEGIN
+                    INSERT INTO businesses_fts(businesses_fts, rowid, {columns})
+                    VALUES ('delete', old.id, {old_values});
+                END
+            """)
+            conn.exec_driver_sql(f"""
+                CREATE TRIGGER IF NOT EXISTS businesses_fts_au AFTER UPDATE OF {columns} ON businesses BEGIN
+                    INSERT INTO businesses_fts(businesses_fts, rowid, {columns})
+                    VALUES ('delete', old.id, {old_values});
+                    INSERT INTO businesses_fts(rowid, {columns}) VALUES (new.id, {new_values});
+                END
+            """)
+            if not exists:
+                # Index businesses created before search was enabled
+                conn.exec_driver_sql("INSERT INTO businesses_fts(businesses_fts) VALUES ('rebuild')")
+
+    @staticmethod
+    def _match_terms(tokens: List[str], column: str = None) -> List[str]:
+        prefix = f"{column} : " if column else ""
+        return [f'{prefix}"{token}"*' for token in tokens]
+
+    def filter(self, query, text: str = None, specialty: str = None, location: str = None):
+        terms = (
+            self._match_terms(tokenize(text))
+            + self._match_terms(tokenize(specialty), 'specialty')
+            + self._match_terms(tokenize(location), 'address')
+        )
+        if not terms:
+            return query, None
+
+        query = query.join(self.fts, self.fts.c.rowid == models.Business.id).filter(
+            literal_column('businesses_fts').op('MATCH')(" AND ".join(terms))
+        )
+        rank = func.bm25(literal_column('businesses_fts'), *self.WEIGHTS, type_=Float).label('search_rank')
+        return query, rank
+
+
+class PostgresFTSSearch:
+    """PostgreSQL tsvector search backed by a GIN expression index"""
+
+    name = "postgres-tsvector"
+
+    # Weight labels let one index serve both free-text and per-column filters
+    DOCUMENT = (
+        "setweight(to_tsvector('simple'::regconfig, coalesce(business_name, '')), 'A') || "
+        "setweight(to_tsvector('simple'::regconfig, coalesce(specialty, '')), 'B') || "
+        "setweight(to_tsvector('simple'::regconfig, coalesce(description, '')), 'C') || "
+        "setweight(to_tsvector('simple'::regconfig, coalesce(address, '')), 'D')"
+    )
+
+    def init(self, engine: Engine):
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                f"CREATE INDEX IF NOT EXISTS ix_businesses_search ON businesses USING GIN (({self.DOCUMENT}))"
+            )
+
+    @staticmethod
+    def _query_terms(tokens: List[str], weight: str = "") -> List[str]:
+        return [f"{token}:*{weight}" for token in tokens]
+
+    def filter(self, query, text: str = None, specialty: str = None, location: str = None):
+        terms = (
+            self._query_terms(tokenize(text))
+            + self._query_terms(tokenize(specialty), 'B')
+            + self._query_terms(tokenize(location), 'D')
+        )
+        if not terms:
+            return query, None
+
+        document = literal_column(f"({self.DOCUMENT})")
+        ts_query = func.to_tsquery(literal_column("'simple'::regconfig"), " & ".join(terms))
+        query = query.filter(document.op('@@')(ts_query))
+        # Negated so that ascending order puts the best match first
+        rank = (-func.ts_rank(document, ts_query, type_=Float)).label('search_rank')
+        return query, rank
+
+
+backend = LikeSearch()
+
+
+def init_search(engine: Engine):
+    """Pick and initialise the best search backend for this database"""
+    global backend
+    if engine.dialect.name == "sqlite":
+        candidate = SQLiteFTSSearch()
+    elif engine.dialect.name == "postgresql":
+        candidate = PostgresFTSSearch()
+    else:
+        candidate = LikeSearch()
+
+    try:
+        candidate.init(engine)
+    except OperationalError:
+        # e.g. SQLite compiled without FTS5
+        candidate = LikeSearch()
+    backend = candidate
+    return backend
@@ -0,0 +1,209 @@
+"""
+Fast path for `GET /upload/files/{filename}`.
+
+Serving a file used to cost two queries (the StoredFile row and the image
+variants), a `stat` for `exists()`, a `mimetypes` lookup and another `stat`
+in `FileResponse`. Stored names are content hashes (see storage.py), so
+nearly all of that is the same on every request. `FileCache` keeps it in a
+bounded LRU with a TTL:
+
+- Per stored file: its content type, the variants to choose from and, for
+  a video, the state of its transcode.
+- Per file on local disk: its `os.stat` result, handed to `FileResponse`.
+
+A content-named file never changes, so its ETag is its name. A request
+with a matching If-None-Match gets a 304 without touching the database or
+the disk. Such files are sent with a one-year immutable Cache-Control once
+the response is final. An image whose variants are not made yet is sent
+with `no-cache`, so clients pick up the variants when they appear. Files
+stored before content naming get a stat-based ETag and `no-cache`.
+
+`FileResponse` answers Range and If-Range requests (the video player's
+seeking) and HEAD from the cached stat. It hands unranged bodies to the
+server as `http.response.pathsend` when the server supports it.
+
+Recording variants and collecting files call `invalidate`. The invalidation
+also goes to other workers over the invalidation bus. Configure with
+FILE_CACHE_SIZE and FILE_CACHE_TTL_SECONDS.
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional, Sequence, Tuple
+
+from fastapi import Request, Response
+
+from blobs import IMMUTABLE
+from conditional import CACHE_CONTROL, is_not_modified
+from invalidation import InvalidationBus, bus
+
+DEFAULT_MAX_ENTRIES = int(os.getenv("FILE_CACHE_SIZE", "10000"))
+DEFAULT_TTL_SECONDS = float(os.getenv("FILE_CACHE_TTL_SECONDS", "60"))
+
+# <sha256><ext>, and the files made from such a file: <sha256>_<width>w<ext>, <sha256>_web.mp4, ...
+CONTENT_NAME = re.compile(r"^[0-9a-f]{64}(_[0-9a-z]+)?\.[a-z0-9]+$")
+
+
+class Variant(NamedTuple):
+    filename: str
+    content_type: str
+    width: int
+
+
+class Transcode(NamedTuple):
+    status: str
+    output: Optional[str]
+    poster: Optional[str]
+
+
+class StoredInfo(NamedTuple):
+    content_type: Optional[str]
+    variants: Tuple[Variant, ...]
+    transcode: Optional[Transcode] = None  # videos (see transcoding.py)
+
+
+def is_content_named(filename: str) -> bool:
+    return CONTENT_NAME.match(filename) is not None
+
+
+def etag_for(filename: str, stat_result: Optional[os.stat_result] = None) -> Optional[str]:
+    """Strong ETag of a stored file: its name if content-named, else from its stat"""
+    if is_content_named(filename):
+        return f'"{filename}"'
+    if stat_result is not None:
+        return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+    return None
+
+
+def cache_headers(filename: str, etag: Optional[str], final: bool, vary: bool) -> Dict[str, str]:
+    """
+    Validator and caching headers for serving ``filename``. ``final`` says
+    the same URL will keep getting this file; ``vary`` that the file was
+    chosen by the Accept header.
+    """
+    headers = {"Cache-Control": IMMUTABLE if final and is_content_named(filename) else CACHE_CONTROL}
+    if etag:
+        headers["ETag"] = etag
+    if vary:
+        headers["Vary"] = "Accept"
+    return headers
+
+
+def last_modified(stat_result: os.stat_result) -> str:
+    return formatdate(stat_result.st_mtime, usegmt=True)
+
+
+def not_modified(request: Request, headers: Dict[str, str], modified: Optional[str] = None) -> Optional[Response]:
+    """A 304 with ``headers`` if the client's copy is current, else None"""
+    etag = headers.get("ETag")
+    if etag and is_not_modified(request, etag, modified):
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+class FileCache:
+    """Thread-safe TTL + LRU map of stored file metadata"""
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+        bus: Optional[InvalidationBus] = None
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.bus = bus
+        # (kind, filename, ...) -> (value, expires_at)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if bus is not None:
+            bus.subscribe("files.invalidate", self._invalidate)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def _get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def _put(self, key: Hashable, value: Any, generation: Optional[int]):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (value, self.clock() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stored(self, filename: str) -> Optional[StoredInfo]:
+        """Cached content type and variants of a stored file, or None"""
+        return self._get(("stored", filename))
+
+    def put_stored(self, filename: str, info: StoredInfo, generation: Optional[int] = None):
+        """
+        Remember a stored file read from the database. When ``generation`` is
+        given and an invalidation happened since the read, nothing is stored.
+        """
+        self._put(("stored", filename), info, generation)
+
+    def stat(self, filename: str, path: os.PathLike) -> Optional[os.stat_result]:
+        """`os.stat` of the local file of ``filename``, cached; None if it does not exist"""
+        key = ("stat", filename, os.fspath(path))
+        stat_result = self._get(key)
+        if stat_result is None:
+            generation = self._generation
+            try:
+                stat_result = os.stat(path)
+            except (FileNotFoundError, NotADirectoryError):
+                return None
+            self._put(key, stat_result, generation)
+        return stat_result
+
+    def _invalidate(self, *filenames: str):
+        names = set(filenames)
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._entries if key[1] in names]:
+                del self._entries[key]
+
+    def invalidate(self, filenames: Sequence[str]):
+        """Forget stored files in this and every other worker"""
+        if not filenames:
+            return
+        self._invalidate(*filenames)
+        if self.bus is not None:
+            self.bus.publish("files.invalidate", *filenames)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+file_cache = FileCache(bus=bus)
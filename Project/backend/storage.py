@@ -0,0 +1,211 @@
+"""
+Content-addressed upload storage with reference counts.
+
+An upload is stored as ``<sha256><ext>``, named by the hash `receive_upload`
+computes while streaming:
+
+- Identical uploads share one file on disk and one set of image variants.
+- Writing is idempotent: `store` puts the new temporary file over any
+  existing copy in the blob backend (see blobs.py), whose bytes are the
+  same.
+- A `StoredFile` row counts the business image columns that name the file.
+  `acquire` and `release` change the count in the same transaction as the
+  business row, so the count cannot drift from the references.
+
+Request handlers never delete files. The `Sweeper` thread runs every
+UPLOAD_GC_INTERVAL_SECONDS:
+
+1. It deletes StoredFile rows (and the rows of their image variants and
+   video transcodes) whose count has been zero for UPLOAD_GC_GRACE_SECONDS.
+2. It removes stored files that no row names and that are older than the
+   grace period. This covers the files of step 1, files of requests that
+   failed before their commit, abandoned temporary files and direct uploads
+   that were never completed.
+
+A file re-uploaded while it waits for collection gets a fresh row, or a
+fresh modification time from `store`, so the sweeper leaves it alone.
+
+`init_storage` counts the references of uploads stored before this module
+existed, so the sweeper does not take them for garbage.
+"""
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+from blobs import blob_store
+from serving import file_cache
+from uploads import UploadedFile
+
+logger = logging.getLogger(__name__)
+
+GC_GRACE_SECONDS = int(os.getenv("UPLOAD_GC_GRACE_SECONDS", "3600"))
+GC_INTERVAL_SECONDS = int(os.getenv("UPLOAD_GC_INTERVAL_SECONDS", "600"))
+
+# INSERT ... ON CONFLICT DO UPDATE for the databases that support it
+UPSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def blob_name(upload: UploadedFile) -> str:
+    return f"{upload.digest}{upload.extension}"
+
+
+async def store(upload: UploadedFile) -> str:
+    """Move an upload to its content-addressed name; returns the name"""
+    filename = blob_name(upload)
+    await blob_store.put(upload.temp_path, filename, upload.content_type)
+    return filename
+
+
+async def acquire(db: AsyncSession, filename: str, content_type: Optional[str] = None, size: Optional[int] = None):
+    """Count one more reference to ``filename``; committed with the caller's transaction"""
+    values = {"filename": filename, "content_type": content_type, "size": size, "refcount": 1, "released_at": None}
+    counted = {"refcount": models.StoredFile.refcount + 1, "released_at": None}
+
+    upsert = UPSERTS.get(db.get_bind().dialect.name)
+    if upsert is not None:
+        await db.execute(
+            upsert(models.StoredFile).values(**values)
+            .on_conflict_do_update(index_elements=["filename"], set_=counted)
+        )
+        return
+    result = await db.execute(
+        update(models.StoredFile).where(models.StoredFile.filename == filename).values(**counted)
+    )
+    if result.rowcount == 0:
+        db.add(models.StoredFile(**values))
+
+
+async def release(db: AsyncSession, filename: Optional[str]):
+    """Count one reference less to ``filename``; the sweeper removes it once unreferenced"""
+    if filename:
+        await db.execute(
+            update(models.StoredFile)
+            .where(models.StoredFile.filename == filename)
+            .values(refcount=models.StoredFile.refcount - 1, released_at=datetime.utcnow())
+        )
+
+
+def init_storage(engine: Engine) -> int:
+    """
+    Count references to uploads that have no StoredFile row yet (stored
+    before reference counting). Returns the number of rows added.
+    """
+    with Session(engine) as db:
+        names = db.execute(select(models.Business.profile_image, models.Business.cover_image)).all()
+        references = Counter(name for row in names for name in row if name)
+        if not references:
+            return 0
+        counted = set(db.scalars(select(models.StoredFile.filename)))
+        missing = [name for name in references if name not in counted]
+        db.add_all(models.StoredFile(filename=name, refcount=references[name]) for name in missing)
+        db.commit()
+        return len(missing)
+
+
+class Sweeper:
+    """Background thread that deletes unreferenced uploads after a grace period"""
+
+    def __init__(
+        self,
+        grace_seconds: int = GC_GRACE_SECONDS,
+        interval_seconds: int = GC_INTERVAL_SECONDS,
+        clock: Callable[[], float] = time.time
+    ):
+        self.grace_seconds = grace_seconds
+        self.interval_seconds = interval_seconds
+        self.clock = clock
+        self.engine: Optional[Engine] = None
+        self.backend = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.sweeps = 0
+        self.rows_removed = 0
+        self.files_removed = 0
+        self.last_sweep_ms: Optional[float] = None
+
+    def sweep(self, engine: Engine, backend) -> int:
+        """Run one collection; returns the number of files removed"""
+        started = time.perf_counter()
+        now = self.clock()
+        released_before = datetime.utcfromtimestamp(now) - timedelta(seconds=self.grace_seconds)
+
+        with Session(engine) as db:
+            dead = (models.StoredFile.refcount <= 0, models.StoredFile.released_at < released_before)
+            dead_names = list(db.scalars(select(models.StoredFile.filename).where(*dead)))
+            # Re-checked on delete: a file may have been acquired again since
+            rows = db.execute(delete(models.StoredFile).where(models.StoredFile.filename.in_(dead_names), *dead)).rowcount
+            for made_from in (models.ImageVariant, models.TranscodeJob):
+                db.execute(delete(made_from).where(
+                    made_from.source.notin_(select(models.StoredFile.filename))
+                ))
+            db.commit()
+            known = set(db.scalars(select(models.StoredFile.filename)))
+            known.update(db.scalars(select(models.ImageVariant.filename)))
+            for outputs in db.execute(select(models.TranscodeJob.output, models.TranscodeJob.poster)):
+                known.update(name for name in outputs if name)
+
+        modified_before = now - self.grace_seconds
+        garbage = [
+            name for name, modified in backend.list()
+            if name not in known and modified < modified_before
+        ]
+        backend.delete(garbage)
+        removed = len(garbage)
+        file_cache.invalidate(dead_names + garbage)
+
+        with self._lock:
+            self.sweeps += 1
+            self.rows_removed += rows
+            self.files_removed += removed
+            self.last_sweep_ms = round((time.perf_counter() - started) * 1000, 1)
+        return removed
+
+    def start(self, engine: Engine, backend):
+        """Sweep ``backend`` (see blobs.py) in a daemon thread; an interval of 0 disables it"""
+        self.engine = engine
+        self.backend = backend
+        if self.interval_seconds <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="upload-sweeper", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.sweep(self.engine, self.backend)
+            except Exception:
+                logger.exception("Upload sweep failed")
+
+    def stop(self):
+        self._stop.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "running": self._thread is not None,
+                "grace_seconds": self.grace_seconds,
+                "interval_seconds": self.interval_seconds,
+                "sweeps": self.sweeps,
+                "rows_removed": self.rows_removed,
+                "files_removed": self.files_removed,
+                "last_sweep_ms": self.last_sweep_ms,
+            }
+
+
+sweeper = Sweeper()
@@ -0,0 +1,379 @@
+"""
+Web-streamable copies of uploaded videos.
+
+Business videos are stored as uploaded: MP4, MPEG, QuickTime or AVI, up to
+25 MB, often with the index at the end of the file. Browsers cannot start
+playing such a file before it has fully downloaded, and many cannot play
+AVI or MPEG at all.
+
+Each stored video gets a `TranscodeJob` row (`enqueue`, in the same
+transaction as the upload). `Transcoder` threads in every API worker claim
+queued jobs from the database. Each claimed job runs a local ffmpeg
+(FFMPEG_PATH) in its own process:
+
+- H.264/AAC MP4, at most VIDEO_MAX_WIDTH wide, with the index moved to the
+  front (`+faststart`), so playback starts after the first bytes.
+- A JPEG poster frame taken from the output.
+
+The request that uploads a video only inserts the job row, so its latency
+does not depend on transcode time. VIDEO_WORKERS caps the ffmpeg processes
+per API worker.
+
+While a job runs, ffmpeg reports its position through `-progress`. The
+thread writes it to the row at most once per second; the writes double as
+a heartbeat. A job whose heartbeat stops (its worker died) is claimed again
+after VIDEO_STALL_SECONDS. A failed job is retried up to MAX_ATTEMPTS times.
+
+`GET /upload/videos/{filename}` reports the job. `GET /upload/files/...`
+serves the original until the job is done, then the transcoded copy. Both
+outputs are collected with their source by the storage sweeper.
+"""
+import logging
+import mimetypes
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import and_, or_, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import models
+from serving import file_cache
+from storage import UPSERTS
+
+logger = logging.getLogger(__name__)
+
+FFMPEG = os.getenv("FFMPEG_PATH", "ffmpeg")
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", "1"))
+VIDEO_MAX_WIDTH = int(os.getenv("VIDEO_MAX_WIDTH", "1280"))
+TRANSCODE_TIMEOUT_SECONDS = int(os.getenv("VIDEO_TRANSCODE_TIMEOUT_SECONDS", "1800"))
+STALL_SECONDS = int(os.getenv("VIDEO_STALL_SECONDS", "120"))
+POLL_SECONDS = float(os.getenv("VIDEO_POLL_SECONDS", "5"))
+
+MAX_ATTEMPTS = 3
+
+# Uploaded types that get transcoded
+VIDEO_TYPES = {"video/mp4", "video/mpeg", "video/quicktime", "video/x-msvideo"}
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+# "Duration: 00:01:02.50" in ffmpeg's description of an input
+DURATION = re.compile(r"Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+
+# Seconds between progress writes
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+
+class TranscodeError(Exception):
+    """ffmpeg failed or timed out"""
+
+
+class Transcoded(NamedTuple):
+    output: str  # file name in the output directory
+    poster: str
+    duration: Optional[float]  # seconds
+
+
+def probe_duration(path: Path) -> Optional[float]:
+    """Duration of a media file in seconds, if ffmpeg can tell"""
+    try:
+        # With no output file ffmpeg only describes the input, on stderr
+        result = subprocess.run(
+            [FFMPEG, "-hide_banner", "-nostdin", "-i", str(path)], capture_output=True, text=True, timeout=60
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = DURATION.search(result.stderr)
+    if match is None:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def _run_ffmpeg(args: List[str], log_path: Path, timeout: float, on_line: Callable[[str], None] = lambda line: None):
+    """Run ffmpeg, passing each line of its stdout to ``on_line``; raises TranscodeError"""
+    with open(log_path, "wb") as log:
+        process = subprocess.Popen(
+            [FFMPEG, "-hide_banner", "-nostdin", "-loglevel", "error", "-y", *args],
+            stdout=subprocess.PIPE, stderr=log, text=True
+        )
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            process.kill()
+
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+        try:
+            for line in process.stdout:
+                on_line(line.strip())
+            returncode = process.wait()
+        finally:
+            timer.cancel()
+            process.stdout.close()
+    if timed_out.is_set():
+        raise TranscodeError(f"ffmpeg timed out after {timeout}s")
+    if returncode != 0:
+        detail = log_path.read_text(errors="replace").strip()[-500:]
+        raise TranscodeError(f"ffmpeg exited with {returncode}: {detail}")
+
+
+def transcode(
+    source: Path,
+    output_dir: Path,
+    on_progress: Callable[[Optional[float]], None],
+    timeout: float = TRANSCODE_TIMEOUT_SECONDS
+) -> Transcoded:
+    """
+    Write ``<stem>_web.mp4`` and ``<stem>_poster.jpg`` of the video at
+    ``source`` to ``output_dir``. ``on_progress`` gets the fraction done,
+    or None when ffmpeg reports without a known duration.
+    """
+    duration = probe_duration(source)
+    output = f"{source.stem}_web.mp4"
+    poster = f"{source.stem}_poster.jpg"
+
+    def progress(line: str):
+        # out_time_us is the position written so far, in microseconds
+        key, _, value = line.partition("=")
+        if key == "out_time_us" and duration:
+            try:
+                on_progress(min(1.0, max(0.0, int(value) / 1_000_000 / duration)))
+            except ValueError:
+                pass
+        elif key == "progress":
+            on_progress(None)
+
+    _run_ffmpeg([
+        "-i", str(source),
+        "-map", "0:v:0", "-map", "0:a:0?",
+        "-vf", f"scale='min({VIDEO_MAX_WIDTH},iw)':-2,format=yuv420p",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
+        "-c:a", "aac", "-b:a", "128k", "-ac", "2",
+        "-movflags", "+faststart",
+        "-progress", "pipe:1", "-nostats",
+        str(output_dir / output),
+    ], output_dir / "ffmpeg.log", timeout, progress)
+
+    # A frame one second in, or halfway through shorter clips
+    at = min(1.0, duration / 2) if duration else 0.0
+    _run_ffmpeg([
+        "-ss", f"{at:.3f}", "-i", str(output_dir / output),
+        "-frames:v", "1", "-q:v", "3",
+        str(output_dir / poster),
+    ], output_dir / "ffmpeg.log", timeout)
+    return Transcoded(output, poster, duration)
+
+
+async def enqueue(db: AsyncSession, source: str):
+    """Queue a transcode of the stored video ``source``; committed with the caller's transaction"""
+    upsert = UPSERTS.get(db.get_bind().dialect.name)
+    if upsert is not None:
+        await db.execute(
+            upsert(models.TranscodeJob).values(source=source, status=QUEUED)
+            .on_conflict_do_nothing(index_elements=["source"])
+        )
+    elif await db.scalar(select(models.TranscodeJob.id).where(models.TranscodeJob.source == source)) is None:
+        db.add(models.TranscodeJob(source=source, status=QUEUED))
+
+
+def init_transcoding(engine: Engine) -> int:
+    """
+    Queue transcodes of referenced videos that have no job (uploaded before
+    transcoding). Returns the number of jobs added.
+    """
+    with Session(engine) as db:
+        names = db.scalars(
+            select(models.StoredFile.filename)
+            .where(models.StoredFile.refcount > 0)
+            .where(models.StoredFile.filename.notin_(select(models.TranscodeJob.source)))
+        ).all()
+        videos = [name for name in names if mimetypes.guess_type(name)[0] in VIDEO_TYPES]
+        db.add_all(models.TranscodeJob(source=name, status=QUEUED) for name in videos)
+        db.commit()
+        return len(videos)
+
+
+class Transcoder:
+    """Threads that claim transcode jobs from the database and run them"""
+
+    def __init__(
+        self,
+        workers: int = VIDEO_WORKERS,
+        poll_seconds: float = POLL_SECONDS,
+        stall_seconds: float = STALL_SECONDS,
+        timeout_seconds: float = TRANSCODE_TIMEOUT_SECONDS,
+        run: Callable[..., Transcoded] = transcode
+    ):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.stall_seconds = stall_seconds
+        self.timeout_seconds = timeout_seconds
+        self.run = run
+        self.engine: Optional[Engine] = None
+        self.backend = None
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wake = threading.Condition()
+        self._lock = threading.Lock()
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.average_seconds: Optional[float] = None
+
+    def claim(self, engine: Engine) -> Optional[Tuple[int, str]]:
+        """Mark the oldest queued (or stalled) job running; returns (id, source) or None"""
+        Job = models.TranscodeJob
+        while True:
+            now = datetime.utcnow()
+            claimable = or_(
+                Job.status == QUEUED,
+                and_(Job.status == RUNNING, Job.updated_at < now - timedelta(seconds=self.stall_seconds))
+            )
+            with Session(engine) as db:
+                # A job that stalled on every attempt is given up
+                db.execute(update(Job).where(claimable, Job.status == RUNNING, Job.attempts >= MAX_ATTEMPTS).values(
+                    status=FAILED, error="Transcode stopped responding", finished_at=now
+                ))
+                job = db.execute(select(Job.id, Job.source).where(claimable).order_by(Job.id).limit(1)).first()
+                if job is None:
+                    db.commit()
+                    return None
+                claimed = db.execute(update(Job).where(Job.id == job.id, claimable).values(
+                    status=RUNNING, attempts=Job.attempts + 1, progress=0.0, started_at=now, updated_at=now
+                )).rowcount
+                db.commit()
+            # Another worker claimed it first
+            if claimed:
+                return job.id, job.source
+
+    def process(self, engine: Engine, backend, job_id: int, source: str):
+        """Transcode a claimed job and record the outcome"""
+        Job = models.TranscodeJob
+        started = time.perf_counter()
+        last_write = [0.0]
+
+        def on_progress(fraction: Optional[float]):
+            if time.monotonic() - last_write[0] < PROGRESS_INTERVAL_SECONDS:
+                return
+            last_write[0] = time.monotonic()
+            values = {"updated_at": datetime.utcnow()}
+            if fraction is not None:
+                values["progress"] = fraction
+            with Session(engine) as db:
+                db.execute(update(Job).where(Job.id == job_id, Job.status == RUNNING).values(**values))
+                db.commit()
+
+        output_dir = Path(tempfile.mkdtemp("", ".transcode-", backend.spool_dir))
+        try:
+            with backend.local_copy(source) as path:
+                result = self.run(path, output_dir, on_progress, self.timeout_seconds)
+            backend.put(output_dir / result.output, result.output, "video/mp4")
+            backend.put(output_dir / result.poster, result.poster, "image/jpeg")
+        except Exception as error:
+            logger.exception("Could not transcode %s", source)
+            with Session(engine) as db:
+                attempts = db.scalar(select(Job.attempts).where(Job.id == job_id)) or 0
+                db.execute(update(Job).where(Job.id == job_id).values(
+                    status=FAILED if attempts >= MAX_ATTEMPTS else QUEUED,
+                    error=str(error)[:1000],
+                    finished_at=datetime.utcnow()
+                ))
+                db.commit()
+            file_cache.invalidate([source])
+            with self._lock:
+                self.failed += 1
+            return
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+        # If the source was collected meanwhile, the outputs are left to the storage sweeper
+        with Session(engine) as db:
+            db.execute(update(Job).where(Job.id == job_id).values(
+                status=DONE, progress=1.0, error=None, output=result.output, poster=result.poster,
+                duration=result.duration, finished_at=datetime.utcnow()
+            ))
+            db.commit()
+        file_cache.invalidate([source])
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.completed += 1
+            self.average_seconds = elapsed if self.average_seconds is None else (
+                self.average_seconds + (elapsed - self.average_seconds) * 0.1
+            )
+
+    def run_once(self, engine: Engine, backend) -> bool:
+        """Claim and process one job; returns False when there was none"""
+        job = self.claim(engine)
+        if job is None:
+            return False
+        with self._lock:
+            self.running += 1
+        try:
+            self.process(engine, backend, *job)
+        finally:
+            with self._lock:
+                self.running -= 1
+        return True
+
+    def start(self, engine: Engine, backend):
+        """Run jobs from ``backend`` (see blobs.py) in daemon threads; no ffmpeg or 0 workers disables it"""
+        self.engine = engine
+        self.backend = backend
+        if self.workers <= 0 or self._threads:
+            return
+        if self.run is transcode and shutil.which(FFMPEG) is None:
+            logger.warning("%s not found; uploaded videos are served as uploaded", FFMPEG)
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"transcoder-{number}", daemon=True)
+            for number in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def wake(self):
+        """Look for jobs now rather than at the next poll"""
+        with self._wake:
+            self._wake.notify_all()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.run_once(self.engine, self.backend):
+                    continue
+            except Exception:
+                logger.exception("Transcode worker failed")
+            with self._wake:
+                self._wake.wait(self.poll_seconds)
+
+    def stop(self):
+        self._stop.set()
+        self.wake()
+        threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": len(self._threads),
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "average_ms": None if self.average_seconds is None else round(self.average_seconds * 1000, 1),
+            }
+
+
+transcoder = Transcoder()
@@ -0,0 +1,271 @@
+"""
+Streaming multipart uploads.
+
+`receive_upload` parses the request body straight from the ASGI stream and
+writes the file part to a temporary file in the given directory (the blob
+backend's spool directory, see blobs.py):
+
+- Memory: about WRITE_BUFFER_BYTES of an upload is held at a time, however
+  large the file is.
+- Early rejection: a Content-Length over the limit gets a 413 before the
+  body is read. A body without a length (or a wrong one) gets it as soon as
+  the running total passes the limit.
+- Content sniffing: the type is taken from the file's first bytes, not from
+  the client's Content-Type or file name. The stored extension follows the
+  sniffed type.
+- Off-loop disk I/O: files are opened, written, renamed and deleted in
+  worker threads. The next chunk is read only after the previous write has
+  finished, so a slow disk slows the client down through TCP flow control
+  instead of piling the body up in memory.
+- Atomic publish: the finished file is handed to the blob backend whole, so
+  readers never see a partial file. A failed upload leaves nothing behind.
+- Content hash: the SHA-256 of the file is computed while it is written, so
+  `storage` can name it by content without reading it again.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from fastapi import HTTPException, Request, status
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+
+# Body bytes collected before each write to disk
+WRITE_BUFFER_BYTES = 1024 * 1024
+
+# Allowance for the multipart boundaries and part headers around the file
+MULTIPART_OVERHEAD = 16 * 1024
+
+# Bytes needed to recognise every type in SIGNATURES
+SNIFF_BYTES = 12
+
+# (offset, magic bytes, content type), most specific first
+SIGNATURES = [
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+    (8, b"AVI ", "video/x-msvideo"),
+    (4, b"ftypqt", "video/quicktime"),
+    (4, b"ftyp", "video/mp4"),
+    (0, b"\x00\x00\x01\xba", "video/mpeg"),
+    (0, b"\x00\x00\x01\xb3", "video/mpeg"),
+]
+
+EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/png": ".png",
+    "image/gif": ".gif",
+    "image/webp": ".webp",
+    "video/mp4": ".mp4",
+    "video/mpeg": ".mpeg",
+    "video/quicktime": ".mov",
+    "video/x-msvideo": ".avi",
+}
+
+
+def sniff(head: bytes) -> Optional[str]:
+    """Content type recognised from a file's first bytes, or None"""
+    for offset, magic, content_type in SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            if offset == 8 and not head.startswith(b"RIFF"):
+                continue
+            return content_type
+    return None
+
+
+def too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File too large. Maximum size is {max_bytes / (1024 * 1024):.0f} MB"
+    )
+
+
+class UploadedFile:
+    """A received upload, still in its temporary file"""
+
+    def __init__(self, temp_path: Path, size: int, content_type: str, filename: Optional[str], digest: str):
+        self.temp_path = temp_path
+        self.size = size
+        self.content_type = content_type
+        self.filename = filename
+        self.digest = digest  # SHA-256 of the content, hex
+
+    @property
+    def extension(self) -> str:
+        return EXTENSIONS[self.content_type]
+
+
+class _FilePart:
+    """MultipartParser callbacks that keep only the data of one named field"""
+
+    def __init__(self, field: str):
+        self.field = field
+        self.found = False
+        self.filename: Optional[str] = None
+        self.declared_type: Optional[str] = None
+        self.chunks: List[bytes] = []
+        self.complete = False
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._capturing = False
+
+    def callbacks(self):
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._header_field_data,
+            "on_header_value": self._header_value_data,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        }
+
+    def _part_begin(self):
+        self._headers = {}
+
+    def _header_field_data(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _header_value_data(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        self._capturing = name == self.field and not self.found
+        if self._capturing:
+            self.found = True
+            if b"filename" in options:
+                self.filename = options[b"filename"].decode("utf-8", "replace")
+            if b"content-type" in self._headers:
+                self.declared_type = self._headers[b"content-type"].decode("latin-1").strip().lower()
+
+    def _part_data(self, data: bytes, start: int, end: int):
+        if self._capturing:
+            self.chunks.append(data[start:end])
+
+    def _part_end(self):
+        if self._capturing:
+            self._capturing = False
+            self.complete = True
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def receive_upload(
+    request: Request,
+    directory: Path,
+    max_bytes: int,
+    allowed_types: Set[str],
+    field: str = "file"
+) -> UploadedFile:
+    """
+    Stream the ``field`` file of a multipart request into a temporary file
+    in ``directory``. Raises 413 over ``max_bytes``, 415 for a type outside
+    ``allowed_types`` and 400 / 422 for a malformed or incomplete form.
+    """
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_bytes + MULTIPART_OVERHEAD:
+        raise too_large(max_bytes)
+
+    media_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if media_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a multipart/form-data body")
+
+    part = _FilePart(field)
+    parser = MultipartParser(options[b"boundary"], part.callbacks())
+    handle = None
+    temp_path = None
+    content_type = None
+    head = b""
+    pending: List[bytes] = []
+    pending_size = 0
+    size = 0
+    digest = hashlib.sha256()
+
+    def write(data: bytes):
+        # hashlib releases the GIL on large buffers, like the write itself
+        digest.update(data)
+        handle.write(data)
+
+    async def flush():
+        nonlocal pending_size
+        if pending:
+            await asyncio.to_thread(write, b"".join(pending))
+            pending.clear()
+            pending_size = 0
+
+    def check_type(declared: Optional[str], sniffed: Optional[str]):
+        if declared is not None and declared not in allowed_types:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail=f"File type {declared} not allowed"
+            )
+        if sniffed not in allowed_types:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail="File content is not an allowed image or video type"
+            )
+
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except Exception:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Malformed multipart body")
+            data = part.take()
+            if not data and not (part.complete and handle is None and head):
+                continue
+
+            size += len(data)
+            if size > max_bytes:
+                raise too_large(max_bytes)
+            if handle is None:
+                head += data
+                if len(head) < SNIFF_BYTES and not part.complete:
+                    continue
+                content_type = sniff(head)
+                check_type(part.declared_type, content_type)
+                fd, name = await asyncio.to_thread(tempfile.mkstemp, ".part", ".upload-", directory)
+                temp_path = Path(name)
+                handle = os.fdopen(fd, "wb")
+                data, head = head, b""
+
+            pending.append(data)
+            pending_size += len(data)
+            if pending_size >= WRITE_BUFFER_BYTES:
+                await flush()
+            if part.complete:
+                break
+
+        if not part.found or not part.complete:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"No complete file in the '{field}' form field"
+            )
+        if handle is None:
+            # Empty file
+            check_type(part.declared_type, sniff(head))
+        await flush()
+        await asyncio.to_thread(handle.close)
+        handle = None
+        return UploadedFile(temp_path, size, content_type, part.filename, digest.hexdigest())
+    except BaseException:
+        if handle is not None:
+            await asyncio.to_thread(handle.close)
+        if temp_path is not None:
+            await asyncio.to_thread(temp_path.unlink, True)
+        raise
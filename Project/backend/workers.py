@@ -0,0 +1,126 @@
+"""
+Bounded pools of worker processes for CPU-heavy work.
+
+`WorkerPool` runs a function in a separate process and hands the result back
+to a thread or coroutine, so the GIL and the event loop stay free while it
+runs. It caps the number of calls queued or running. A call over the cap
+fails at once with the pool's `busy_error` (a `PoolBusy`), whose retry_after
+estimates when the backlog will have drained, instead of waiting behind it.
+
+Used by `hashing` (bcrypt) and `images` (resizing and encoding).
+"""
+import asyncio
+import math
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional, Type
+
+
+def _timed(fn: Callable[..., Any], *args):
+    started = time.perf_counter()
+    return fn(*args), time.perf_counter() - started
+
+
+class PoolBusy(Exception):
+    """Raised when too many calls are already queued"""
+
+    subject = "Worker pool"
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"{self.subject} is busy; retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class WorkerPool:
+    """
+    Runs functions in a process pool with a cap on queued calls.
+
+    ``workers=0`` runs them without worker processes, with the same cap.
+    ``average_seconds`` is the initial guess of one call's time, used for
+    retry_after until real calls have been timed.
+    """
+
+    busy_error: Type[PoolBusy] = PoolBusy
+
+    def __init__(self, workers: int, max_pending: int, average_seconds: float = 0.25):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        # Moving average of the time of one call, used for Retry-After
+        self._average_seconds = average_seconds
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # Forking a process that already runs server threads is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def retry_after(self) -> int:
+        """Seconds until the current backlog should have drained"""
+        return max(1, math.ceil(self.pending * self._average_seconds / max(self.workers, 1)))
+
+    def _acquire(self):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise self.busy_error(self.retry_after())
+            self.pending += 1
+
+    def _release(self, elapsed: Optional[float]):
+        with self._lock:
+            self.pending -= 1
+            if elapsed is not None:
+                self.completed += 1
+                self._average_seconds += (elapsed - self._average_seconds) * 0.1
+
+    def run(self, fn: Callable[..., Any], *args) -> Any:
+        """Call ``fn(*args)`` in the pool and wait for the result"""
+        self._acquire()
+        elapsed = None
+        try:
+            if self.workers <= 0:
+                result, elapsed = _timed(fn, *args)
+            else:
+                result, elapsed = self._pool().submit(_timed, fn, *args).result()
+            return result
+        finally:
+            self._release(elapsed)
+
+    async def run_async(self, fn: Callable[..., Any], *args) -> Any:
+        """Call ``fn(*args)`` in the pool without blocking the event loop"""
+        self._acquire()
+        elapsed = None
+        try:
+            if self.workers <= 0:
+                result, elapsed = await asyncio.to_thread(_timed, fn, *args)
+            else:
+                result, elapsed = await asyncio.wrap_future(self._pool().submit(_timed, fn, *args))
+            return result
+        finally:
+            self._release(elapsed)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": self.pending,
+                "max_pending": self.max_pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "average_ms": round(self._average_seconds * 1000, 1),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
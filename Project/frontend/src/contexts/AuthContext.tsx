@@ -1,5 +1,5 @@
 import React, { createContext, useContext, useState, useEffect } from 'react';
-import { customerLogin, businessLogin, getCustomerProfile, getBusinessProfile } from '../lib/api';
+import { customerLogin, businessLogin, getCustomerProfile, getBusinessProfile, logoutSession } from '../lib/api';
 import type { LoginResponse } from '../lib/api';
 import { toast } from 'sonner';
 
@@ -46,6 +46,7 @@ export const AuthProvider: React.FC<{ children: React.ReactNode }> = ({ children
         } catch (error) {
           // Token is invalid, clear everything
           localStorage.removeItem('token');
+          localStorage.removeItem('refreshToken');
           localStorage.removeItem('userType');
           localStorage.removeItem('userId');
           setToken(null);
@@ -71,6 +72,9 @@ export const AuthProvider: React.FC<{ children: React.ReactNode }> = ({ children
       const data: LoginResponse = response.data;
 
       localStorage.setItem('token', data.access_token);
+      if (data.refresh_token) {
+        localStorage.setItem('refreshToken', data.refresh_token);
+      }
       localStorage.setItem('userType', data.user_type);
       localStorage.setItem('userId', data.user_id.toString());
 
@@ -97,7 +101,13 @@ export const AuthProvider: React.FC<{ children: React.ReactNode }> = ({ children
   };
 
   const logout = () => {
+    const refreshToken = localStorage.getItem('refreshToken');
+    if (refreshToken) {
+      // End the session on the server too; signing out locally does not wait for it
+      logoutSession(refreshToken).catch(() => undefined);
+    }
     localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
     localStorage.removeItem('userType');
     localStorage.removeItem('userId');
     setToken(null);
@@ -18,13 +18,49 @@ api.interceptors.request.use((config) => {
   return config;
 });
 
+// One refresh at a time: a refresh token works once, so concurrent 401s share it
+let refreshing: Promise<string> | null = null;
+
+const refreshAccessToken = (): Promise<string> => {
+  if (!refreshing) {
+    const refreshToken = localStorage.getItem('refreshToken');
+    refreshing = (refreshToken
+      ? axios.post<LoginResponse>(`${API_URL}/auth/refresh`, { refresh_token: refreshToken }).then(({ data }) => {
+          localStorage.setItem('token', data.access_token);
+          if (data.refresh_token) {
+            localStorage.setItem('refreshToken', data.refresh_token);
+          }
+          return data.access_token;
+        })
+      : Promise.reject(new Error('No refresh token'))
+    ).finally(() => {
+      refreshing = null;
+    });
+  }
+  return refreshing;
+};
+
 // Add response interceptor to handle 401 errors
 api.interceptors.response.use(
   (response) => response,
-  (error) => {
-    if (error.response?.status === 401) {
+  async (error) => {
+    const original = error.config;
+    const isAuthCall = original?.url?.startsWith('/auth/');
+    if (error.response?.status === 401 && original && !original._retried && !isAuthCall) {
+      // Access token expired - swap the refresh token for a new pair and retry once
+      original._retried = true;
+      try {
+        const token = await refreshAccessToken();
+        original.headers.Authorization = `Bearer ${token}`;
+        return api(original);
+      } catch {
+        // Fall through to signing out
+      }
+    }
+    if (error.response?.status === 401 && !isAuthCall) {
       // Token expired or invalid - clear auth state
       localStorage.removeItem('token');
+      localStorage.removeItem('refreshToken');
       localStorage.removeItem('userType');
       localStorage.removeItem('userId');
       
@@ -38,6 +74,31 @@ api.interceptors.response.use(
   }
 );
 
+// Pagination
+export interface Page<T> {
+  items: T[];
+  next_cursor: string | null;
+}
+
+export interface PageParams {
+  cursor?: string;
+  limit?: number;
+}
+
+// Lazily walk a paginated endpoint: the next page is only requested when the
+// caller asks for it, so the first page can render while later ones load
+export async function* iteratePages<T>(
+  fetchPage: (params: PageParams) => Promise<{ data: Page<T> }>,
+  limit?: number
+): AsyncGenerator<T[]> {
+  let cursor: string | undefined;
+  do {
+    const response = await fetchPage({ cursor, limit });
+    yield response.data.items;
+    cursor = response.data.next_cursor ?? undefined;
+  } while (cursor);
+}
+
 // Types
 export interface Business {
   id: number;
@@ -49,6 +110,9 @@ export interface Business {
   description: string;
   profile_image?: string;
   cover_image?: string;
+  latitude?: number | null;
+  longitude?: number | null;
+  distance_km?: number | null;
   created_at: string;
 }
 
@@ -73,6 +137,17 @@ export interface TimeSlot {
   is_active: boolean;
 }
 
+export interface DayAvailability {
+  day: string;
+  slots: string[];
+}
+
+export interface AvailabilityCalendar {
+  start: string;
+  tick_minutes: number;
+  days: string[];
+}
+
 export interface Appointment {
   id: number;
   appointment_id: string;
@@ -91,6 +166,8 @@ export interface LoginResponse {
   token_type: string;
   user_type: string;
   user_id: number;
+  refresh_token?: string;
+  expires_in?: number;
 }
 
 export interface Customer {
@@ -125,11 +202,20 @@ export const businessRegister = (data: {
 export const businessLogin = (data: { email: string; password: string }) =>
   api.post<LoginResponse>('/auth/business/login', data);
 
+export const logoutSession = (refreshToken: string) =>
+  api.post('/auth/logout', { refresh_token: refreshToken });
+
 // Public APIs
-export const searchBusinesses = (params?: {
+export interface BusinessSearchParams {
+  q?: string;
   specialty?: string;
   location?: string;
-}) => api.get<Business[]>('/public/businesses', { params });
+  lat?: number;
+  lng?: number;
+  radius_km?: number;
+}
+
+export const searchBusinesses = (params?: BusinessSearchParams & PageParams) => api.get<Page<Business>>('/public/businesses', { params });
 
 export const getBusinessById = (id: number) =>
   api.get<Business>(`/public/businesses/${id}`);
@@ -137,8 +223,18 @@ export const getBusinessById = (id: number) =>
 export const getBusinessServices = (businessId: number) =>
   api.get<Service[]>(`/public/businesses/${businessId}/services`);
 
-export const getAvailableTimeSlots = (businessId: number, date: string) =>
-  api.get<TimeSlot[]>(`/public/businesses/${businessId}/slots`, { params: { date } });
+export const getAvailableTimeSlots = (
+  businessId: number,
+  date: string,
+  params?: { end_date?: string; duration_minutes?: number }
+) =>
+  api.get<DayAvailability[]>(`/public/businesses/${businessId}/slots`, { params: { date, ...params } });
+
+export const getAvailabilityCalendar = (
+  businessId: number,
+  params?: { start?: string; days?: number; duration_minutes?: number }
+) =>
+  api.get<AvailabilityCalendar>(`/public/businesses/${businessId}/availability`, { params });
 
 export const getBookedSlots = (businessId: number, date: string) =>
   api.get<{ booked_slots: string[] }>(`/public/businesses/${businessId}/booked-slots`, { params: { date } });
@@ -151,8 +247,8 @@ export const createAppointment = (data: {
   duration_minutes: number;
 }) => api.post<Appointment>('/customer/appointments', data);
 
-export const getCustomerAppointments = () =>
-  api.get<Appointment[]>('/customer/appointments');
+export const getCustomerAppointments = (params?: PageParams) =>
+  api.get<Page<Appointment>>('/customer/appointments', { params });
 
 export const cancelAppointment = (appointmentId: number) =>
   api.delete(`/customer/appointments/${appointmentId}`);
@@ -160,8 +256,14 @@ export const cancelAppointment = (appointmentId: number) =>
 export const getCustomerProfile = () => api.get<Customer>('/customer/me');
 
 // Business APIs
-export const getBusinessAppointments = () =>
-  api.get<Appointment[]>('/business/appointments');
+export const getBusinessAppointments = (params?: { status?: string } & PageParams) =>
+  api.get<Page<Appointment>>('/business/appointments', { params });
+
+export const getOwnServices = (params?: PageParams) =>
+  api.get<Page<Service>>('/business/services', { params });
+
+export const getOwnTimeSlots = (params?: PageParams) =>
+  api.get<Page<TimeSlot>>('/business/timeslots', { params });
 
 export const updateAppointmentStatus = (appointmentId: number, status: string) =>
   api.patch(`/business/appointments/${appointmentId}/status`, { status });
@@ -186,7 +288,7 @@ export const uploadBusinessProfileImage = (file: File) => {
 export const uploadBusinessCoverImage = (file: File) => {
   const formData = new FormData();
   formData.append('file', file);
-  return api.post<{ message: string; filename: string; url: string }>(
+  return api.post<{ message: string; filename: string; url: string; status_url?: string }>(
     '/upload/business/cover-image',
     formData,
     {
@@ -203,7 +305,31 @@ export const deleteBusinessProfileImage = () =>
 export const deleteBusinessCoverImage = () =>
   api.delete('/upload/business/cover-image');
 
-export const getUploadedFileUrl = (filename: string) =>
-  `${API_URL}/upload/files/${filename}`;
+export const getUploadedFileUrl = (filename: string, width?: number) =>
+  `${API_URL}/upload/files/${filename}${width ? `?w=${width}` : ''}`;
+
+// Still frame of an uploaded video, available once its transcode is done
+export const getUploadedVideoPosterUrl = (filename: string) =>
+  `${API_URL}/upload/files/${filename}?poster=true`;
+
+export interface VideoTranscodeStatus {
+  filename: string;
+  status: 'queued' | 'running' | 'done' | 'failed';
+  progress: number;
+  attempts: number;
+  error?: string | null;
+  duration?: number | null;
+  url: string;
+  poster_url?: string | null;
+  created_at: string;
+  finished_at?: string | null;
+}
+
+export const getVideoTranscodeStatus = (filename: string) =>
+  api.get<VideoTranscodeStatus>(`/upload/videos/${filename}`);
+
+// srcSet for <img>: the server answers ?w= with the nearest resized variant
+export const getUploadedFileSrcSet = (filename: string, widths: number[] = [320, 640, 1280]) =>
+  widths.map((width) => `${getUploadedFileUrl(filename, width)} ${width}w`).join(', ');
 
 export default api;
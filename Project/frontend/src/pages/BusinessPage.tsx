@@ -8,9 +8,9 @@ import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '../co
 import { Badge } from '../components/ui/badge';
 import { Separator } from '../components/ui/separator';
 import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle, DialogTrigger } from '../components/ui/dialog';
-import { getBusinessById, getBusinessServices, getAvailableTimeSlots, getBookedSlots, createAppointment } from '../lib/api';
+import { getBusinessById, getBusinessServices, getAvailableTimeSlots, getAvailabilityCalendar, createAppointment } from '../lib/api';
 import { useAuth } from '../contexts/AuthContext';
-import type { Business, Service, TimeSlot } from '../lib/api';
+import type { Business, Service } from '../lib/api';
 import { toast } from 'sonner';
 
 export default function BusinessPage() {
@@ -25,11 +25,13 @@ export default function BusinessPage() {
   const [selectedService, setSelectedService] = useState<number | undefined>();
   const [selectedTimeSlot, setSelectedTimeSlot] = useState<string | undefined>(); // Changed to string
   const [bookingDialogOpen, setBookingDialogOpen] = useState(false);
+  const [unavailableDays, setUnavailableDays] = useState<Set<string>>(new Set());
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
     if (id) {
       loadBusinessData();
+      loadAvailabilityCalendar();
     }
   }, [id]);
 
@@ -55,74 +57,51 @@ export default function BusinessPage() {
     }
   };
 
+  const loadAvailabilityCalendar = async () => {
+    try {
+      // One request covers the next quarter; "0" marks a closed or fully booked day
+      const response = await getAvailabilityCalendar(Number(id), { days: 90 });
+      const [year, month, day] = response.data.start.split('-').map(Number);
+      const closed = new Set<string>();
+      response.data.days.forEach((mask, offset) => {
+        if (mask === '0') {
+          closed.add(format(new Date(year, month - 1, day + offset), 'yyyy-MM-dd'));
+        }
+      });
+      setUnavailableDays(closed);
+    } catch (error) {
+      setUnavailableDays(new Set());
+    }
+  };
+
   const loadTimeSlots = async () => {
     if (!selectedDate) return;
     try {
       const dateStr = format(selectedDate, 'yyyy-MM-dd');
       const response = await getAvailableTimeSlots(Number(id), dateStr);
-      const bookedResponse = await getBookedSlots(Number(id), dateStr);
-      const slots: TimeSlot[] = response.data;
-      const bookedSlots: string[] = bookedResponse.data.booked_slots;
+      const available: string[] = response.data[0]?.slots ?? [];
       
       // Get current time if selected date is today
       const now = new Date();
       const isSelectedDateToday = isToday(selectedDate);
-      const currentHour = now.getHours();
-      const currentMin = now.getMinutes();
+      const currentMinutes = now.getHours() * 60 + now.getMinutes();
       
-      // Generate individual time slots from the time ranges
-      const generatedSlotsSet = new Set<string>();
-      slots.forEach(slot => {
-        const [startHour, startMin] = slot.start_time.split(':').map(Number);
-        const [endHour, endMin] = slot.end_time.split(':').map(Number);
-        const duration = slot.slot_duration_minutes || 30;
+      // The server returns only bookable start times (HH:MM:SS, sorted)
+      const generatedSlots: string[] = [];
+      available.forEach(time24 => {
+        const [slotHour, slotMin] = time24.split(':').map(Number);
         
-        let slotHour = startHour;
-        let slotMin = startMin;
-        
-        while (slotHour < endHour || (slotHour === endHour && slotMin < endMin)) {
-          // Skip past time slots if selected date is today
-          if (isSelectedDateToday) {
-            if (slotHour < currentHour || (slotHour === currentHour && slotMin <= currentMin)) {
-              slotMin += duration;
-              if (slotMin >= 60) {
-                slotHour += Math.floor(slotMin / 60);
-                slotMin = slotMin % 60;
-              }
-              continue;
-            }
-          }
-          
-          // Check if this time slot is already booked
-          const time24 = `${slotHour.toString().padStart(2, '0')}:${slotMin.toString().padStart(2, '0')}:00`;
-          const isBooked = bookedSlots.includes(time24);
-          
-          if (!isBooked) {
-            const hour12 = slotHour % 12 || 12;
-            const ampm = slotHour < 12 ? 'AM' : 'PM';
-            const timeStr = `${hour12}:${slotMin.toString().padStart(2, '0')} ${ampm}`;
-            generatedSlotsSet.add(timeStr);
-          }
-          
-          slotMin += duration;
-          if (slotMin >= 60) {
-            slotHour += Math.floor(slotMin / 60);
-            slotMin = slotMin % 60;
-          }
+        // Skip past time slots if selected date is today
+        if (isSelectedDateToday && slotHour * 60 + slotMin <= currentMinutes) {
+          return;
         }
+        
+        const hour12 = slotHour % 12 || 12;
+        const ampm = slotHour < 12 ? 'AM' : 'PM';
+        generatedSlots.push(`${hour12}:${slotMin.toString().padStart(2, '0')} ${ampm}`);
       });
       
-      setTimeSlots(Array.from(generatedSlotsSet).sort((a, b) => {
-        const parseTime = (timeStr: string) => {
-          const [time, period] = timeStr.split(' ');
-          const [hours, minutes] = time.split(':').map(Number);
-          let hour24 = hours;
-          if (period === 'PM' && hours !== 12) hour24 += 12;
-          if (period === 'AM' && hours === 12) hour24 = 0;
-          return hour24 * 60 + minutes;
-        };
-        return parseTime(a) - parseTime(b);
-      }));
+      setTimeSlots(generatedSlots);
     } catch (error) {
       toast.error('Failed to load available time slots');
     }
@@ -162,6 +141,7 @@ export default function BusinessPage() {
       setSelectedService(undefined);
       setSelectedTimeSlot(undefined);
       loadTimeSlots(); // Refresh available slots
+      loadAvailabilityCalendar();
     } catch (error: any) {
       toast.error(error.response?.data?.detail || 'Failed to book appointment');
     }
@@ -275,7 +255,10 @@ export default function BusinessPage() {
                     mode="single"
                     selected={selectedDate}
                     onSelect={setSelectedDate}
-                    disabled={(date) => date < new Date(new Date().setHours(0, 0, 0, 0))}
+                    disabled={(date) =>
+                      date < new Date(new Date().setHours(0, 0, 0, 0)) ||
+                      unavailableDays.has(format(date, 'yyyy-MM-dd'))
+                    }
                     className="rounded-md border"
                   />
                 </div>
@@ -13,7 +13,9 @@ import api, {
   uploadBusinessCoverImage, 
   deleteBusinessProfileImage, 
   deleteBusinessCoverImage,
-  getUploadedFileUrl 
+  getUploadedFileUrl,
+  getOwnServices,
+  getOwnTimeSlots
 } from '../lib/api';
 import {
   AlertDialog,
@@ -117,8 +119,8 @@ export default function BusinessProfile() {
 
   const fetchServices = async () => {
     try {
-      const response = await api.get('/business/services');
-      setServices(response.data);
+      const response = await getOwnServices({ limit: 200 });
+      setServices(response.data.items);
     } catch (error) {
       toast.error('Failed to fetch services');
     }
@@ -126,8 +128,8 @@ export default function BusinessProfile() {
 
   const fetchTimeSlots = async () => {
     try {
-      const response = await api.get('/business/timeslots');
-      setTimeSlots(response.data);
+      const response = await getOwnTimeSlots({ limit: 200 });
+      setTimeSlots(response.data.items);
     } catch (error) {
       toast.error('Failed to fetch time slots');
     }
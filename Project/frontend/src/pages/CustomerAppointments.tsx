@@ -15,7 +15,7 @@ import {
   DialogTitle,
 } from '../components/ui/dialog';
 import { useAuth } from '../contexts/AuthContext';
-import { getCustomerAppointments, cancelAppointment } from '../lib/api';
+import { iteratePages, getCustomerAppointments, cancelAppointment } from '../lib/api';
 import type { Appointment } from '../lib/api';
 import { format } from 'date-fns';
 import { toast } from 'sonner';
@@ -35,8 +35,12 @@ export default function CustomerAppointments() {
   const loadAppointments = async () => {
     try {
       setLoading(true);
-      const response = await getCustomerAppointments();
-      setAppointments(response.data);
+      let loaded: Appointment[] = [];
+      for await (const items of iteratePages(getCustomerAppointments)) {
+        loaded = [...loaded, ...items];
+        setAppointments(loaded);
+        setLoading(false);
+      }
     } catch (error) {
       toast.error('Failed to load appointments');
     } finally {
@@ -5,7 +5,7 @@ import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '../co
 import { Button } from '../components/ui/button';
 import { Badge } from '../components/ui/badge';
 import { useAuth } from '../contexts/AuthContext';
-import { getCustomerAppointments } from '../lib/api';
+import { iteratePages, getCustomerAppointments } from '../lib/api';
 import type { Appointment } from '../lib/api';
 import { format } from 'date-fns';
 import { toast } from 'sonner';
@@ -23,8 +23,12 @@ export default function CustomerDashboard() {
   const loadAppointments = async () => {
     try {
       setLoading(true);
-      const response = await getCustomerAppointments();
-      setAppointments(response.data);
+      let loaded: Appointment[] = [];
+      for await (const items of iteratePages(getCustomerAppointments)) {
+        loaded = [...loaded, ...items];
+        setAppointments(loaded);
+        setLoading(false);
+      }
     } catch (error) {
       toast.error('Failed to load appointments');
     } finally {
@@ -16,8 +16,8 @@ import {
   DropdownMenuTrigger,
 } from '../components/ui/dropdown-menu';
 import { useAuth } from '../contexts/AuthContext';
-import { searchBusinesses, getUploadedFileUrl } from '../lib/api';
-import type { Business } from '../lib/api';
+import { searchBusinesses, getUploadedFileUrl, getUploadedFileSrcSet } from '../lib/api';
+import type { Business, BusinessSearchParams } from '../lib/api';
 import { toast } from 'sonner';
 
 export default function LandingPage() {
@@ -28,16 +28,20 @@ export default function LandingPage() {
   const [location, setLocation] = useState('');
   const [specialty, setSpecialty] = useState('');
   const [loading, setLoading] = useState(false);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [activeFilters, setActiveFilters] = useState<BusinessSearchParams>();
 
   useEffect(() => {
     loadBusinesses();
   }, []);
 
-  const loadBusinesses = async (filters?: { specialty?: string; location?: string }) => {
+  const loadBusinesses = async (filters?: BusinessSearchParams) => {
     try {
       setLoading(true);
       const response = await searchBusinesses(filters);
-      setBusinesses(response.data);
+      setBusinesses(response.data.items);
+      setNextCursor(response.data.next_cursor);
+      setActiveFilters(filters);
     } catch (error) {
       toast.error('Failed to load businesses');
     } finally {
@@ -45,9 +49,21 @@ export default function LandingPage() {
     }
   };
 
+  const loadMoreBusinesses = async () => {
+    if (!nextCursor) return;
+    try {
+      const response = await searchBusinesses({ ...activeFilters, cursor: nextCursor });
+      setBusinesses(prev => [...prev, ...response.data.items]);
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      toast.error('Failed to load more businesses');
+    }
+  };
+
   const handleSearch = () => {
     loadBusinesses({
-      specialty: specialty === 'all' ? searchQuery : specialty || searchQuery,
+      q: searchQuery || undefined,
+      specialty: specialty && specialty !== 'all' ? specialty : undefined,
       location: location,
     });
   };
@@ -70,10 +86,12 @@ export default function LandingPage() {
             setLocation(locationString);
             toast.success(`Location set to: ${locationString}`);
             
-            // Automatically search with the new location
+            // Automatically search around the exact coordinates
             loadBusinesses({
-              specialty: specialty === 'all' ? searchQuery : specialty || searchQuery,
-              location: locationString,
+              q: searchQuery || undefined,
+              specialty: specialty && specialty !== 'all' ? specialty : undefined,
+              lat: latitude,
+              lng: longitude,
             });
           } catch (err) {
             toast.error('Failed to get location details');
@@ -222,7 +240,7 @@ export default function LandingPage() {
       <section className="w-full px-6 py-16 bg-white">
         <div className="max-w-7xl mx-auto">
           <h3 className="text-3xl font-bold mb-8 text-gray-900">
-            {loading ? 'Loading...' : `${businesses.length} Businesses Available`}
+            {loading ? 'Loading...' : `${businesses.length}${nextCursor ? '+' : ''} Businesses Available`}
           </h3>
           <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6">
             {businesses.map((business) => (
@@ -235,7 +253,10 @@ export default function LandingPage() {
                 <div className="relative h-50 bg-linear-to-br from-blue-100 to-purple-100 overflow-hidden">
                   {business.cover_image ? (
                     <img
-                      src={getUploadedFileUrl(business.cover_image)}
+                      src={getUploadedFileUrl(business.cover_image, 640)}
+                      srcSet={getUploadedFileSrcSet(business.cover_image)}
+                      sizes="(min-width: 1024px) 33vw, (min-width: 768px) 50vw, 100vw"
+                      loading="lazy"
                       alt={business.business_name}
                       className="w-full h-full object-cover"
                     />
@@ -263,6 +284,9 @@ export default function LandingPage() {
                       <CardDescription className="mt-1 flex items-center">
                         <MapPin className="h-3 w-3 mr-1 shrink-0" />
                         <span className="line-clamp-1">{business.address}</span>
+                        {business.distance_km != null && (
+                          <span className="ml-2 shrink-0 text-gray-400">{business.distance_km.toFixed(1)} km</span>
+                        )}
                       </CardDescription>
                     </div>
                   </div>
@@ -290,6 +314,14 @@ export default function LandingPage() {
             ))}
           </div>
 
+          {!loading && nextCursor && (
+            <div className="flex justify-center mt-10">
+              <Button variant="outline" size="lg" onClick={loadMoreBusinesses}>
+                Load more
+              </Button>
+            </div>
+          )}
+
           {!loading && businesses.length === 0 && (
             <div className="text-center py-16">
               <p className="text-gray-500 text-lg">No businesses found. Try adjusting your search.</p>